@@ -1,12 +1,16 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from app.routes.documents import router as documents_router
+from app.routes.admin import router as admin_router
+from app.routes.documents import router as documents_router, extraction_pool, openai_service, db_service
+from app.routes.jobs import router as jobs_router, job_runner, job_service
 
 # Load environment variables
 load_dotenv()
@@ -16,9 +20,26 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(level
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the extraction and job workers before serving, stop them and close all connections on shutdown"""
+    extraction_pool.start()
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    extraction_pool.shutdown()
+    await openai_service.close()
+    db_service.close()
+    job_service.close()
+
+
 # Create FastAPI app
 app = FastAPI(
-    title="PDF Summary AI", description="API for processing PDF documents and generating AI summaries", version="1.0.0"
+    title="PDF Summary AI",
+    description="API for processing PDF documents and generating AI summaries",
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -35,6 +56,8 @@ app.add_middleware(
 
 # Include routes
 app.include_router(documents_router)
+app.include_router(jobs_router)
+app.include_router(admin_router)
 
 
 @app.get("/")
@@ -49,6 +72,12 @@ async def health():
     return {"status": "healthy", "service": "pdf-summary-ai"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics: stage latencies, pages, images, tokens and in-flight requests"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # Global error handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
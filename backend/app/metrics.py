@@ -0,0 +1,89 @@
+"""Prometheus metrics of the upload pipeline, served on /metrics
+
+Extraction runs in worker processes that can't update the metrics of the API process. Stage times taken
+there are collected by collect_stage_timings, returned with the result and recorded by the caller with
+record_stage_timings.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# From quick validations up to summaries of long documents
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    "pdf_summary_stage_duration_seconds",
+    "Time spent in a pipeline stage: validate, extract, extract_text, extract_tables, extract_images, llm, db_save",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_SECONDS = Histogram(
+    "pdf_summary_upload_duration_seconds",
+    "Time to process an uploaded file, by result: processed, cached or failed",
+    ["result"],
+    buckets=LATENCY_BUCKETS,
+)
+PAGES = Counter("pdf_summary_pages", "Pages extracted from uploaded documents")
+IMAGES = Counter("pdf_summary_images", "Document images offered to the model, by outcome: sent or dropped", ["outcome"])
+TOKENS = Counter("pdf_summary_llm_tokens", "Tokens reported by the model, by kind: prompt or completion", ["kind"])
+PROMPT_TEXT_TOKENS = Counter(
+    "pdf_summary_text_tokens",
+    "Estimated tokens of extracted page text, by stage: extracted, or normalized after boilerplate removal",
+    ["stage"],
+)
+LLM_REQUESTS = Counter(
+    "pdf_summary_llm_requests", "Model requests, by result: success, error or cached", ["result"]
+)
+UPLOADS_IN_FLIGHT = Gauge("pdf_summary_uploads_in_flight", "Uploaded files being processed")
+LLM_REQUESTS_IN_FLIGHT = Gauge("pdf_summary_llm_requests_in_flight", "Model requests waiting for a response")
+
+_collector = threading.local()
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time the block as one occurrence of a pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - started)
+
+
+def add_stage_time(stage: str, seconds: float):
+    """Record a stage time, or keep it for the caller while collect_stage_timings runs on this thread"""
+    timings = getattr(_collector, "timings", None)
+    if timings is None:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    else:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def collect_stage_timings(func: Callable[..., Any], *args) -> Tuple[Any, Dict[str, float]]:
+    """Run func and return its result with the stage times it took, instead of recording them"""
+    _collector.timings = {}
+    try:
+        return func(*args), _collector.timings
+    finally:
+        _collector.timings = None
+
+
+def record_stage_timings(timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def track_upload() -> Iterator[Dict[str, str]]:
+    """Count the upload as in flight and time it, the block sets "result" to processed or cached on success"""
+    upload = {"result": "failed"}
+    started = time.perf_counter()
+    with UPLOADS_IN_FLIGHT.track_inprogress():
+        try:
+            yield upload
+        finally:
+            UPLOAD_SECONDS.labels(upload["result"]).observe(time.perf_counter() - started)
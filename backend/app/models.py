@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -17,6 +17,7 @@ class DocumentSummary(BaseModel):
     upload_date: datetime = Field(default_factory=datetime.now)
     file_size: int
     page_count: int
+    content_hash: Optional[str] = None
 
 
 class DocumentHistory(BaseModel):
@@ -26,6 +27,43 @@ class DocumentHistory(BaseModel):
     upload_date: datetime
     file_size: int
     page_count: int
+    content_hash: Optional[str] = None
+
+
+class DocumentPreview(BaseModel):
+    id: str
+    filename: str
+    preview: str
+    upload_date: datetime
+    file_size: int
+    page_count: int
+
+
+class SearchResult(BaseModel):
+    id: str
+    filename: str
+    snippet: str
+    upload_date: datetime
+    file_size: int
+    page_count: int
+    score: float
+
+
+class ResummarizeRequest(BaseModel):
+    document_ids: List[str] = Field(..., min_length=1, max_length=100)
+
+
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    status: str = "queued"
+    stage: Optional[str] = None
+    force_refresh: bool = False
+    image_detail: str = "auto"
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
 
 
 class APIResponse(BaseModel):
@@ -0,0 +1,41 @@
+import logging
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.models import APIResponse
+from app.routes.documents import profiler_service
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+def _require_profiling():
+    if not profiler_service.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """List the saved upload profiles, newest first"""
+    _require_profiling()
+    try:
+        profiles = await run_in_threadpool(profiler_service.list_profiles)
+
+        return APIResponse(success=True, message=f"Found {len(profiles)} profiles", data={"profiles": profiles})
+
+    except Exception as e:
+        logger.error(f"Error listing profiles: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error listing profiles")
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """Download a saved profile as a pstats file"""
+    _require_profiling()
+    path = profiler_service.get_profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
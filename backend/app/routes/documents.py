@@ -1,9 +1,27 @@
+import json
 import logging
+import zipfile
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Tuple
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
-from app.models import DocumentSummary, APIResponse
-from app.services import PDFService, OpenAIService, DatabaseService
+from app.models import APIResponse, ResummarizeRequest
+from app.services import (
+    PDFService,
+    OpenAIService,
+    DatabaseService,
+    ExtractionPool,
+    DocumentProcessor,
+    DocumentProcessingError,
+    ProfilerService,
+    SpooledUpload,
+    UploadRejected,
+    UploadSpooler,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/documents", tags=["documents"])
@@ -12,76 +30,194 @@ router = APIRouter(prefix="/api/documents", tags=["documents"])
 pdf_service = PDFService()
 openai_service = OpenAIService()
 db_service = DatabaseService()
+extraction_pool = ExtractionPool()
+document_processor = DocumentProcessor(pdf_service, openai_service, db_service, extraction_pool)
+profiler_service = ProfilerService()
+upload_spooler = UploadSpooler(pdf_service.MAX_FILE_SIZE)
 
+# The single file upload routes read the request body themselves, so the form is described here for the docs
+PDF_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-@router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+
+@router.post("/upload", openapi_extra=PDF_UPLOAD_BODY)
+async def upload_pdf(
+    request: Request,
+    response: Response,
+    force_refresh: bool = Query(False, description="Skip the summary cache and generate a fresh summary"),
+    detail: str = Query("auto", pattern="^(low|high|auto)$", description="Image detail level for the vision model"),
+    x_profile: bool = Header(False, description="Profile this upload, when PROFILING_ENABLED is set"),
+):
     """Upload and process a PDF file"""
+    upload = None
     try:
-        # Read file content
-        file_content = await file.read()
+        # Stream the file to disk, oversized and non-PDF files are rejected as soon as that shows
+        upload = await upload_spooler.receive(request)
 
-        logger.info(f"Received file: {file.filename}, size: {len(file_content)} bytes")
+        logger.info(f"Received file: {upload.filename}, size: {len(upload)} bytes")
 
-        # Validate the PDF
-        is_valid, validation_message = pdf_service.validate_pdf(file_content, file.filename)
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=validation_message)
+        if x_profile and profiler_service.enabled:
+            data = await _process_profiled(
+                response, upload, upload.filename, force_refresh=force_refresh, image_detail=detail
+            )
+        else:
+            data = await document_processor.process(
+                upload, upload.filename, force_refresh=force_refresh, image_detail=detail
+            )
 
-        # Extract text from the PDF
-        logger.info("Extracting text from PDF...")
-        extracted_data = pdf_service.extract_pdf_content(file_content)
+        return APIResponse(success=True, message="Document processed successfully", data=data)
 
-        if not extracted_data["text"].strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to extract text from the PDF file.",
-            )
+    except (UploadRejected, DocumentProcessingError) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Error processing file {upload.filename if upload else ''}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error processing file")
+    finally:
+        if upload is not None:
+            upload.close()
 
-        # Generate summary using OpenAI
-        logger.info("Generating summary with OpenAI...")
 
-        summary = openai_service.generate_summary(extracted_data["text"], extracted_data["images"])
+async def _process_profiled(response: Response, file_content: SpooledUpload, filename: str, **options) -> dict:
+    """Process an upload under the profiler and save the profile, named in the X-Profile-Id header"""
+    session = None
+    data = None
+    try:
+        async with profiler_service.profile() as session:
+            data = await document_processor.process(file_content, filename, **options)
+    finally:
+        if session is not None:
+            name = await profiler_service.save(session, data["id"] if data else None)
+            if name:
+                response.headers["X-Profile-Id"] = name
+    return data
 
-        # Create document object
-        document = DocumentSummary(
-            filename=file.filename,
-            summary=summary,
-            file_size=len(file_content),
-            page_count=extracted_data["page_count"],
-        )
 
-        # Save to the database
-        if not db_service.save_document_summary(document):
-            logger.warning("Failed to save to the database, but returning result anyway")
+@router.post("/upload/stream", openapi_extra=PDF_UPLOAD_BODY)
+async def upload_pdf_stream(
+    request: Request,
+    force_refresh: bool = Query(False, description="Skip the summary cache and generate a fresh summary"),
+    detail: str = Query("auto", pattern="^(low|high|auto)$", description="Image detail level for the vision model"),
+):
+    """Upload a PDF and stream the pipeline stages and summary text as Server-Sent Events"""
+    # The body has to be read before the response starts, rejections are sent as the error event
+    upload = None
+    rejection = None
+    try:
+        upload = await upload_spooler.receive(request)
+        filename = upload.filename
+        logger.info(f"Received file for streaming: {filename}, size: {len(upload)} bytes")
+    except UploadRejected as e:
+        filename = None
+        rejection = e
 
-        logger.info(f"Document {file.filename} processed successfully")
+    async def events():
+        try:
+            if rejection:
+                raise rejection
+            async for event, data in document_processor.process_stream(
+                upload, filename, force_refresh=force_refresh, image_detail=detail
+            ):
+                yield _sse_event(event, data)
+        except (UploadRejected, DocumentProcessingError) as e:
+            yield _sse_event("error", {"status_code": e.status_code, "message": e.message})
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {str(e)}")
+            yield _sse_event("error", {"status_code": 500, "message": "Error processing file"})
+
+    # Disable proxy buffering so every event reaches the client immediately
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(upload.close) if upload else None,
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(..., description="PDF files or ZIP archives of PDF files"),
+    force_refresh: bool = Query(False, description="Skip the summary cache and generate fresh summaries"),
+    detail: str = Query("auto", pattern="^(low|high|auto)$", description="Image detail level for the vision model"),
+):
+    """Upload many PDF files at once and process them as a pipeline, with a result per file"""
+    try:
+        logger.info(f"Received batch of {len(files)} uploads")
+
+        data = await document_processor.process_batch(
+            _batch_sources(files), force_refresh=force_refresh, image_detail=detail
+        )
 
+        stats = data["stats"]
         return APIResponse(
-            success=True,
-            message="Document processed successfully",
-            data={
-                "id": document.id,
-                "filename": document.filename,
-                "summary": document.summary,
-                "upload_date": document.upload_date.isoformat(),
-                "file_size": document.file_size,
-                "page_count": document.page_count,
-            },
+            success=not stats["failed"],
+            message=f"Processed {stats['files']} files, {stats['failed']} failed",
+            data=data,
         )
 
-    except HTTPException as e:
-        raise e
     except Exception as e:
-        logger.error(f"Error processing file {file.filename}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error processing file")
+        logger.error(f"Error processing batch: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error processing batch")
+
+
+def _batch_sources(files: List[UploadFile]) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """Yield the filename and a loader of every uploaded PDF, including the PDFs inside ZIP archives
+
+    Archive members are read from the spooled upload only when the pipeline takes them.
+    """
+    too_large = f"The file is too large. Maximum size: {pdf_service.MAX_FILE_SIZE // (1024*1024)}MB"
+    for upload in files:
+        if not upload.filename.lower().endswith(".zip"):
+            # Reject oversized parts from their spooled size, before reading them into memory
+            if upload.size is not None and upload.size > pdf_service.MAX_FILE_SIZE:
+                yield upload.filename, partial(_reject, too_large)
+            else:
+                yield upload.filename, upload.file.read
+            continue
+
+        try:
+            archive = zipfile.ZipFile(upload.file)
+        except zipfile.BadZipFile:
+            yield upload.filename, partial(_reject, "Invalid ZIP archive")
+            continue
+
+        for member in archive.infolist():
+            if member.is_dir() or member.filename.startswith("__MACOSX/") or not member.filename.lower().endswith(".pdf"):
+                continue
+            # Reject oversized members from the archive directory, before decompressing them
+            if member.file_size > pdf_service.MAX_FILE_SIZE:
+                yield member.filename, partial(_reject, too_large)
+            else:
+                yield member.filename, partial(archive.read, member)
+
+
+def _reject(message: str) -> bytes:
+    raise DocumentProcessingError(400, message)
 
 
 @router.get("/history")
-async def get_history():
-    """Retrieve the history of the last 5 documents"""
+async def get_history(
+    limit: int = Query(5, ge=1, le=100, description="Number of documents per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
+    """Retrieve a page of the document history, newest first"""
     try:
-        documents = db_service.get_last_5_documents()
+        documents, next_cursor = await run_in_threadpool(db_service.get_history, limit, cursor)
 
         return APIResponse(
             success=True,
@@ -91,26 +227,118 @@ async def get_history():
                     {
                         "id": doc.id,
                         "filename": doc.filename,
-                        "summary": doc.summary[:200] + "..." if len(doc.summary) > 200 else doc.summary,
+                        "summary": doc.preview,
                         "upload_date": doc.upload_date.isoformat(),
                         "file_size": doc.file_size,
                         "page_count": doc.page_count,
                     }
                     for doc in documents
-                ]
+                ],
+                "next_cursor": next_cursor,
             },
         )
 
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         logger.error(f"Error retrieving document history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving history")
 
 
+@router.get("/search")
+async def search_documents(
+    q: str = Query(..., min_length=1, max_length=500, description="Words to find in filenames and summaries"),
+    limit: int = Query(10, ge=1, le=100, description="Number of results per page"),
+    offset: int = Query(0, ge=0, le=10000, description="Number of results to skip"),
+):
+    """Full-text search over document summaries, best matches first"""
+    try:
+        results, has_more = await run_in_threadpool(db_service.search_documents, q, limit, offset)
+
+        return APIResponse(
+            success=True,
+            message=f"Found {len(results)} documents",
+            data={
+                "results": [
+                    {
+                        "id": result.id,
+                        "filename": result.filename,
+                        "snippet": result.snippet,
+                        "upload_date": result.upload_date.isoformat(),
+                        "file_size": result.file_size,
+                        "page_count": result.page_count,
+                        "score": result.score,
+                    }
+                    for result in results
+                ],
+                "next_offset": offset + len(results) if has_more else None,
+            },
+        )
+
+    except Exception as e:
+        logger.error(f"Error searching documents: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error searching documents")
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Retrieve summary cache hit/miss counters"""
+    cache_stats = document_processor.cache_stats
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    return APIResponse(
+        success=True,
+        message="Cache statistics",
+        data={**cache_stats, "hit_rate": cache_stats["hits"] / lookups if lookups else 0.0},
+    )
+
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """Retrieve OpenAI request payload counters and response cache statistics"""
+    return APIResponse(
+        success=True,
+        message="LLM request statistics",
+        data={**openai_service.stats, "response_cache": openai_service.response_cache.get_stats()},
+    )
+
+
+@router.post("/resummarize")
+async def resummarize_documents(request: ResummarizeRequest):
+    """Summarize several stored documents again from their extracted pages"""
+    try:
+        data = await document_processor.resummarize_many(request.document_ids)
+
+        return APIResponse(
+            success=not data["errors"],
+            message=f"Summarized {len(data['documents'])} documents, {len(data['errors'])} failed",
+            data=data,
+        )
+
+    except Exception as e:
+        logger.error(f"Error summarizing documents again: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error processing documents")
+
+
+@router.post("/{doc_id}/resummarize")
+async def resummarize_document(doc_id: str):
+    """Summarize a stored document again from its extracted pages, without the PDF"""
+    try:
+        data = await document_processor.resummarize(doc_id)
+
+        return APIResponse(success=True, message="Document summarized again", data=data)
+
+    except DocumentProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Error summarizing document {doc_id} again: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error processing document")
+
+
 @router.get("/{doc_id}")
 async def get_document(doc_id: str):
     """Retrieve the full document by ID"""
     try:
-        document = db_service.get_document_by_id(doc_id)
+        document = await run_in_threadpool(db_service.get_document_by_id, doc_id)
 
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -0,0 +1,87 @@
+import logging
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+
+from app.models import APIResponse
+from app.routes.documents import PDF_UPLOAD_BODY, document_processor, upload_spooler
+from app.services import JobService, JobRunner, UploadRejected
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+# Initialize services
+job_service = JobService()
+job_runner = JobRunner(job_service, document_processor)
+
+
+@router.post("", status_code=202, openapi_extra=PDF_UPLOAD_BODY)
+async def submit_job(
+    request: Request,
+    force_refresh: bool = Query(False, description="Skip the summary cache and generate a fresh summary"),
+    detail: str = Query("auto", pattern="^(low|high|auto)$", description="Image detail level for the vision model"),
+):
+    """Queue a PDF file for background processing"""
+    upload = None
+    try:
+        # Received and checked like the synchronous upload, the queue keeps the spooled file
+        upload = await upload_spooler.receive(request)
+
+        logger.info(f"Received job file: {upload.filename}, size: {len(upload)} bytes")
+
+        job = await run_in_threadpool(
+            job_service.create_job, upload.filename, upload, force_refresh=force_refresh, image_detail=detail
+        )
+        if not job:
+            raise HTTPException(status_code=500, detail="Error queuing file")
+
+        job_runner.notify()
+
+        return APIResponse(
+            success=True,
+            message="Job queued",
+            data={"job_id": job.id, "status": job.status},
+        )
+
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error queuing file {upload.filename if upload else ''}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error queuing file")
+    finally:
+        # Only left behind when the job wasn't queued
+        if upload is not None:
+            upload.close()
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Retrieve the status and result of a job"""
+    try:
+        job = await run_in_threadpool(job_service.get_job, job_id)
+
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        return APIResponse(
+            success=True,
+            message=f"Job {job.status}",
+            data={
+                "job_id": job.id,
+                "filename": job.filename,
+                "status": job.status,
+                "stage": job.stage,
+                "result": job.result,
+                "error": job.error,
+                "created_at": job.created_at.isoformat(),
+                "updated_at": job.updated_at.isoformat(),
+            },
+        )
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error retrieving job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving job")
@@ -1,5 +1,26 @@
 from .database_service import DatabaseService
+from .extraction_pool import ExtractionPool
+from .llm_cache import LLMResponseCache
 from .openai_service import OpenAIService
 from .pdf_service import PDFService
+from .document_processor import DocumentProcessor, DocumentProcessingError
+from .job_service import JobService
+from .job_runner import JobRunner
+from .profiler_service import ProfilerService
+from .upload_spool import SpooledUpload, UploadRejected, UploadSpooler
 
-__all__ = ["PDFService", "OpenAIService", "DatabaseService"]
+__all__ = [
+    "PDFService",
+    "OpenAIService",
+    "DatabaseService",
+    "ExtractionPool",
+    "DocumentProcessor",
+    "DocumentProcessingError",
+    "JobService",
+    "JobRunner",
+    "LLMResponseCache",
+    "ProfilerService",
+    "SpooledUpload",
+    "UploadRejected",
+    "UploadSpooler",
+]
@@ -1,27 +1,39 @@
+import base64
+import html
+import json
 import logging
 import os
-import sqlite3
+import zlib
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from app.models import DocumentSummary, DocumentHistory
+from app.metrics import stage_timer
+from app.models import DocumentSummary, DocumentHistory, DocumentPreview, SearchResult
+from app.services.sqlite_connections import SQLiteConnections
 
 logger = logging.getLogger(__name__)
 
 
 class DatabaseService:
+    PREVIEW_LENGTH = 200  # characters of the summary shown in the history list
+    HIGHLIGHT_MARKERS = ("<mark>", "</mark>")  # wrap the matched words in search snippets
+    # Unprintable stand-ins for the markers, so the snippet text can be HTML-escaped before they are added
+    SNIPPET_SENTINELS = ("\x02", "\x03")
+    SNIPPET_TOKENS = 24  # words around the matches in search snippets
+
     def __init__(self):
         self.db_path = os.getenv("DATABASE_PATH")
         if not self.db_path:
             raise ValueError("DATABASE_PATH environment variable is required")
         # Create the folder if it doesn't exist
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connections = SQLiteConnections(self.db_path)
         self._init_db()
 
     def _init_db(self):
         """Initialize the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -31,81 +43,333 @@ class DatabaseService:
                         summary TEXT NOT NULL,
                         upload_date TEXT NOT NULL,
                         file_size INTEGER NOT NULL,
-                        page_count INTEGER NOT NULL
+                        page_count INTEGER NOT NULL,
+                        content_hash TEXT,
+                        preview TEXT
                     )
                 """
                 )
+                # Databases created before content hashing and previews were added lack the columns
+                columns = [row[1] for row in cursor.execute("PRAGMA table_info(documents)")]
+                if "content_hash" not in columns:
+                    cursor.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+                if "preview" not in columns:
+                    cursor.execute("ALTER TABLE documents ADD COLUMN preview TEXT")
+                    cursor.execute(
+                        """
+                        UPDATE documents
+                        SET preview = CASE WHEN length(summary) > ? THEN substr(summary, 1, ?) || '...' ELSE summary END
+                    """,
+                        (self.PREVIEW_LENGTH, self.PREVIEW_LENGTH),
+                    )
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)")
+                # Serves the history pages straight from the index, newest first with the id as tie-breaker
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents (upload_date DESC, id DESC)"
+                )
+                # Extracted pages, kept compressed so documents can be summarized again without parsing the PDF
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS document_pages (
+                        document_id TEXT NOT NULL,
+                        page_num INTEGER NOT NULL,
+                        data BLOB NOT NULL,
+                        PRIMARY KEY (document_id, page_num)
+                    )
+                """
+                )
+                self._init_search_index(cursor)
                 conn.commit()
                 logger.info("Database initialized")
         except Exception as e:
             logger.error(f"Database initialization error: {str(e)}")
             raise
 
-    def save_document_summary(self, document: DocumentSummary) -> bool:
-        """Save document summary to the database"""
+    @staticmethod
+    def _init_search_index(cursor):
+        """Create the full-text index over filenames and summaries, kept in sync with documents by triggers"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+        ).fetchone()
+        # External content table: the index refers to documents rows by rowid instead of storing a second copy
+        cursor.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                filename, summary, content='documents', content_rowid='rowid', tokenize='porter unicode61'
+            )
+        """
+        )
+        cursor.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, filename, summary) VALUES (new.rowid, new.filename, new.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, filename, summary)
+                VALUES ('delete', old.rowid, old.filename, old.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF filename, summary ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, filename, summary)
+                VALUES ('delete', old.rowid, old.filename, old.summary);
+                INSERT INTO documents_fts (rowid, filename, summary) VALUES (new.rowid, new.filename, new.summary);
+            END;
+        """
+        )
+        if not exists:
+            # Index the documents saved before full-text search was added in one pass
+            cursor.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+            logger.info("Full-text search index built")
+
+    def rebuild_search_index(self) -> bool:
+        """Rebuild the full-text index from the documents table"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect() as conn:
+                conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+                conn.commit()
+                logger.info("Full-text search index rebuilt")
+                return True
+        except Exception as e:
+            logger.error(f"Search index rebuild error: {str(e)}")
+            return False
+
+    def close(self):
+        """Close the database connections of all threads"""
+        self.connections.close()
+
+    def save_document_summary(self, document: DocumentSummary, pages: Optional[List[Dict[str, any]]] = None) -> bool:
+        """Save document summary to the database, along with its extracted pages when given"""
+        return self.save_documents([(document, pages)])
+
+    def save_documents(self, documents: List[Tuple[DocumentSummary, Optional[List[Dict[str, any]]]]]) -> bool:
+        """Save documents with their extracted pages in a single transaction"""
+        try:
+            with stage_timer("db_save"), self.connections.connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO documents (id, filename, summary, upload_date, file_size, page_count)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        document.id,
-                        document.filename,
-                        document.summary,
-                        document.upload_date.isoformat(),
-                        document.file_size,
-                        document.page_count,
-                    ),
-                )
+                for document, pages in documents:
+                    self._insert_document(cursor, document, pages)
                 conn.commit()
-                logger.info(f"Document {document.filename} saved to the database")
+                if len(documents) == 1:
+                    logger.info(f"Document {documents[0][0].filename} saved to the database")
+                else:
+                    logger.info(f"{len(documents)} documents saved to the database")
                 return True
         except Exception as e:
             logger.error(f"Database save error: {str(e)}")
             return False
 
-    def get_last_5_documents(self) -> List[DocumentHistory]:
-        """Retrieve the last 5 documents"""
+    def _insert_document(self, cursor, document: DocumentSummary, pages: Optional[List[Dict[str, any]]]):
+        cursor.execute(
+            """
+            INSERT INTO documents (
+                id, filename, summary, upload_date, file_size, page_count, content_hash, preview
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                document.id,
+                document.filename,
+                document.summary,
+                document.upload_date.isoformat(),
+                document.file_size,
+                document.page_count,
+                document.content_hash,
+                self.make_preview(document.summary),
+            ),
+        )
+        if pages:
+            rows = [(document.id, page["page"], self._pack_page(page)) for page in pages]
+            cursor.executemany("INSERT INTO document_pages (document_id, page_num, data) VALUES (?, ?, ?)", rows)
+            logger.info(
+                f"Stored {len(rows)} extracted pages of {document.filename}, "
+                f"{sum(len(row[2]) for row in rows)} bytes compressed"
+            )
+
+    def update_document_summary(self, doc_id: str, summary: str) -> bool:
+        """Replace the summary of a stored document"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    """
-                    SELECT id, filename, summary, upload_date, file_size, page_count
-                    FROM documents
-                    ORDER BY upload_date DESC
-                    LIMIT 5
-                """
+                    "UPDATE documents SET summary = ?, preview = ? WHERE id = ?",
+                    (summary, self.make_preview(summary), doc_id),
                 )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Database update error: {str(e)}")
+            return False
 
-                rows = cursor.fetchall()
-                documents = []
+    def get_document_pages(self, doc_id: str) -> List[Dict[str, any]]:
+        """Retrieve the extracted pages of a document in page order"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT data FROM document_pages WHERE document_id = ? ORDER BY page_num",
+                    (doc_id,),
+                )
+                return [self._unpack_page(row[0]) for row in cursor.fetchall()]
 
-                for row in rows:
-                    doc = DocumentHistory(
+        except Exception as e:
+            logger.error(f"Error retrieving document pages: {str(e)}")
+            return []
+
+    @staticmethod
+    def _pack_page(page: Dict[str, any]) -> bytes:
+        return zlib.compress(json.dumps(page, separators=(",", ":")).encode())
+
+    @staticmethod
+    def _unpack_page(data: bytes) -> Dict[str, any]:
+        return json.loads(zlib.decompress(data))
+
+    def get_history(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[DocumentPreview], Optional[str]]:
+        """Retrieve a page of documents, newest first, and the cursor of the next page
+
+        Pages are read by keyset from the upload date index, so deep pages cost the same as the first one.
+        Raises ValueError for a malformed cursor.
+        """
+        after = self._decode_cursor(cursor) if cursor else None
+        try:
+            with self.connections.connect() as conn:
+                db_cursor = conn.cursor()
+                # Fetch one extra row to know whether there is a next page
+                if after:
+                    db_cursor.execute(
+                        """
+                        SELECT id, filename, preview, upload_date, file_size, page_count
+                        FROM documents
+                        WHERE (upload_date, id) < (?, ?)
+                        ORDER BY upload_date DESC, id DESC
+                        LIMIT ?
+                    """,
+                        (*after, limit + 1),
+                    )
+                else:
+                    db_cursor.execute(
+                        """
+                        SELECT id, filename, preview, upload_date, file_size, page_count
+                        FROM documents
+                        ORDER BY upload_date DESC, id DESC
+                        LIMIT ?
+                    """,
+                        (limit + 1,),
+                    )
+
+                rows = db_cursor.fetchall()
+                documents = [
+                    DocumentPreview(
                         id=row[0],
                         filename=row[1],
-                        summary=row[2],
+                        preview=row[2],
                         upload_date=datetime.fromisoformat(row[3]),
                         file_size=row[4],
                         page_count=row[5],
                     )
-                    documents.append(doc)
+                    for row in rows[:limit]
+                ]
+                next_cursor = self._encode_cursor(rows[limit - 1][3], rows[limit - 1][0]) if len(rows) > limit else None
 
                 logger.info(f"Retrieved {len(documents)} documents from history")
-                return documents
+                return documents, next_cursor
 
         except Exception as e:
             logger.error(f"Error retrieving document history: {str(e)}")
-            return []
+            return [], None
+
+    def _highlight(self, snippet: str) -> str:
+        """Escape the snippet, summaries come from the model and may contain HTML, then mark the matches"""
+        snippet = html.escape(snippet)
+        for sentinel, marker in zip(self.SNIPPET_SENTINELS, self.HIGHLIGHT_MARKERS):
+            snippet = snippet.replace(sentinel, marker)
+        return snippet
+
+    def search_documents(self, query: str, limit: int, offset: int = 0) -> Tuple[List[SearchResult], bool]:
+        """Full-text search over filenames and summaries, best matches first
+
+        Returns a page of results with highlighted summary snippets and whether more results follow.
+        """
+        match_query = self._to_match_query(query)
+        if not match_query:
+            return [], False
+
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                # bm25 weights filename matches above summary matches, lower scores rank higher
+                cursor.execute(
+                    """
+                    SELECT
+                        documents.id,
+                        documents.filename,
+                        snippet(documents_fts, 1, ?, ?, '...', ?),
+                        documents.upload_date,
+                        documents.file_size,
+                        documents.page_count,
+                        bm25(documents_fts, 2.0, 1.0) AS score
+                    FROM documents_fts
+                    JOIN documents ON documents.rowid = documents_fts.rowid
+                    WHERE documents_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ? OFFSET ?
+                """,
+                    (*self.SNIPPET_SENTINELS, self.SNIPPET_TOKENS, match_query, limit + 1, offset),
+                )
+
+                rows = cursor.fetchall()
+                results = [
+                    SearchResult(
+                        id=row[0],
+                        filename=row[1],
+                        snippet=self._highlight(row[2] or ""),
+                        upload_date=datetime.fromisoformat(row[3]),
+                        file_size=row[4],
+                        page_count=row[5],
+                        score=row[6],
+                    )
+                    for row in rows[:limit]
+                ]
+
+                logger.info(f"Search returned {len(results)} documents")
+                return results, len(rows) > limit
+
+        except Exception as e:
+            logger.error(f"Error searching documents: {str(e)}")
+            return [], False
+
+    @staticmethod
+    def _to_match_query(query: str) -> str:
+        """Turn free text into an FTS5 query that matches all words, a trailing * keeps prefix search"""
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '""')
+            # Words without letters or digits produce no tokens and would make the query invalid
+            if any(char.isalnum() for char in word):
+                terms.append(f'"{word}"*' if prefix else f'"{word}"')
+        return " ".join(terms)
+
+    @classmethod
+    def make_preview(cls, summary: str) -> str:
+        return summary[: cls.PREVIEW_LENGTH] + "..." if len(summary) > cls.PREVIEW_LENGTH else summary
+
+    @staticmethod
+    def _encode_cursor(upload_date: str, doc_id: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([upload_date, doc_id]).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            upload_date, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(upload_date, str) or not isinstance(doc_id, str):
+                raise ValueError
+            return upload_date, doc_id
+        except Exception:
+            raise ValueError("Invalid cursor")
 
     def get_document_by_id(self, doc_id: str) -> Optional[DocumentHistory]:
         """Retrieve a document by its ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -130,3 +394,35 @@ class DatabaseService:
         except Exception as e:
             logger.error(f"Error retrieving document: {str(e)}")
             return None
+
+    def get_document_by_hash(self, content_hash: str) -> Optional[DocumentHistory]:
+        """Retrieve the most recent document with the given content hash"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT id, filename, summary, upload_date, file_size, page_count, content_hash
+                    FROM documents
+                    WHERE content_hash = ?
+                    ORDER BY upload_date DESC
+                    LIMIT 1
+                """,
+                    (content_hash,),
+                )
+
+                row = cursor.fetchone()
+                if row:
+                    return DocumentHistory(
+                        id=row[0],
+                        filename=row[1],
+                        summary=row[2],
+                        upload_date=datetime.fromisoformat(row[3]),
+                        file_size=row[4],
+                        page_count=row[5],
+                        content_hash=row[6],
+                    )
+
+        except Exception as e:
+            logger.error(f"Error retrieving document by hash: {str(e)}")
+            return None
@@ -0,0 +1,389 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import PAGES, PROMPT_TEXT_TOKENS, stage_timer, track_upload
+from app.models import DocumentHistory, DocumentSummary
+from app.services.database_service import DatabaseService
+from app.services.extraction_pool import ExtractionPool
+from app.services.openai_service import OpenAIService
+from app.services.pdf_service import PDFService, PDFSource
+from app.services.upload_spool import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentProcessingError(Exception):
+    """Expected pipeline failure with a message that is safe to show to the client"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class DocumentProcessor:
+    """Validate, extract, summarize and save an uploaded PDF"""
+
+    def __init__(
+        self,
+        pdf_service: PDFService,
+        openai_service: OpenAIService,
+        db_service: DatabaseService,
+        extraction_pool: ExtractionPool,
+    ):
+        self.pdf_service = pdf_service
+        self.openai_service = openai_service
+        self.db_service = db_service
+        self.extraction_pool = extraction_pool
+        # Content-hash summary cache counters
+        self.cache_stats = {"hits": 0, "misses": 0, "bypassed": 0}
+        # Documents summarized again at the same time by a batch, the OpenAI request limit still applies
+        self.RESUMMARIZE_CONCURRENCY = int(os.getenv("RESUMMARIZE_CONCURRENCY", "4"))
+        # Files of a batch upload in the pipeline at once, and the most files one batch may contain
+        self.BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        self.BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+
+    async def process(
+        self,
+        file_content: PDFSource,
+        filename: str,
+        force_refresh: bool = False,
+        on_stage: Optional[Callable[[str], Optional[Awaitable[None]]]] = None,
+        image_detail: str = "auto",
+    ) -> dict:
+        """Run the whole pipeline and return the document data for the API response"""
+
+        async def report_stage(stage: str):
+            if on_stage:
+                result = on_stage(stage)
+                if inspect.isawaitable(result):
+                    await result
+
+        with track_upload() as upload:
+            content_hash = self._content_hash(file_content)
+
+            # Return the stored summary if the same file was already processed
+            cached_result = await self._get_cached_result(content_hash, filename, force_refresh)
+            if cached_result:
+                upload["result"] = "cached"
+                return cached_result
+
+            # Validate and extract the PDF in a single parse
+            await report_stage("extracting")
+            extracted_data = await self._extract_text(file_content, filename, image_detail)
+
+            # Generate summary using OpenAI
+            await report_stage("summarizing")
+            logger.info("Generating summary with OpenAI...")
+
+            summary = await self.openai_service.generate_summary(
+                extracted_data["text"], extracted_data["images"], force_refresh=force_refresh
+            )
+
+            # Save to the database
+            await report_stage("saving")
+            upload["result"] = "processed"
+            return await self._save_result(file_content, filename, content_hash, extracted_data, summary)
+
+    async def process_stream(
+        self, file_content: PDFSource, filename: str, force_refresh: bool = False, image_detail: str = "auto"
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """Run the pipeline, yielding ("stage", ...), ("summary", ...) and finally ("done", ...) events"""
+        with track_upload() as upload:
+            content_hash = self._content_hash(file_content)
+
+            cached_result = await self._get_cached_result(content_hash, filename, force_refresh)
+            if cached_result:
+                upload["result"] = "cached"
+                yield "done", cached_result
+                return
+
+            yield "stage", {"stage": "extracting"}
+            extracted_data = await self._extract_text(file_content, filename, image_detail)
+
+            # Forward the summary text as the model produces it
+            yield "stage", {"stage": "summarizing"}
+            logger.info("Streaming summary from OpenAI...")
+            parts = []
+            async for delta in self.openai_service.stream_summary(
+                extracted_data["text"], extracted_data["images"], force_refresh=force_refresh
+            ):
+                parts.append(delta)
+                yield "summary", {"text": delta}
+
+            # Save once the stream has completed
+            yield "stage", {"stage": "saving"}
+            summary = "".join(parts).strip()
+            upload["result"] = "processed"
+            yield "done", await self._save_result(file_content, filename, content_hash, extracted_data, summary)
+
+    async def resummarize(self, doc_id: str) -> dict:
+        """Summarize a stored document again from its extracted pages, without parsing the PDF"""
+        document = await run_in_threadpool(self.db_service.get_document_by_id, doc_id)
+        if not document:
+            raise DocumentProcessingError(404, "Document not found")
+
+        pages = await run_in_threadpool(self.db_service.get_document_pages, doc_id)
+        if not pages:
+            raise DocumentProcessingError(409, "No extracted pages stored for this document, upload it again")
+
+        extracted_data = self.pdf_service.merge_pages(document.page_count, {}, pages)
+        self._report_text_stats(document.filename, extracted_data)
+        logger.info(f"Summarizing {document.filename} again from {len(pages)} stored pages...")
+        # A stored document is summarized again to get a new summary, not the cached response
+        summary = await self.openai_service.generate_summary(
+            extracted_data["text"], extracted_data["images"], force_refresh=True
+        )
+
+        if not await run_in_threadpool(self.db_service.update_document_summary, doc_id, summary):
+            logger.warning("Failed to update the summary in the database, but returning result anyway")
+
+        document.summary = summary
+        return self._document_data(document, cached=False)
+
+    async def resummarize_many(self, doc_ids: List[str]) -> dict:
+        """Summarize several stored documents again, collecting the failures instead of stopping at the first"""
+        semaphore = asyncio.Semaphore(self.RESUMMARIZE_CONCURRENCY)
+
+        async def run(doc_id: str):
+            async with semaphore:
+                try:
+                    return await self.resummarize(doc_id), None
+                except DocumentProcessingError as e:
+                    return None, {"id": doc_id, "status_code": e.status_code, "message": e.message}
+                except Exception as e:
+                    logger.error(f"Error summarizing document {doc_id} again: {str(e)}")
+                    return None, {"id": doc_id, "status_code": 500, "message": "Error processing document"}
+
+        results = await asyncio.gather(*(run(doc_id) for doc_id in dict.fromkeys(doc_ids)))
+        return {
+            "documents": [document for document, _ in results if document],
+            "errors": [error for _, error in results if error],
+        }
+
+    async def process_batch(
+        self,
+        sources: Iterable[Tuple[str, Callable[[], bytes]]],
+        force_refresh: bool = False,
+        image_detail: str = "auto",
+    ) -> dict:
+        """Process many files as a pipeline and save the new documents in a single transaction
+
+        sources yields (filename, load) pairs and is consumed lazily, so only BATCH_CONCURRENCY files are
+        in memory at once. While some files are extracted in the process pool, others wait on the model under
+        the OpenAI request limit. Each file gets its own result, a failed file doesn't stop the batch.
+        """
+        started = time.perf_counter()
+        results = []
+        documents = []  # (DocumentSummary, pages) saved together once every file is done
+        in_flight = {}  # content hash -> task of the first file with that content
+        stats = {"files": 0, "processed": 0, "cached": 0, "failed": 0, "pages": 0, "bytes": 0}
+
+        async def summarize(file_content: bytes, filename: str, content_hash: str) -> dict:
+            cached_result = await self._get_cached_result(content_hash, filename, force_refresh)
+            if cached_result:
+                return cached_result
+
+            extracted_data = await self._extract_text(file_content, filename, image_detail)
+            summary = await self.openai_service.generate_summary(
+                extracted_data["text"], extracted_data["images"], force_refresh=force_refresh
+            )
+            document = DocumentSummary(
+                filename=filename,
+                summary=summary,
+                file_size=len(file_content),
+                page_count=extracted_data["page_count"],
+                content_hash=content_hash,
+            )
+            documents.append((document, extracted_data.get("pages")))
+            stats["pages"] += document.page_count
+            return self._document_data(document, cached=False)
+
+        async def process_file(result: dict, load: Callable[[], bytes]):
+            try:
+                if stats["files"] > self.BATCH_MAX_FILES:
+                    raise DocumentProcessingError(400, f"Too many files. Maximum per batch: {self.BATCH_MAX_FILES}")
+                file_content = await run_in_threadpool(load)
+                stats["bytes"] += len(file_content)
+                content_hash = hashlib.sha256(file_content).hexdigest()
+
+                # Repeated files in the same batch wait for the first copy instead of being processed again
+                task = in_flight.get(content_hash)
+                if task is None:
+                    task = in_flight[content_hash] = asyncio.ensure_future(
+                        summarize(file_content, result["filename"], content_hash)
+                    )
+                    data = await task
+                else:
+                    data = {**await task, "cached": True}
+
+                stats["cached" if data["cached"] else "processed"] += 1
+                result.update(success=True, data=data)
+            except DocumentProcessingError as e:
+                stats["failed"] += 1
+                result.update(success=False, status_code=e.status_code, message=e.message)
+            except Exception as e:
+                logger.error(f"Error processing file {result['filename']}: {str(e)}")
+                stats["failed"] += 1
+                result.update(success=False, status_code=500, message="Error processing file")
+
+        async def worker(source_iterator):
+            for filename, load in source_iterator:
+                stats["files"] += 1
+                result = {"filename": filename}
+                results.append(result)
+                with track_upload() as upload:
+                    await process_file(result, load)
+                    if result["success"]:
+                        upload["result"] = "cached" if result["data"]["cached"] else "processed"
+
+        # Workers share one iterator, so every file is taken exactly once and in order
+        source_iterator = iter(sources)
+        await asyncio.gather(*(worker(source_iterator) for _ in range(max(self.BATCH_CONCURRENCY, 1))))
+
+        if documents and not await run_in_threadpool(self.db_service.save_documents, documents):
+            logger.warning("Failed to save the batch to the database, but returning results anyway")
+
+        elapsed = time.perf_counter() - started
+        stats.update(
+            elapsed_seconds=round(elapsed, 3),
+            files_per_second=round(stats["files"] / elapsed, 2) if elapsed else 0.0,
+            pages_per_second=round(stats["pages"] / elapsed, 2) if elapsed else 0.0,
+            megabytes_per_second=round(stats["bytes"] / 1048576 / elapsed, 2) if elapsed else 0.0,
+        )
+        logger.info(
+            f"Batch of {stats['files']} files done in {elapsed:.1f} s: "
+            f"{stats['processed']} processed, {stats['cached']} cached, {stats['failed']} failed"
+        )
+        return {"results": results, "stats": stats}
+
+    async def _get_cached_result(self, content_hash: str, filename: str, force_refresh: bool) -> Optional[dict]:
+        """Look up a stored summary of the same file and update the cache counters
+
+        The same content uploaded under another name is added to the history under that name, with the stored
+        summary and extracted pages.
+        """
+        if force_refresh:
+            self.cache_stats["bypassed"] += 1
+            return None
+
+        cached_document = await run_in_threadpool(self.db_service.get_document_by_hash, content_hash)
+        if not cached_document:
+            self.cache_stats["misses"] += 1
+            return None
+
+        self.cache_stats["hits"] += 1
+        logger.info(f"Cache hit for {filename}, returning document {cached_document.id}")
+        if cached_document.filename == filename:
+            return self._document_data(cached_document, cached=True)
+
+        pages = await run_in_threadpool(self.db_service.get_document_pages, cached_document.id)
+        document = DocumentSummary(
+            filename=filename,
+            summary=cached_document.summary,
+            file_size=cached_document.file_size,
+            page_count=cached_document.page_count,
+            content_hash=content_hash,
+        )
+        if not await run_in_threadpool(self.db_service.save_document_summary, document, pages or None):
+            logger.warning("Failed to save to the database, but returning result anyway")
+        return self._document_data(document, cached=True)
+
+    @staticmethod
+    def _content_hash(file_content: PDFSource) -> str:
+        # Spooled uploads are hashed while they are received
+        if isinstance(file_content, SpooledUpload):
+            return file_content.content_hash
+        return hashlib.sha256(file_content).hexdigest()
+
+    async def _extract_text(self, file_content: PDFSource, filename: str, image_detail: str) -> dict:
+        """Validate and extract the PDF, raising client errors for invalid or empty documents"""
+        logger.info("Validating and extracting PDF...")
+        with stage_timer("extract"):
+            is_valid, validation_message, extracted_data = await self._extract_pdf(file_content, filename, image_detail)
+        if not is_valid:
+            raise DocumentProcessingError(400, validation_message)
+
+        if not extracted_data["text"].strip():
+            raise DocumentProcessingError(400, "Failed to extract text from the PDF file.")
+        PAGES.inc(extracted_data["page_count"])
+        self._report_text_stats(filename, extracted_data)
+        return extracted_data
+
+    @staticmethod
+    def _report_text_stats(filename: str, extracted_data: dict):
+        """Log and count the prompt tokens saved by removing headers, footers and other repeated lines"""
+        text_stats = extracted_data.get("text_stats")
+        if not text_stats:
+            return
+
+        PROMPT_TEXT_TOKENS.labels("extracted").inc(text_stats["tokens_before"])
+        PROMPT_TEXT_TOKENS.labels("normalized").inc(text_stats["tokens_after"])
+        logger.info(
+            f"Text of {filename}: {text_stats['tokens_before']} -> {text_stats['tokens_after']} estimated tokens, "
+            f"{text_stats['lines_removed']} repeated lines removed, {text_stats['pages_dropped']} near-empty pages dropped"
+        )
+
+    async def _save_result(
+        self, file_content: PDFSource, filename: str, content_hash: str, extracted_data: dict, summary: str
+    ) -> dict:
+        """Save the summary with the extracted pages and return the document data for the API response"""
+        document = DocumentSummary(
+            filename=filename,
+            summary=summary,
+            file_size=len(file_content),
+            page_count=extracted_data["page_count"],
+            content_hash=content_hash,
+        )
+
+        if not await run_in_threadpool(self.db_service.save_document_summary, document, extracted_data.get("pages")):
+            logger.warning("Failed to save to the database, but returning result anyway")
+
+        logger.info(f"Document {filename} processed successfully")
+        return self._document_data(document, cached=False)
+
+    @staticmethod
+    def _document_data(document: Union[DocumentSummary, DocumentHistory], cached: bool) -> dict:
+        return {
+            "id": document.id,
+            "filename": document.filename,
+            "summary": document.summary,
+            "upload_date": document.upload_date.isoformat(),
+            "file_size": document.file_size,
+            "page_count": document.page_count,
+            "cached": cached,
+        }
+
+    async def _extract_pdf(self, file_content: PDFSource, filename: str, image_detail: str):
+        """Validate and extract the PDF, splitting large documents into page shards across the worker processes"""
+        shard_count = self.extraction_pool.max_workers
+        defer_min_pages = self.pdf_service.PARALLEL_MIN_PAGES if shard_count > 1 else None
+
+        is_valid, validation_message, extracted_data = await self.extraction_pool.run(
+            self.pdf_service.process_pdf, file_content, filename, defer_min_pages, image_detail
+        )
+        if not is_valid or not defer_min_pages or extracted_data["page_count"] < defer_min_pages:
+            return is_valid, validation_message, extracted_data
+
+        page_count = extracted_data["page_count"]
+        shard_size = -(-page_count // shard_count)
+        shards = [(first, min(first + shard_size - 1, page_count)) for first in range(1, page_count + 1, shard_size)]
+        logger.info(f"Extracting {page_count} pages in {len(shards)} parallel shards")
+
+        shard_pages = await asyncio.gather(
+            *(
+                self.extraction_pool.run(
+                    self.pdf_service.extract_page_range, file_content, first, last, image_detail
+                )
+                for first, last in shards
+            )
+        )
+        pages = [page for shard in shard_pages for page in shard]
+        return is_valid, validation_message, self.pdf_service.merge_pages(page_count, extracted_data["metadata"], pages)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import collect_stage_timings, record_stage_timings
+from app.services.profiler_service import current_session, run_profiled
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Import the PDF stack once in every worker process"""
+    import pdfplumber  # noqa: F401
+
+    import app.services.pdf_service  # noqa: F401
+
+
+def _warmup() -> int:
+    """No-op task used to spawn and initialize the workers ahead of the first upload"""
+    return os.getpid()
+
+
+class ExtractionPool:
+    """Runs CPU-bound PDF work in worker processes so the event loop stays responsive"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+        # 0 workers runs the work in the thread pool of the current process instead
+        self.max_workers = max(max_workers, 0)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Create the worker processes and wait until every worker has imported pdfplumber"""
+        with self._lock:
+            if self.max_workers == 0 or self._executor is not None:
+                return
+
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            futures = [executor.submit(_warmup) for _ in range(self.max_workers)]
+            wait(futures)
+            for future in futures:
+                future.result()
+            self._executor = executor
+            logger.info(f"Extraction pool started with {self.max_workers} worker processes")
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """Run a picklable function with the given arguments in the pool and record its stage times"""
+        if self.max_workers == 0:
+            result, timings = await run_in_threadpool(collect_stage_timings, func, *args)
+        else:
+            if self._executor is None:
+                await run_in_threadpool(self.start)
+
+            # The profiler of a profiled request only sees this process, so workers profile themselves
+            session = current_session()
+            if session is not None:
+                func = partial(run_profiled, func)
+
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                result, timings = await loop.run_in_executor(executor, partial(collect_stage_timings, func, *args))
+            except BrokenProcessPool:
+                # A worker died, out of memory or in a pdfium crash. Retrying could crash the new workers on the
+                # same file, so only this request fails and the next one gets fresh workers.
+                logger.error("Extraction worker terminated abruptly, restarting the pool")
+                await run_in_threadpool(self._restart, executor)
+                raise
+
+            if session is not None:
+                result, worker_stats = result
+                session.worker_stats.append(worker_stats)
+
+        record_stage_timings(timings)
+        return result
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Replace a broken executor, once even when several requests saw it break"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.start()
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                logger.info("Extraction pool stopped")
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import logging
+import math
+import os
+from io import BytesIO
+from typing import Dict, List
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class ImageService:
+    """Prepares extracted images for the vision prompt"""
+
+    DETAIL_LEVELS = ("low", "high", "auto")
+
+    def __init__(self):
+        self.LOW_DETAIL_SIZE = 512  # low detail images are seen as a single 512px tile
+        self.HIGH_DETAIL_MAX_SIZE = 2048  # high detail images are first fitted into 2048x2048
+        self.HIGH_DETAIL_SHORT_SIDE = 768  # then scaled so the short side is at most 768px
+        self.TILE_SIZE = 512
+        self.MAX_PALETTE_COLORS = 256  # images with fewer colors are treated as graphics and kept lossless
+        self.JPEG_QUALITY = 85
+        self.PHOTO_FORMAT = os.getenv("IMAGE_PHOTO_FORMAT", "JPEG").upper()  # JPEG or WEBP
+        # Images whose perceptual hashes differ in at most this many of 64 bits are treated as the same image
+        self.MAX_HASH_DISTANCE = int(os.getenv("IMAGE_HASH_DISTANCE", "6"))
+
+    def prepare(self, image: Image.Image, detail: str = "auto") -> Dict[str, any]:
+        """Resize an image to the model's tiling limits and encode it in the cheapest suitable format"""
+        resized = self._resize(image, detail)
+        try:
+            image_format = self._choose_format(resized)
+            if image_format != "PNG" and resized.mode != "RGB":
+                converted = resized.convert("RGB")
+                if resized is not image:
+                    resized.close()
+                resized = converted
+
+            buffer = BytesIO()
+            try:
+                if image_format == "PNG":
+                    resized.save(buffer, format="PNG", optimize=True)
+                else:
+                    resized.save(buffer, format=image_format, quality=self.JPEG_QUALITY)
+                encoded = buffer.getvalue()
+            finally:
+                buffer.close()
+
+            return {
+                "base64": base64.b64encode(encoded).decode("utf-8"),
+                "mime_type": f"image/{image_format.lower()}",
+                "detail": detail,
+                "width": resized.width,
+                "height": resized.height,
+                "bytes": len(encoded),
+                "tokens": self.estimate_tokens(resized.width, resized.height, detail),
+            }
+        finally:
+            if resized is not image:
+                resized.close()
+
+    @staticmethod
+    def pixel_hash(image: Image.Image) -> str:
+        """Exact hash of the decoded pixels"""
+        return hashlib.sha256(f"{image.mode}{image.size}".encode() + image.tobytes()).hexdigest()
+
+    @staticmethod
+    def perceptual_hash(image: Image.Image) -> str:
+        """64-bit difference hash (dHash) that survives resampling and small rendering differences"""
+        # Compare neighbouring pixels of a 9x8 grayscale thumbnail
+        with image.convert("L") as grayscale, grayscale.resize((9, 8), Image.Resampling.LANCZOS) as thumbnail:
+            pixels = thumbnail.tobytes()
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return f"{bits:016x}"
+
+    def is_same_image(self, first: Dict[str, any], second: Dict[str, any]) -> bool:
+        """Compare two hashed images exactly, or by perceptual hash distance when both have one"""
+        if first["hash"] == second["hash"]:
+            return True
+        if not first.get("phash") or not second.get("phash"):
+            return False
+        distance = bin(int(first["phash"], 16) ^ int(second["phash"], 16)).count("1")
+        return distance <= self.MAX_HASH_DISTANCE
+
+    def estimate_tokens(self, width: int, height: int, detail: str) -> int:
+        """Image token cost of a resized image: a base charge plus a charge per 512px tile"""
+        if detail == "low":
+            return 85
+        tiles = math.ceil(width / self.TILE_SIZE) * math.ceil(height / self.TILE_SIZE)
+        return 85 + 170 * tiles
+
+    @staticmethod
+    def apply_budget(images: List[Dict[str, any]], max_bytes: int, max_tokens: int) -> List[Dict[str, any]]:
+        """Keep images in document order while they fit the total byte and token budget"""
+        selected = []
+        total_bytes = 0
+        total_tokens = 0
+        for image in images:
+            image_bytes = image.get("bytes", len(image["base64"]) * 3 // 4)
+            image_tokens = image.get("tokens", 0)
+            if total_bytes + image_bytes > max_bytes or total_tokens + image_tokens > max_tokens:
+                continue
+            selected.append(image)
+            total_bytes += image_bytes
+            total_tokens += image_tokens
+
+        if len(selected) < len(images):
+            logger.info(f"Image budget kept {len(selected)} of {len(images)} images")
+        return selected
+
+    def _resize(self, image: Image.Image, detail: str) -> Image.Image:
+        if detail == "low":
+            scale = min(1.0, self.LOW_DETAIL_SIZE / max(image.size))
+        else:
+            scale = min(1.0, self.HIGH_DETAIL_MAX_SIZE / max(image.size), self.HIGH_DETAIL_SHORT_SIDE / min(image.size))
+
+        if scale >= 1.0:
+            return image
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.Resampling.LANCZOS)
+
+    def _choose_format(self, image: Image.Image) -> str:
+        """PNG for transparency and flat graphics such as charts, the photo format for everything else"""
+        if image.mode in ("RGBA", "LA", "P", "1"):
+            return "PNG"
+        if image.getcolors(maxcolors=self.MAX_PALETTE_COLORS) is not None:
+            return "PNG"
+        return self.PHOTO_FORMAT
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.document_processor import DocumentProcessor, DocumentProcessingError
+from app.services.job_service import JobService
+from app.services.upload_spool import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """Bounded pool of asyncio workers that drain the persistent job queue"""
+
+    POLL_INTERVAL = 1.0  # seconds between queue checks when no job was submitted
+
+    def __init__(self, job_service: JobService, processor: DocumentProcessor, max_workers: Optional[int] = None):
+        self.job_service = job_service
+        self.processor = processor
+        self.max_workers = max_workers if max_workers is not None else int(os.getenv("JOB_WORKERS", "2"))
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Start the workers, jobs left running by a stopped process are claimed again once their lease expires"""
+        if self._tasks:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(worker_num)) for worker_num in range(self.max_workers)]
+        logger.info(f"Job runner started with {self.max_workers} workers")
+
+    async def stop(self):
+        """Cancel the workers and put their running jobs back in the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await run_in_threadpool(self.job_service.release_jobs)
+        logger.info("Job runner stopped")
+
+    def notify(self):
+        """Wake the workers after a job was submitted"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def run_next_job(self) -> bool:
+        """Claim and process a single queued job, returns False when the queue is empty"""
+        claimed = await run_in_threadpool(self.job_service.claim_next_job)
+        if not claimed:
+            return False
+
+        job, file_content = claimed
+        logger.info(f"Processing job {job.id} for {job.filename}")
+        heartbeat = asyncio.create_task(self._renew_lease(job.id))
+        try:
+            result = await self.processor.process(
+                file_content,
+                job.filename,
+                force_refresh=job.force_refresh,
+                image_detail=job.image_detail,
+                on_stage=lambda stage: run_in_threadpool(self.job_service.update_stage, job.id, stage),
+            )
+            await run_in_threadpool(self.job_service.complete_job, job.id, result)
+            logger.info(f"Job {job.id} completed")
+        except DocumentProcessingError as e:
+            await run_in_threadpool(self.job_service.fail_job, job.id, e.message)
+        except Exception as e:
+            logger.error(f"Error processing job {job.id}: {str(e)}")
+            await run_in_threadpool(self.job_service.fail_job, job.id, "Error processing file")
+        finally:
+            heartbeat.cancel()
+
+        # Kept when the runner is stopped during the job, it is processed again after the restart
+        if isinstance(file_content, SpooledUpload):
+            file_content.close()
+        return True
+
+    async def _renew_lease(self, job_id: str):
+        """Keep the lease of a running job well ahead of its expiry"""
+        while True:
+            await asyncio.sleep(self.job_service.LEASE_SECONDS / 3)
+            if not await run_in_threadpool(self.job_service.renew_lease, job_id):
+                logger.warning(f"Lost the lease of job {job_id}, another process may run it again")
+
+    async def _worker(self, worker_num: int):
+        while True:
+            try:
+                if await self.run_next_job():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {worker_num} error: {str(e)}")
+
+            # Queue is empty: sleep until a job is submitted or the poll interval elapses
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
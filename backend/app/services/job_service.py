@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, Union
+
+from app.models import Job
+from app.services.sqlite_connections import SQLiteConnections
+from app.services.upload_spool import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+class JobService:
+    """Persistent upload job queue stored next to the documents table"""
+
+    def __init__(self):
+        self.db_path = os.getenv("DATABASE_PATH")
+        if not self.db_path:
+            raise ValueError("DATABASE_PATH environment variable is required")
+        # Create the folder if it doesn't exist
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Files of queued jobs are kept here until the job is done, defaults to a folder next to the database
+        self.FILE_DIR = os.getenv("JOB_FILE_DIR") or os.path.join(os.path.dirname(self.db_path), "jobs")
+        os.makedirs(self.FILE_DIR, exist_ok=True)
+        # Running jobs are leased to one process, which renews the lease while it works on them. Jobs whose lease
+        # expired, because their process died, are claimed again by any process sharing the queue.
+        self.OWNER = f"{socket.gethostname()}:{os.getpid()}"
+        self.LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+        self.connections = SQLiteConnections(self.db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize the jobs table"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        filename TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        stage TEXT,
+                        force_refresh INTEGER NOT NULL DEFAULT 0,
+                        image_detail TEXT NOT NULL DEFAULT 'auto',
+                        file_content BLOB,
+                        file_path TEXT,
+                        content_hash TEXT,
+                        owner TEXT,
+                        lease_expires_at TEXT,
+                        result TEXT,
+                        error TEXT,
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    )
+                """
+                )
+                # Queues created by earlier versions lack the newer columns
+                columns = [row[1] for row in cursor.execute("PRAGMA table_info(jobs)")]
+                for column, definition in (
+                    ("image_detail", "TEXT NOT NULL DEFAULT 'auto'"),
+                    ("file_path", "TEXT"),
+                    ("content_hash", "TEXT"),
+                    ("owner", "TEXT"),
+                    ("lease_expires_at", "TEXT"),
+                ):
+                    if column not in columns:
+                        cursor.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+                conn.commit()
+                logger.info("Job queue initialized")
+        except Exception as e:
+            logger.error(f"Job queue initialization error: {str(e)}")
+            raise
+
+    def close(self):
+        """Close the database connections of all threads"""
+        self.connections.close()
+
+    def create_job(
+        self,
+        filename: str,
+        file_content: Union[bytes, SpooledUpload],
+        force_refresh: bool = False,
+        image_detail: str = "auto",
+    ) -> Optional[Job]:
+        """Queue a new job for the uploaded file, a spooled upload is moved into FILE_DIR instead of stored"""
+        job = Job(filename=filename, force_refresh=force_refresh, image_detail=image_detail)
+        file_path = None
+        content_hash = None
+        try:
+            if isinstance(file_content, SpooledUpload):
+                file_path = os.path.join(self.FILE_DIR, f"{job.id}.pdf")
+                shutil.move(file_content.path, file_path)
+                content_hash = file_content.content_hash
+                file_content = None
+
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO jobs (
+                        id, filename, status, force_refresh, image_detail, file_content, file_path, content_hash,
+                        created_at, updated_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        job.id,
+                        job.filename,
+                        job.status,
+                        int(job.force_refresh),
+                        job.image_detail,
+                        file_content,
+                        file_path,
+                        content_hash,
+                        job.created_at.isoformat(),
+                        job.updated_at.isoformat(),
+                    ),
+                )
+                conn.commit()
+                logger.info(f"Job {job.id} queued for {filename}")
+                return job
+        except Exception as e:
+            logger.error(f"Job creation error: {str(e)}")
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+            return None
+
+    def claim_next_job(self) -> Optional[Tuple[Job, Union[bytes, SpooledUpload]]]:
+        """Atomically lease the oldest queued or abandoned job to this process and return it with its file
+
+        The file is a SpooledUpload for jobs whose file is kept in FILE_DIR, the caller deletes it with close()
+        once the job is done. A job whose file can no longer be read is failed and the next one is claimed.
+        """
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                now = datetime.now(timezone.utc)
+                cursor.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'running', stage = NULL, owner = ?, lease_expires_at = ?, updated_at = ?
+                    WHERE id = (
+                        SELECT id FROM jobs
+                        WHERE status = 'queued'
+                            OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?))
+                        ORDER BY created_at
+                        LIMIT 1
+                    )
+                    RETURNING
+                        id, filename, force_refresh, image_detail, file_content, file_path, content_hash, created_at,
+                        updated_at
+                """,
+                    (
+                        self.OWNER,
+                        (now + timedelta(seconds=self.LEASE_SECONDS)).isoformat(),
+                        datetime.now().isoformat(),
+                        now.isoformat(),
+                    ),
+                )
+                row = cursor.fetchone()
+                conn.commit()
+                if not row:
+                    return None
+
+                job = Job(
+                    id=row[0],
+                    filename=row[1],
+                    status="running",
+                    force_refresh=bool(row[2]),
+                    image_detail=row[3],
+                    created_at=datetime.fromisoformat(row[7]),
+                    updated_at=datetime.fromisoformat(row[8]),
+                )
+                if not row[5]:
+                    return job, row[4]
+
+        except Exception as e:
+            logger.error(f"Error claiming job: {str(e)}")
+            return None
+
+        try:
+            return job, SpooledUpload.from_path(row[5], job.filename, row[6])
+        except OSError as e:
+            # The job is leased already, fail it instead of leaving it running, and move on to the next one
+            logger.error(f"Error reading the file of job {job.id}: {str(e)}")
+            self.fail_job(job.id, "The uploaded file is missing or unreadable")
+            return self.claim_next_job()
+
+    def update_stage(self, job_id: str, stage: str) -> bool:
+        """Record the pipeline stage a running job has reached"""
+        return self._update(job_id, "stage = ?", (stage,))
+
+    def complete_job(self, job_id: str, result: dict) -> bool:
+        """Store the result of a finished job and drop its file content"""
+        return self._update(
+            job_id,
+            "status = 'completed', stage = NULL, result = ?, file_content = NULL",
+            (json.dumps(result),),
+        )
+
+    def fail_job(self, job_id: str, error: str) -> bool:
+        """Mark a job as failed and drop its file content"""
+        return self._update(job_id, "status = 'failed', error = ?, file_content = NULL", (error,))
+
+    def renew_lease(self, job_id: str) -> bool:
+        """Extend the lease of a job this process is running, False when another process has taken it over"""
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.LEASE_SECONDS)
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                    (expires_at.isoformat(), job_id, self.OWNER),
+                )
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Error renewing job lease: {str(e)}")
+            return False
+
+    def release_jobs(self) -> int:
+        """Put the jobs this process is running back in the queue, for another process or the next start"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'queued', stage = NULL, owner = NULL, lease_expires_at = NULL, updated_at = ?
+                    WHERE status = 'running' AND owner = ?
+                """,
+                    (datetime.now().isoformat(), self.OWNER),
+                )
+                conn.commit()
+                if cursor.rowcount:
+                    logger.info(f"Requeued {cursor.rowcount} interrupted jobs")
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error requeuing jobs: {str(e)}")
+            return 0
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """Retrieve a job by its ID"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT
+                        id, filename, status, stage, force_refresh, image_detail, result, error, created_at, updated_at
+                    FROM jobs
+                    WHERE id = ?
+                """,
+                    (job_id,),
+                )
+
+                row = cursor.fetchone()
+                if row:
+                    return Job(
+                        id=row[0],
+                        filename=row[1],
+                        status=row[2],
+                        stage=row[3],
+                        force_refresh=bool(row[4]),
+                        image_detail=row[5],
+                        result=json.loads(row[6]) if row[6] else None,
+                        error=row[7],
+                        created_at=datetime.fromisoformat(row[8]),
+                        updated_at=datetime.fromisoformat(row[9]),
+                    )
+
+        except Exception as e:
+            logger.error(f"Error retrieving job: {str(e)}")
+            return None
+
+    def _update(self, job_id: str, assignments: str, params: tuple) -> bool:
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                    (*params, datetime.now().isoformat(), job_id),
+                )
+                conn.commit()
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Job update error: {str(e)}")
+            return False
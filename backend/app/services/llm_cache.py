@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.services.sqlite_connections import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """Two-tier cache of model responses: an in-memory LRU bounded in bytes and a SQLite table with a TTL"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.MAX_MEMORY_BYTES = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+        self.TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.db_path = db_path or os.getenv("LLM_CACHE_PATH") or os.getenv("DATABASE_PATH")
+
+        # Key to (expires_at, entry), so the memory tier honours the TTL like the disk tier
+        self._memory: OrderedDict[str, tuple] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "tokens_saved": 0,
+        }
+
+        if self.enabled:
+            if not self.db_path:
+                raise ValueError("LLM_CACHE_PATH or DATABASE_PATH environment variable is required")
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.connections = SQLiteConnections(self.db_path)
+            self._init_db()
+
+    def _init_db(self):
+        """Initialize the response cache table and drop expired entries"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        key TEXT PRIMARY KEY,
+                        response TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """
+                )
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache (expires_at)")
+                cursor.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                conn.commit()
+                logger.info("LLM response cache initialized")
+        except Exception as e:
+            logger.error(f"LLM response cache initialization error: {str(e)}")
+            raise
+
+    @staticmethod
+    def make_key(model: str, params: dict, developer_prompt: str, text: str, images: list[dict]) -> str:
+        """Hash of everything that determines the response, with whitespace in the prompts normalized"""
+        request = {
+            "model": model,
+            "params": params,
+            "developer_prompt": " ".join(developer_prompt.split()),
+            "text": " ".join(text.split()),
+            # Images are identified by their content hash and the detail level they were encoded for
+            "images": [
+                [image.get("hash") or hashlib.sha256(image["base64"].encode()).hexdigest(), image.get("detail", "auto")]
+                for image in images
+            ],
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str, request_bytes: int = 0) -> Optional[dict]:
+        """Return the cached {"text", "prompt_tokens", "completion_tokens"} entry, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        entry = None
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                expires_at, entry = cached
+                if expires_at <= time.time():
+                    del self._memory[key]
+                    self._memory_bytes -= len(key) + len(entry["text"].encode())
+                    entry = None
+                else:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+        if entry is None:
+            stored = self._get_from_disk(key)
+            if stored is None:
+                self.stats["misses"] += 1
+                return None
+            entry, expires_at = stored
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry, expires_at)
+
+        self.stats["bytes_saved"] += request_bytes
+        self.stats["tokens_saved"] += entry["prompt_tokens"] + entry["completion_tokens"]
+        return entry
+
+    def set(self, key: str, text: str, usage: dict):
+        """Store a response in both tiers"""
+        if not self.enabled:
+            return
+
+        entry = {"text": text, "prompt_tokens": usage["prompt_tokens"], "completion_tokens": usage["completion_tokens"]}
+        now = time.time()
+        self._remember(key, entry, now + self.TTL_SECONDS)
+        response = json.dumps(entry)
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """,
+                    (key, response, len(response), now, now + self.TTL_SECONDS),
+                )
+                conn.commit()
+                self.stats["stores"] += 1
+        except Exception as e:
+            logger.error(f"LLM response cache save error: {str(e)}")
+
+    def close(self):
+        if self.enabled:
+            self.connections.close()
+
+    def get_stats(self) -> dict:
+        """Counters with the overall hit rate and the current size of the memory tier"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        with self._lock:
+            memory_entries, memory_bytes = len(self._memory), self._memory_bytes
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "memory_bytes": memory_bytes,
+        }
+
+    def _get_from_disk(self, key: str) -> Optional[tuple]:
+        """The stored entry and its expiry time, None when missing or expired"""
+        try:
+            with self.connections.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                if row[1] <= time.time():
+                    cursor.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                return json.loads(row[0]), row[1]
+        except Exception as e:
+            logger.error(f"LLM response cache read error: {str(e)}")
+            return None
+
+    def _remember(self, key: str, entry: dict, expires_at: float):
+        """Add an entry to the memory tier, evicting the least recently used entries to stay within its size"""
+        size = len(key) + len(entry["text"].encode())
+        if size > self.MAX_MEMORY_BYTES:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(key) + len(previous[1]["text"].encode())
+            self._memory[key] = (expires_at, entry)
+            self._memory_bytes += size
+            while self._memory_bytes > self.MAX_MEMORY_BYTES:
+                evicted_key, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted_key) + len(evicted["text"].encode())
+                self.stats["evictions"] += 1
@@ -1,13 +1,47 @@
+import asyncio
+import json
 import logging
 import os
-from typing import Optional
+import random
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
 
+import httpx
 import openai
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import IMAGES, LLM_REQUESTS, LLM_REQUESTS_IN_FLIGHT, TOKENS, stage_timer
+from app.services.image_service import ImageService
+from app.services.llm_cache import LLMResponseCache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+SUMMARY_PROMPT = """
+            You are expert at summarization of the pdf file content. 
+            Your goal is to provide a concise and informative summary of the document based on the text, tables and images input.
+            """
+CHUNK_PROMPT = """
+            You are expert at summarization of the pdf file content.
+            You are given one part of a longer document. Summarize the key points, facts, figures and tables of this part.
+            Your summary will be combined with the summaries of the other parts.
+            """
+REDUCE_PROMPT = """
+            You are expert at summarization of the pdf file content.
+            You are given summaries of consecutive parts of one document.
+            Combine them into a single concise and informative summary of the whole document.
+            """
+# Page and table sections produced by PDFService, e.g. "=== Page 3 ===" or "=== Table 1 on page 3 ==="
+SECTION_PATTERN = re.compile(r"(?m)^(?==== )")
+PAGE_NUMBER_PATTERN = re.compile(r"(?m)^=== (?:Page|Table \d+ on page) (\d+) ===")
+MODEL = "gpt-4o-2024-11-20"
+COMPLETION_PARAMS = {"max_tokens": 1000, "temperature": 0.1}
+# Rate limits and transient failures worth retrying
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
 
 class OpenAIService:
     def __init__(self, api_key: Optional[str] = None):
@@ -15,46 +49,359 @@ class OpenAIService:
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY")
 
-        self.client = openai.OpenAI(api_key=self.api_key)
+        # Retries are done here so they can honor Retry-After and share the in-flight request limit
+        self.MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "4"))
+        self.MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+        self.RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1.0"))  # seconds, doubled per attempt
+        self.RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30.0"))
+        self.REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60.0"))  # seconds per request attempt
+
+        # One connection pool shared by all requests, sized to the in-flight limit
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONCURRENT_REQUESTS,
+                max_keepalive_connections=self.MAX_CONCURRENT_REQUESTS,
+            ),
+            timeout=httpx.Timeout(self.REQUEST_TIMEOUT, connect=10.0),
+        )
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        self.response_cache = LLMResponseCache()
+        # Total budget for all images of one request, on top of the MAX_IMAGES count in PDFService
+        self.MAX_IMAGE_BYTES = int(os.getenv("OPENAI_MAX_IMAGE_BYTES", str(8 * 1024 * 1024)))
+        self.MAX_IMAGE_TOKENS = int(os.getenv("OPENAI_MAX_IMAGE_TOKENS", "20000"))
+        # Documents estimated above this many input tokens are summarized chunk by chunk and then combined
+        self.MAX_INPUT_TOKENS = int(os.getenv("OPENAI_MAX_INPUT_TOKENS", "60000"))
+        self.CHUNK_TOKENS = int(os.getenv("OPENAI_CHUNK_TOKENS", "12000"))
+        # Smaller chunks can't hold two partial summaries, so summarizing them again wouldn't shrink anything
+        if self.CHUNK_TOKENS < 2 * COMPLETION_PARAMS["max_tokens"]:
+            raise ValueError(f"OPENAI_CHUNK_TOKENS must be at least {2 * COMPLETION_PARAMS['max_tokens']}")
+        # Rounds of summarizing partial summaries again before they are combined as they are
+        self.MAX_SUMMARY_ROUNDS = 3
+        # Request payload and token usage counters
+        self.stats = {
+            "requests": 0,
+            "payload_bytes": 0,
+            "last_payload_bytes": 0,
+            "images_sent": 0,
+            "images_dropped": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "last_run_tokens": 0,
+            "retries": 0,
+        }
+
+    async def close(self):
+        """Close the shared connection pool and the response cache"""
+        await self.client.close()
+        self.response_cache.close()
 
-    def generate_summary(self, text: str, images: list[dict]) -> str:
-        """Generate a summary of the document"""
+    async def generate_summary(self, text: str, images: list[dict], force_refresh: bool = False) -> str:
+        """Generate a summary of the document, chunk by chunk if it doesn't fit the input budget
+
+        With force_refresh the model is asked again instead of answering from the response cache,
+        the new responses replace the cached ones.
+        """
         try:
-            developer_prompt = """
-            You are expert at summarization of the pdf file content. 
-            Your goal is to provide a concise and informative summary of the document based on the text, tables and images input.
-            """
-            content = [
-                {"type": "text", "text": f"Document to summarize:\n\n{text}"},
-                *(
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image["base64"]}"}}
-                    for image in images
-                ),
-            ]
-            messages = [
-                {"role": "developer", "content": developer_prompt},
-                {"role": "user", "content": content},
-            ]
-
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-11-20",
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.1,
+            developer_prompt, request_text, request_images, usage = await self._prepare_request(
+                text, images, force_refresh
             )
+            summary, request_usage = await self._complete(developer_prompt, request_text, request_images, force_refresh)
+            self._record_usage(usage, request_usage)
+            return summary
 
-            summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            raise self._summary_error(e)
 
-            return summary
+    async def stream_summary(self, text: str, images: list[dict], force_refresh: bool = False) -> AsyncIterator[str]:
+        """Generate the summary like generate_summary, yielding the text as the model produces it"""
+        try:
+            developer_prompt, request_text, request_images, usage = await self._prepare_request(
+                text, images, force_refresh
+            )
+            request_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            async for delta in self._stream_complete(
+                developer_prompt, request_text, request_images, request_usage, force_refresh
+            ):
+                yield delta
+            self._record_usage(usage, request_usage)
+
+        except Exception as e:
+            raise self._summary_error(e)
+
+    async def _prepare_request(
+        self, text: str, images: list[dict], force_refresh: bool = False
+    ) -> tuple[str, str, list[dict], dict]:
+        """Build the final summary request, summarizing the chunks of long documents first"""
+        selected_images = ImageService.apply_budget(images, self.MAX_IMAGE_BYTES, self.MAX_IMAGE_TOKENS)
+        self.stats["images_sent"] += len(selected_images)
+        self.stats["images_dropped"] += len(images) - len(selected_images)
+        IMAGES.labels("sent").inc(len(selected_images))
+        IMAGES.labels("dropped").inc(len(images) - len(selected_images))
+
+        if self.estimate_tokens(text) <= self.MAX_INPUT_TOKENS:
+            usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            return SUMMARY_PROMPT, f"Document to summarize:\n\n{text}", selected_images, usage
 
-        except openai.RateLimitError:
+        combined, usage = await self._summarize_parts(text, selected_images, force_refresh)
+        return REDUCE_PROMPT, f"Summaries of the document parts, in document order:\n\n{combined}", [], usage
+
+    def _record_usage(self, *usages: dict):
+        prompt_tokens = sum(usage["prompt_tokens"] for usage in usages)
+        completion_tokens = sum(usage["completion_tokens"] for usage in usages)
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        TOKENS.labels("prompt").inc(prompt_tokens)
+        TOKENS.labels("completion").inc(completion_tokens)
+        self.stats["last_run_tokens"] = prompt_tokens + completion_tokens
+        logger.info(
+            f"Summary used {prompt_tokens + completion_tokens} tokens "
+            f"({prompt_tokens} prompt, {completion_tokens} completion)"
+        )
+
+    @staticmethod
+    def _summary_error(error: Exception) -> Exception:
+        """Log an OpenAI failure and convert it to the error reported to the caller"""
+        if isinstance(error, openai.RateLimitError):
             logger.error("Rate limit exceeded for OpenAI API")
-            raise Exception("Rate limit exceeded for OpenAI. Please try again later.")
+            return Exception("Rate limit exceeded for OpenAI. Please try again later.")
+        if isinstance(error, openai.APIError):
+            logger.error(f"OpenAI API error: {str(error)}")
+            return Exception(f"OpenAI service error: {str(error)}")
+        logger.error(f"Unexpected error while generating summary: {str(error)}")
+        return Exception(f"Summary generation error: {str(error)}")
 
-        except openai.APIError as e:
-            logger.error(f"OpenAI API error: {str(e)}")
-            raise Exception(f"OpenAI service error: {str(e)}")
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count of English text, about 4 characters per token"""
+        return len(text) // 4 + 1
 
-        except Exception as e:
-            logger.error(f"Unexpected error while generating summary: {str(e)}")
-            raise Exception(f"Summary generation error: {str(e)}")
+    def split_into_chunks(self, text: str, max_tokens: int) -> list[str]:
+        """Group the "=== ... ===" page and table sections into chunks of at most max_tokens"""
+        max_chars = max_tokens * 4
+        pieces = []
+        for section in SECTION_PATTERN.split(text):
+            if not section.strip():
+                continue
+            if len(section) <= max_chars:
+                pieces.append(section)
+                continue
+            # A single section larger than a chunk is cut at line boundaries
+            piece = ""
+            for line in section.splitlines(keepends=True):
+                while len(line) > max_chars:
+                    pieces.extend([piece, line[:max_chars]] if piece else [line[:max_chars]])
+                    piece, line = "", line[max_chars:]
+                if len(piece) + len(line) > max_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece += line
+            if piece:
+                pieces.append(piece)
+
+        chunks = []
+        for piece in pieces:
+            if chunks and len(chunks[-1]) + len(piece) <= max_chars:
+                chunks[-1] += piece
+            else:
+                chunks.append(piece)
+        return chunks
+
+    async def _summarize_parts(self, text: str, images: list[dict], force_refresh: bool = False) -> tuple[str, dict]:
+        """Summarize chunks concurrently and return the partial summaries to combine"""
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        chunks = self.split_into_chunks(text, self.CHUNK_TOKENS)
+        chunk_images = self._assign_images(chunks, images)
+        logger.info(f"Summarizing {len(chunks)} chunks of a {self.estimate_tokens(text)} token document")
+
+        # Partial summaries that still don't fit are summarized again, as long as every round reduces their number
+        for summary_round in range(1, self.MAX_SUMMARY_ROUNDS + 1):
+            results = await asyncio.gather(
+                *(
+                    self._complete(
+                        CHUNK_PROMPT, f"Part of the document to summarize:\n\n{chunk}", chunk_imgs, force_refresh
+                    )
+                    for chunk, chunk_imgs in zip(chunks, chunk_images)
+                )
+            )
+            for _, chunk_usage in results:
+                usage["prompt_tokens"] += chunk_usage["prompt_tokens"]
+                usage["completion_tokens"] += chunk_usage["completion_tokens"]
+
+            combined = "\n".join(
+                f"=== Part {part_num} of {len(results)} ===\n{partial}\n"
+                for part_num, (partial, _) in enumerate(results, 1)
+            )
+            if self.estimate_tokens(combined) <= self.MAX_INPUT_TOKENS or len(results) == 1:
+                break
+            chunks = self.split_into_chunks(combined, self.CHUNK_TOKENS)
+            if len(chunks) >= len(results) or summary_round == self.MAX_SUMMARY_ROUNDS:
+                logger.warning(f"Combining {len(results)} partial summaries that exceed the input budget")
+                break
+            chunk_images = [[] for _ in chunks]
+        return combined, usage
+
+    @staticmethod
+    def _assign_images(chunks: list[str], images: list[dict]) -> list[list[dict]]:
+        """Send each image with the first chunk that contains the page it appears on"""
+        chunk_pages = [{int(page) for page in PAGE_NUMBER_PATTERN.findall(chunk)} for chunk in chunks]
+        chunk_images = [[] for _ in chunks]
+        for image in images:
+            first_page = image.get("pages", [image.get("page")])[0]
+            chunk_index = next((index for index, pages in enumerate(chunk_pages) if first_page in pages), 0)
+            chunk_images[chunk_index].append(image)
+        return chunk_images
+
+    async def _complete(
+        self, developer_prompt: str, text: str, images: list[dict], force_refresh: bool = False
+    ) -> tuple[str, dict]:
+        """Send one chat completion request, or answer it from the cache, and return its text and token usage"""
+        messages = self._build_messages(developer_prompt, text, images)
+        payload_bytes = len(json.dumps(messages))
+        cache_key = self.response_cache.make_key(MODEL, COMPLETION_PARAMS, developer_prompt, text, images)
+        cached = None if force_refresh else await run_in_threadpool(self.response_cache.get, cache_key, payload_bytes)
+        if cached:
+            logger.info("Using cached model response")
+            LLM_REQUESTS.labels("cached").inc()
+            return cached["text"], {"prompt_tokens": 0, "completion_tokens": 0}
+
+        self._record_payload(payload_bytes, len(images))
+        response = await self._create_with_retries(model=MODEL, messages=messages, **COMPLETION_PARAMS)
+
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+            "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+        }
+        content = response.choices[0].message.content.strip()
+        await run_in_threadpool(self.response_cache.set, cache_key, content, usage)
+        return content, usage
+
+    async def _stream_complete(
+        self, developer_prompt: str, text: str, images: list[dict], usage: dict, force_refresh: bool = False
+    ) -> AsyncIterator[str]:
+        """Stream one chat completion, filling in usage once the last chunk arrives"""
+        messages = self._build_messages(developer_prompt, text, images)
+        payload_bytes = len(json.dumps(messages))
+        cache_key = self.response_cache.make_key(MODEL, COMPLETION_PARAMS, developer_prompt, text, images)
+        cached = None if force_refresh else await run_in_threadpool(self.response_cache.get, cache_key, payload_bytes)
+        if cached:
+            logger.info("Using cached model response")
+            LLM_REQUESTS.labels("cached").inc()
+            yield cached["text"]
+            return
+
+        self._record_payload(payload_bytes, len(images))
+        for attempt in range(self.MAX_RETRIES + 1):
+            # The request counts as in flight until the stream is consumed
+            async with self._semaphore:
+                error = None
+                try:
+                    with LLM_REQUESTS_IN_FLIGHT.track_inprogress(), stage_timer("llm"):
+                        try:
+                            stream = await self.client.chat.completions.create(
+                                model=MODEL,
+                                messages=messages,
+                                **COMPLETION_PARAMS,
+                                stream=True,
+                                stream_options={"include_usage": True},
+                                timeout=self.REQUEST_TIMEOUT,
+                            )
+                        except RETRYABLE_ERRORS as e:
+                            error = e
+                        else:
+                            # Errors after the first token are not retried, the text was already delivered
+                            parts = []
+                            async with stream:
+                                async for chunk in stream:
+                                    if chunk.usage:
+                                        usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                                        usage["completion_tokens"] = chunk.usage.completion_tokens
+                                    if chunk.choices and chunk.choices[0].delta.content:
+                                        parts.append(chunk.choices[0].delta.content)
+                                        yield chunk.choices[0].delta.content
+                except Exception:
+                    LLM_REQUESTS.labels("error").inc()
+                    raise
+                LLM_REQUESTS.labels("error" if error else "success").inc()
+                if not error:
+                    await run_in_threadpool(self.response_cache.set, cache_key, "".join(parts).strip(), usage)
+                    return
+            await self._backoff(error, attempt)
+
+    @staticmethod
+    def _build_messages(developer_prompt: str, text: str, images: list[dict]) -> list[dict]:
+        content = [
+            {"type": "text", "text": text},
+            *(
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{image.get("mime_type", "image/png")};base64,{image["base64"]}",
+                        "detail": image.get("detail", "auto"),
+                    },
+                }
+                for image in images
+            ),
+        ]
+        return [
+            {"role": "developer", "content": developer_prompt},
+            {"role": "user", "content": content},
+        ]
+
+    def _record_payload(self, payload_bytes: int, image_count: int):
+        self.stats["requests"] += 1
+        self.stats["payload_bytes"] += payload_bytes
+        self.stats["last_payload_bytes"] = payload_bytes
+        logger.info(f"Sending {payload_bytes} byte request with {image_count} images")
+
+    async def _create_with_retries(self, **params):
+        """Create a chat completion within the in-flight limit, retrying rate limits and transient errors"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                async with self._semaphore:
+                    with LLM_REQUESTS_IN_FLIGHT.track_inprogress(), stage_timer("llm"):
+                        response = await self.client.chat.completions.create(**params, timeout=self.REQUEST_TIMEOUT)
+            except RETRYABLE_ERRORS as e:
+                LLM_REQUESTS.labels("error").inc()
+                await self._backoff(e, attempt)
+            except Exception:
+                LLM_REQUESTS.labels("error").inc()
+                raise
+            else:
+                LLM_REQUESTS.labels("success").inc()
+                return response
+
+    async def _backoff(self, error: Exception, attempt: int):
+        """Wait before the next attempt, or re-raise the error once the retries are used up"""
+        if attempt == self.MAX_RETRIES:
+            raise error
+        # Called outside the semaphore so waiting requests don't block the others
+        delay = self._retry_delay(error, attempt)
+        self.stats["retries"] += 1
+        logger.warning(f"OpenAI request failed ({type(error).__name__}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Server requested delay from Retry-After, otherwise exponential backoff with full jitter"""
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after_ms = response.headers.get("retry-after-ms")
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after_ms:
+                    return min(float(retry_after_ms) / 1000, self.RETRY_MAX_DELAY)
+                if retry_after:
+                    return min(float(retry_after), self.RETRY_MAX_DELAY)
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    return min(max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0), self.RETRY_MAX_DELAY)
+                except (TypeError, ValueError):
+                    pass
+
+        return random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2**attempt))
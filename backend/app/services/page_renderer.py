@@ -0,0 +1,46 @@
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from app.services.pdfium_document import PDFIUM_LOCK
+
+
+class PageRenderer:
+    """Rasterizes a pdfplumber page at most once per resolution and crops regions out of the bitmap"""
+
+    def __init__(self, page):
+        self.page = page
+        self._bitmaps: Dict[int, Image.Image] = {}
+
+    def render(self, resolution: int) -> Image.Image:
+        """Return the bitmap of the whole page, rendering it on first use"""
+        if resolution not in self._bitmaps:
+            # pdfplumber renders with pdfium
+            with PDFIUM_LOCK:
+                self._bitmaps[resolution] = self.page.to_image(resolution=resolution).original
+        return self._bitmaps[resolution]
+
+    def pixel_box(self, bbox: Tuple[float, float, float, float], resolution: int) -> Optional[Tuple[int, int, int, int]]:
+        """Convert a (x0, top, x1, bottom) region in PDF points to bitmap pixels, clipped to the page"""
+        page_x0, page_top, page_x1, page_bottom = self.page.bbox
+        x0, top = max(bbox[0], page_x0), max(bbox[1], page_top)
+        x1, bottom = min(bbox[2], page_x1), min(bbox[3], page_bottom)
+        if x1 <= x0 or bottom <= top:
+            return None
+
+        scale = resolution / 72
+        return (
+            round((x0 - page_x0) * scale),
+            round((top - page_top) * scale),
+            round((x1 - page_x0) * scale),
+            round((bottom - page_top) * scale),
+        )
+
+    def crop(self, box: Tuple[int, int, int, int], resolution: int) -> Image.Image:
+        """Cut a pixel region returned by pixel_box out of the page bitmap"""
+        return self.render(resolution).crop(box)
+
+    def close(self):
+        for bitmap in self._bitmaps.values():
+            bitmap.close()
+        self._bitmaps.clear()
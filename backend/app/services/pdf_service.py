@@ -1,21 +1,144 @@
-import base64
+import csv
+import hashlib
 import logging
-from io import BytesIO
-from typing import Tuple, Dict
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from functools import partial
+from io import BytesIO, StringIO
+from operator import itemgetter
+from typing import Tuple, Dict, List, Optional, Union
 
 import pdfplumber
 
+from app.metrics import add_stage_time, stage_timer
+from app.services.image_service import ImageService
+from app.services.page_renderer import PageRenderer
+from app.services.pdfium_document import IMAGE_OBJECT, PATH_OBJECT, TEXT_OBJECT, PdfiumDocument
+from app.services.text_normalizer import TextNormalizer
+from app.services.upload_spool import PDF_SIGNATURE, SpooledUpload
+
 logger = logging.getLogger(__name__)
 
+# PDF bytes in memory, or an upload spooled to disk that is read through a memory map
+PDFSource = Union[bytes, SpooledUpload]
+
+# Accepted values of PDF_TABLE_STRATEGY and PDF_TEXT_ENGINE
+TABLE_STRATEGIES = ("lines", "text", "off")
+TEXT_ENGINES = ("auto", "pdfplumber", "pdfium")
+
+
+class PDFParseSession:
+    """Document handles shared by validation and extraction, each opened at most once
+
+    With the "pdfplumber" engine every page is read with pdfplumber. Otherwise pages are counted with pdfium,
+    and pdfplumber is only opened when a page needs its layout analysis.
+    """
+
+    def __init__(self, file_content: PDFSource, engine: str = "pdfplumber"):
+        self.file_content = file_content
+        self.engine = engine
+        self._stack = ExitStack()
+        self._pdf = None
+        self._pdfium = None
+
+    @property
+    def pdf(self):
+        """Open the document on first access and keep it open until the session is closed"""
+        if self._pdf is None:
+            if isinstance(self.file_content, SpooledUpload):
+                stream = self._stack.enter_context(self.file_content.open_buffer())
+            else:
+                stream = BytesIO(self.file_content)
+            self._pdf = self._stack.enter_context(pdfplumber.open(stream))
+        return self._pdf
+
+    @property
+    def pdfium(self) -> PdfiumDocument:
+        """Open the document with pdfium on first access, spooled uploads are read by pdfium from their file"""
+        if self._pdfium is None:
+            source = self.file_content.path if isinstance(self.file_content, SpooledUpload) else self.file_content
+            self._pdfium = self._stack.enter_context(PdfiumDocument(source))
+        return self._pdfium
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pdf.pages) if self.engine == "pdfplumber" else len(self.pdfium)
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        return (self.pdf if self.engine == "pdfplumber" else self.pdfium).metadata
+
+    def close(self):
+        self._stack.close()
+        self._pdf = None
+        self._pdfium = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 class PDFService:
     def __init__(self):
         self.MAX_FILE_SIZE = 52428800  # 50MB hardcoded limit
         self.MAX_PAGES = 100  # 100 pages hardcoded limit
         self.MAX_IMAGES = 20  # limit for image extraction
+        self.IMAGE_RESOLUTION = 300  # DPI used to render pages for image extraction
+        # Images smaller than this many pixels at IMAGE_RESOLUTION are skipped
+        self.MIN_IMAGE_PIXELS = int(os.getenv("PDF_MIN_IMAGE_PIXELS", "10000"))
+        self.image_service = ImageService()
+        self.text_normalizer = TextNormalizer()
+        # Documents with at least this many pages are extracted in parallel page shards, 0 disables sharding
+        self.PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "20"))
+        # Longer tables are cut in the prompt text, the extracted table data is kept whole
+        self.TABLE_MAX_ROWS = int(os.getenv("PDF_TABLE_MAX_ROWS", "60"))
+        self.TABLE_MAX_CHARS = int(os.getenv("PDF_TABLE_MAX_CHARS", "6000"))
+        # "lines" finds tables drawn with ruling lines, "text" also unruled tables from aligned columns, "off" none
+        self.TABLE_STRATEGY = os.getenv("PDF_TABLE_STRATEGY", "lines").lower()
+        if self.TABLE_STRATEGY not in TABLE_STRATEGIES:
+            raise ValueError(f"PDF_TABLE_STRATEGY must be one of {', '.join(TABLE_STRATEGIES)}")
+        # Gap between two cells of a row, in multiples of the font size, and rows needed to make a column
+        self.COLUMN_GAP_EM = 1.5
+        self.MIN_COLUMN_ROWS = 3
+        # "pdfplumber" reads every page with pdfplumber, "pdfium" only the text with pdfium, without tables and
+        # images, "auto" uses pdfium for pages without images or possible tables and pdfplumber for the others
+        self.TEXT_ENGINE = os.getenv("PDF_TEXT_ENGINE", "auto").lower()
+        if self.TEXT_ENGINE not in TEXT_ENGINES:
+            raise ValueError(f"PDF_TEXT_ENGINE must be one of {', '.join(TEXT_ENGINES)}")
+
+    def process_pdf(
+        self, file_content: PDFSource, filename: str, defer_min_pages: Optional[int] = None, image_detail: str = "auto"
+    ) -> Tuple[bool, str, Optional[Dict[str, any]]]:
+        """Validate and extract a PDF file, parsing the document only once
+
+        When the document has at least defer_min_pages pages, only page_count and metadata are returned
+        so the caller can extract the pages in parallel shards with extract_page_range.
+        """
+        with PDFParseSession(file_content, self.TEXT_ENGINE) as session:
+            is_valid, message = self.validate_pdf(file_content, filename, session=session)
+            if not is_valid:
+                return is_valid, message, None
 
-    def validate_pdf(self, file_content: bytes, filename: str) -> Tuple[bool, str]:
+            page_count = session.page_count
+            if defer_min_pages and page_count >= defer_min_pages:
+                return is_valid, message, {"page_count": page_count, "metadata": self._extract_metadata(session)}
+
+            return is_valid, message, self.extract_pdf_content(file_content, session=session, image_detail=image_detail)
+
+    def validate_pdf(
+        self, file_content: PDFSource, filename: str, session: Optional[PDFParseSession] = None
+    ) -> Tuple[bool, str]:
         """Validate PDF file"""
+        with stage_timer("validate"):
+            return self._validate_pdf(file_content, filename, session)
+
+    def _validate_pdf(
+        self, file_content: PDFSource, filename: str, session: Optional[PDFParseSession]
+    ) -> Tuple[bool, str]:
         try:
             # Check file size
             if len(file_content) > self.MAX_FILE_SIZE:
@@ -26,13 +149,15 @@ class PDFService:
                 return False, "Only PDF files are supported"
 
             # Check PDF file signature
-            if not file_content.startswith(b"%PDF-"):
+            header = file_content.header if isinstance(file_content, SpooledUpload) else file_content
+            if not header.startswith(PDF_SIGNATURE):
                 return False, "Invalid PDF file format"
 
             # Check if the file is readable
-            pdf_stream = BytesIO(file_content)
-            with pdfplumber.open(pdf_stream) as pdf:
-                page_count = len(pdf.pages)
+            with ExitStack() as stack:
+                if session is None:
+                    session = stack.enter_context(PDFParseSession(file_content, self.TEXT_ENGINE))
+                page_count = session.page_count
 
                 if page_count > self.MAX_PAGES:
                     return False, f"Too many pages. Maximum allowed: {self.MAX_PAGES}"
@@ -46,86 +171,277 @@ class PDFService:
             logger.error(f"PDF validation error: {str(e)}")
             return False, "Failed to read PDF file"
 
-    def extract_pdf_content(self, file_content: bytes) -> Dict[str, any]:
+    def extract_pdf_content(
+        self, file_content: PDFSource, session: Optional[PDFParseSession] = None, image_detail: str = "auto"
+    ) -> Dict[str, any]:
         """Extract text from PDF, including tables"""
         try:
-            pdf_stream = BytesIO(file_content)
-            extracted_data = {"text": "", "tables": [], "images": [], "page_count": 0, "metadata": {}}
-
-            with pdfplumber.open(pdf_stream) as pdf:
-                extracted_data["page_count"] = len(pdf.pages)
-
-                # Extract metadata
-                if pdf.metadata:
-                    extracted_data["metadata"] = {
-                        "title": pdf.metadata.get("Title", ""),
-                        "author": pdf.metadata.get("Author", ""),
-                        "subject": pdf.metadata.get("Subject", ""),
-                        "creator": pdf.metadata.get("Creator", ""),
-                    }
-
-                all_text = []
-
-                for page_num, page in enumerate(pdf.pages, 1):
-                    # Extract text
-                    page_text = page.extract_text()
-                    if page_text:
-                        all_text.append(f"=== Page {page_num} ===\n{page_text}\n")
-
-                    # Extract tables
-                    tables = page.extract_tables()
-                    if tables:
-                        for table_num, table in enumerate(tables, 1):
-                            extracted_data["tables"].append({"page": page_num, "table_num": table_num, "data": table})
-
-                            # Append table as text
-                            table_text = self._table_to_text(table)
-                            all_text.append(f"=== Table {table_num} on page {page_num} ===\n{table_text}\n")
-
-                    # Extract images
-                    images = page.images
-                    on_page_im = 0  # some files may have more than LIMIT images on page
-                    if images and len(extracted_data["images"]) < self.MAX_IMAGES:
-                        for img_index, img in enumerate(images, 1):
-                            if on_page_im == self.MAX_IMAGES:
-                                break
-                            # Crop image region
-                            cropped = page.crop((img["x0"], img["top"], img["x1"], img["bottom"]))
-                            pil_img = cropped.to_image(resolution=300).original
-
-                            # Convert to base64
-                            img_byte_arr = BytesIO()
-                            try:
-                                pil_img.save(img_byte_arr, format="PNG")
-                                img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-
-                                extracted_data["images"].append(
-                                    {"page": page_num, "image_num": img_index, "base64": img_base64}
-                                )
-                                on_page_im += 1
-                            finally:
-                                img_byte_arr.close()
-                                pil_img.close()
-
-                extracted_data["text"] = "\n".join(all_text)
-
-            return extracted_data
+            with ExitStack() as stack:
+                if session is None:
+                    session = stack.enter_context(PDFParseSession(file_content, self.TEXT_ENGINE))
+                page_count = session.page_count
+                pages = self._extract_pages(session, range(1, page_count + 1), image_detail)
+
+                return self.merge_pages(page_count, self._extract_metadata(session), pages)
 
         except Exception as e:
             logger.error(f"PDF text extraction error: {str(e)}")
             raise Exception(f"Failed to process PDF file: {str(e)}")
 
+    def extract_page_range(
+        self, file_content: PDFSource, first_page: int, last_page: int, image_detail: str = "auto"
+    ) -> List[Dict[str, any]]:
+        """Extract pages first_page..last_page (1-based, inclusive) from an independently opened document"""
+        try:
+            with PDFParseSession(file_content, self.TEXT_ENGINE) as session:
+                return self._extract_pages(session, range(first_page, last_page + 1), image_detail)
+
+        except Exception as e:
+            logger.error(f"PDF page range extraction error: {str(e)}")
+            raise Exception(f"Failed to process PDF file: {str(e)}")
+
+    def merge_pages(self, page_count: int, metadata: Dict[str, str], pages: List[Dict[str, any]]) -> Dict[str, any]:
+        """Combine per-page results in page order into the extracted document data
+
+        The ordered pages are kept under "pages" so they can be stored and merged again later. The page text is
+        normalized across the whole document, "text_stats" reports what that removed.
+        """
+        pages = sorted(pages, key=lambda page: page["page"])
+        page_texts, text_stats = self.text_normalizer.normalize([page["text"] for page in pages])
+        extracted_data = {
+            "text": "",
+            "tables": [],
+            "images": [],
+            "page_count": page_count,
+            "metadata": metadata,
+            "pages": pages,
+            "text_stats": text_stats,
+        }
+        all_text = []
+        previous_header, previous_page = None, None
+
+        for page, page_text in zip(pages, page_texts):
+            page_num = page["page"]
+            if page_text:
+                all_text.append(f"=== Page {page_num} ===\n{page_text}\n")
+
+            first_on_page = True
+            for table_num, table in enumerate(page["tables"], 1):
+                extracted_data["tables"].append({"page": page_num, "table_num": table_num, "data": table})
+
+                rows = self._clean_table(table)
+                if not rows:
+                    continue
+
+                # Tables split over pages repeat their header, send it once and drop repeats inside tables too.
+                # A table continues the previous one when it opens the page that follows the previous table's page.
+                header, body = rows[0], [row for row in rows[1:] if row != rows[0]]
+                continued = first_on_page and previous_page == page_num - 1 and header == previous_header
+                previous_header, previous_page, first_on_page = header, page_num, False
+                rows = body if continued else [header] + body
+                if rows:
+                    title = f"Table {table_num} on page {page_num}" + (" (continued)" if continued else "")
+                    all_text.append(f"=== {title} ===\n{self._table_to_text(rows)}\n")
+
+            # Deduplicate across the whole document, the image limit applies to distinct images
+            for image in page["images"]:
+                original = next(
+                    (kept for kept in extracted_data["images"] if self.image_service.is_same_image(kept, image)), None
+                )
+                if original:
+                    if page_num not in original["pages"]:
+                        original["pages"].append(page_num)
+                elif len(extracted_data["images"]) < self.MAX_IMAGES and "base64" in image:
+                    extracted_data["images"].append({**image, "pages": [page_num]})
+
+        extracted_data["text"] = "\n".join(all_text)
+        return extracted_data
+
+    @staticmethod
+    def _image_stream_hash(img) -> Optional[str]:
+        """Hash of the embedded image data, identical for every placement of the same image"""
+        stream = img.get("stream")
+        if stream is None:
+            return None
+        try:
+            return hashlib.sha256(stream.get_rawdata() or stream.get_data()).hexdigest()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _extract_metadata(session: PDFParseSession) -> Dict[str, str]:
+        metadata = session.metadata
+        if not metadata:
+            return {}
+
+        return {
+            "title": metadata.get("Title", ""),
+            "author": metadata.get("Author", ""),
+            "subject": metadata.get("Subject", ""),
+            "creator": metadata.get("Creator", ""),
+        }
+
+    def _layout_objects(self) -> Tuple[int, ...]:
+        """pdfium object types that send a page to pdfplumber, for its images and tables"""
+        if self.TEXT_ENGINE == "pdfium":
+            return ()
+        if self.TABLE_STRATEGY == "off":
+            return (IMAGE_OBJECT,)
+        if self.TABLE_STRATEGY == "text":
+            # Unruled tables are found in the text layout, so every page with text needs pdfplumber
+            return (IMAGE_OBJECT, TEXT_OBJECT)
+        return (IMAGE_OBJECT, PATH_OBJECT)
+
+    def _extract_pages(
+        self, session: PDFParseSession, page_numbers: range, image_detail: str = "auto"
+    ) -> List[Dict[str, any]]:
+        """Extract text, tables and images of the given pages"""
+        pages = []
+        encoded_images = []
+        # Seconds spent on each kind of content, recorded once for all pages
+        timings = {"extract_text": 0.0, "extract_tables": 0.0, "extract_images": 0.0}
+        layout_objects = self._layout_objects()
+
+        for page_num in page_numbers:
+            # Pages without images or possible tables only need their text, which pdfium reads natively
+            if self.TEXT_ENGINE != "pdfplumber":
+                started = time.perf_counter()
+                text = session.pdfium.page_text(page_num - 1, unless=layout_objects)
+                timings["extract_text"] += time.perf_counter() - started
+                if text is not None:
+                    pages.append({"page": page_num, "text": text, "tables": [], "images": []})
+                    continue
+
+            # Parsing the page objects is shared by table detection and text extraction, it counts as text
+            started = time.perf_counter()
+            page = session.pdf.pages[page_num - 1]
+            chars = page.chars
+            timings["extract_text"] += time.perf_counter() - started
+
+            # Extract tables first, their cells are sent as tables and left out of the page text
+            started = time.perf_counter()
+            tables = self._find_tables(page, chars)
+            page_data = {"page": page_num, "text": "", "tables": [table.extract() for table in tables], "images": []}
+            timings["extract_tables"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            text_page = page.filter(partial(self._outside_tables, [table.bbox for table in tables])) if tables else page
+            page_data["text"] = text_page.extract_text() or ""
+            timings["extract_text"] += time.perf_counter() - started
+
+            # Extract images, later images can't make it past the document-wide limit in merge_pages
+            started = time.perf_counter()
+            renderer = PageRenderer(page)
+            try:
+                for img_index, img in enumerate(page.images, 1):
+                    # Skip bullets, rules and other decorations
+                    box = renderer.pixel_box((img["x0"], img["top"], img["x1"], img["bottom"]), self.IMAGE_RESOLUTION)
+                    if box is None or (box[2] - box[0]) * (box[3] - box[1]) < self.MIN_IMAGE_PIXELS:
+                        continue
+
+                    image_data = {"page": page_num, "image_num": img_index, "hash": self._image_stream_hash(img)}
+                    page_data["images"].append(image_data)
+
+                    # Repeated logos, banners and watermarks are encoded once and referenced by hash
+                    if any(seen["hash"] == image_data["hash"] for seen in encoded_images):
+                        continue
+                    # Past the limit only exact repeats can still be matched, so don't render
+                    if len(encoded_images) == self.MAX_IMAGES:
+                        continue
+
+                    # Crop image region from the page bitmap, rendered once per page
+                    pil_img = renderer.crop(box, self.IMAGE_RESOLUTION)
+                    try:
+                        image_data["hash"] = image_data["hash"] or self.image_service.pixel_hash(pil_img)
+                        image_data["phash"] = self.image_service.perceptual_hash(pil_img)
+                        if any(self.image_service.is_same_image(seen, image_data) for seen in encoded_images):
+                            continue
+
+                        image_data.update(self.image_service.prepare(pil_img, image_detail))
+                        encoded_images.append(image_data)
+                    finally:
+                        pil_img.close()
+            finally:
+                renderer.close()
+            timings["extract_images"] += time.perf_counter() - started
+
+            pages.append(page_data)
+
+        for stage, seconds in timings.items():
+            add_stage_time(stage, seconds)
+        return pages
+
+    def _find_tables(self, page, chars: List[dict]) -> list:
+        """Tables of the page with the configured strategy, pages that can't hold one are skipped cheaply"""
+        if self.TABLE_STRATEGY == "off":
+            return []
+        if self.TABLE_STRATEGY == "text":
+            if not self._has_aligned_columns(chars):
+                return []
+            return page.find_tables({"vertical_strategy": "text", "horizontal_strategy": "text"})
+
+        if not self._has_ruling_lines(page.edges):
+            return []
+        return page.find_tables()
+
+    @staticmethod
+    def _has_ruling_lines(edges: List[dict]) -> bool:
+        """A ruled table needs at least two horizontal and two vertical lines or rectangle sides"""
+        horizontal = sum(1 for edge in edges if edge["orientation"] == "h")
+        return horizontal >= 2 and len(edges) - horizontal >= 2
+
+    def _has_aligned_columns(self, chars: List[dict]) -> bool:
+        """Whether cells separated by wide gaps start or end at the same position on MIN_COLUMN_ROWS rows"""
+        rows = defaultdict(list)
+        for char in chars:
+            rows[round(char["top"])].append(char)
+
+        # Positions are bucketed by 3 points, the default tolerance of pdfplumber's text strategy
+        columns = Counter()
+        for row in rows.values():
+            row.sort(key=itemgetter("x0"))
+            gapped = False
+            for previous, char in zip(row, row[1:]):
+                if char["x0"] - previous["x1"] > self.COLUMN_GAP_EM * previous["size"]:
+                    columns["start", round(char["x0"] / 3)] += 1
+                    columns["end", round(previous["x1"] / 3)] += 1
+                    gapped = True
+            if gapped:
+                # Right-aligned numbers in the last column only line up at their end
+                columns["end", round(row[-1]["x1"] / 3)] += 1
+
+        return any(count >= self.MIN_COLUMN_ROWS for count in columns.values())
+
+    @staticmethod
+    def _outside_tables(bboxes: List[Tuple[float, float, float, float]], obj: dict) -> bool:
+        """Page filter keeping every object except characters inside one of the table boxes"""
+        if obj.get("object_type") != "char":
+            return True
+        x = (obj["x0"] + obj["x1"]) / 2
+        y = (obj["top"] + obj["bottom"]) / 2
+        return not any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+
     @staticmethod
-    def _table_to_text(table) -> str:
-        """Convert table to plain text"""
-        if not table:
-            return ""
-
-        text_rows = []
-        for row in table:
-            if row:
-                # Replace None with empty string and join columns
-                clean_row = [str(cell) if cell is not None else "" for cell in row]
-                text_rows.append(" | ".join(clean_row))
-
-        return "\n".join(text_rows)
+    def _clean_table(table) -> List[List[str]]:
+        """Cells as single-line strings, without empty rows and columns"""
+        rows = [[" ".join(str(cell).split()) if cell is not None else "" for cell in row] for row in table or [] if row]
+        rows = [row for row in rows if any(row)]
+        if not rows:
+            return []
+
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        columns = [column for column in range(width) if any(row[column] for row in rows)]
+        return [[row[column] for column in columns] for row in rows]
+
+    def _table_to_text(self, rows: List[List[str]]) -> str:
+        """Convert table rows to CSV, cut after TABLE_MAX_ROWS rows or TABLE_MAX_CHARS characters"""
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for count, row in enumerate(rows):
+            if count == self.TABLE_MAX_ROWS or buffer.tell() >= self.TABLE_MAX_CHARS:
+                buffer.write(f"... {len(rows) - count} more rows\n")
+                break
+            writer.writerow(row)
+
+        return buffer.getvalue().rstrip("\n")
@@ -0,0 +1,60 @@
+import threading
+from typing import Collection, Dict, Optional, Union
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+# pdfium is not thread-safe, calls from extraction threads (PDF_WORKERS=0) must not overlap
+PDFIUM_LOCK = threading.RLock()
+
+TEXT_OBJECT = pdfium_c.FPDF_PAGEOBJ_TEXT
+PATH_OBJECT = pdfium_c.FPDF_PAGEOBJ_PATH
+IMAGE_OBJECT = pdfium_c.FPDF_PAGEOBJ_IMAGE
+
+
+class PdfiumDocument:
+    """Page count, metadata and page text from pdfium's native text layer
+
+    Many times faster than pdfplumber's layout analysis, but without tables or image positions.
+    """
+
+    def __init__(self, source: Union[bytes, str]):
+        """Open the document from its content or from the path of a file"""
+        with PDFIUM_LOCK:
+            self._pdf = pdfium.PdfDocument(source)
+
+    def __len__(self) -> int:
+        with PDFIUM_LOCK:
+            return len(self._pdf)
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        with PDFIUM_LOCK:
+            return self._pdf.get_metadata_dict(skip_empty=True)
+
+    def page_text(self, index: int, unless: Collection[int] = ()) -> Optional[str]:
+        """Text of the page at the 0-based index, None when the page holds an object of one of the unless types"""
+        with PDFIUM_LOCK:
+            page = self._pdf[index]
+            try:
+                # Objects inside form XObjects count as well
+                if unless and next(page.get_objects(filter=list(unless)), None) is not None:
+                    return None
+
+                textpage = page.get_textpage()
+                try:
+                    return "\n".join(textpage.get_text_range().splitlines())
+                finally:
+                    textpage.close()
+            finally:
+                page.close()
+
+    def close(self):
+        with PDFIUM_LOCK:
+            self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,150 @@
+import cProfile
+import logging
+import os
+import pstats
+import re
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME = re.compile(r"^(\d{8}T\d{6}\d{6}Z)_([\w-]+)\.prof$")
+
+
+class ProfileSession:
+    """Profiler of one request and the profiles returned by extraction workers while it ran"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.worker_stats: List[dict] = []
+
+
+class _WorkerStats:
+    """Profile stats returned by a worker process, in the form pstats.Stats loads"""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+
+
+def current_session() -> Optional[ProfileSession]:
+    """The profiling session of the request being handled, None when it is not profiled"""
+    return _session.get()
+
+
+def run_profiled(func: Callable[..., Any], *args) -> Tuple[Any, dict]:
+    """Run func under its own profiler, used in worker processes that the request profiler doesn't see"""
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = func(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+
+class ProfilerService:
+    """Opt-in cProfile profiles of single uploads, saved as pstats files tagged with the document id
+
+    cProfile can only run once per process and records every thread, so one request is profiled at a
+    time and the profile also contains whatever else the server did meanwhile.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+        self.MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "50"))  # older profiles are deleted
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def profile(self) -> AsyncIterator[Optional[ProfileSession]]:
+        """Profile the block, yields None when another request is already being profiled"""
+        if not self._lock.acquire(blocking=False):
+            logger.warning("Another request is being profiled, running this one without the profiler")
+            yield None
+            return
+
+        session = ProfileSession()
+        token = _session.set(session)
+        try:
+            session.profile.enable()
+        except ValueError as e:
+            # Another tool such as a debugger or coverage holds the profiling hooks
+            logger.warning(f"Could not start the profiler: {str(e)}")
+            _session.reset(token)
+            self._lock.release()
+            yield None
+            return
+
+        try:
+            yield session
+        finally:
+            session.profile.disable()
+            _session.reset(token)
+            self._lock.release()
+
+    async def save(self, session: ProfileSession, document_id: Optional[str]) -> Optional[str]:
+        """Write the profile of a finished session and return its name, None on error"""
+        return await run_in_threadpool(self._save, session, document_id)
+
+    def _save(self, session: ProfileSession, document_id: Optional[str]) -> Optional[str]:
+        try:
+            stats = pstats.Stats(session.profile)
+            for worker_stats in session.worker_stats:
+                stats.add(_WorkerStats(worker_stats))
+
+            timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+            name = f"{timestamp}_{document_id or 'failed'}.prof"
+            os.makedirs(self.PROFILE_DIR, exist_ok=True)
+            stats.dump_stats(os.path.join(self.PROFILE_DIR, name))
+            logger.info(f"Saved profile {name}")
+
+            for old in self.list_profiles()[self.MAX_PROFILES :]:
+                os.remove(os.path.join(self.PROFILE_DIR, old["name"]))
+            return name
+        except Exception as e:
+            logger.error(f"Error saving profile: {str(e)}")
+            return None
+
+    def list_profiles(self) -> List[dict]:
+        """Saved profiles, newest first"""
+        try:
+            names = os.listdir(self.PROFILE_DIR)
+        except FileNotFoundError:
+            return []
+
+        profiles = []
+        for name in names:
+            match = PROFILE_NAME.match(name)
+            if not match:
+                continue
+            created_at = datetime.strptime(match.group(1), "%Y%m%dT%H%M%S%fZ").replace(tzinfo=timezone.utc)
+            document_id = match.group(2)
+            profiles.append(
+                {
+                    "name": name,
+                    "document_id": None if document_id == "failed" else document_id,
+                    "created_at": created_at.isoformat(),
+                    "size": os.path.getsize(os.path.join(self.PROFILE_DIR, name)),
+                }
+            )
+        profiles.sort(key=lambda profile: profile["name"], reverse=True)
+        return profiles
+
+    def get_profile_path(self, name: str) -> Optional[str]:
+        """Path of a saved profile, None for unknown names so that no other file can be read"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.PROFILE_DIR, name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,76 @@
+import logging
+import os
+import sqlite3
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class _ThreadConnection:
+    """Holder of a thread's connection, freed with the thread's locals when the thread exits"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _close_connection(conn: sqlite3.Connection):
+    try:
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error closing database connection: {str(e)}")
+
+
+class SQLiteConnections:
+    """One long-lived SQLite connection per thread, in WAL mode with tuned pragmas
+
+    A connection is closed when its thread exits, so threads the worker pool retires don't leave
+    connections open.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+        self.CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))  # prepared statements per connection
+        self._local = threading.local()
+        self._finalizers = []  # one per open connection, calling it closes the connection
+        self._lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use
+
+        Use it as `with connections.connect() as conn:` like sqlite3.connect, the block commits or
+        rolls back but leaves the connection open for the next call.
+        """
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # Only the owning thread uses the connection, other threads may close it on shutdown
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.BUSY_TIMEOUT_MS / 1000,
+                cached_statements=self.CACHED_STATEMENTS,
+                check_same_thread=False,
+            )
+            try:
+                # WAL lets readers run while a writer commits, NORMAL only syncs at checkpoints in WAL mode
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(f"PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}")
+            except Exception:
+                conn.close()
+                raise
+            holder = _ThreadConnection(conn)
+            finalizer = weakref.finalize(holder, _close_connection, conn)
+            finalizer.atexit = False
+            self._local.holder = holder
+            with self._lock:
+                self._finalizers = [f for f in self._finalizers if f.alive] + [finalizer]
+        return holder.conn
+
+    def close(self):
+        """Close the connections of all threads"""
+        with self._lock:
+            finalizers, self._finalizers = self._finalizers, []
+        for finalizer in finalizers:
+            finalizer()
+        self._local = threading.local()
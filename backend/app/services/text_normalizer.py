@@ -0,0 +1,122 @@
+import os
+import re
+from collections import Counter
+from itertools import islice
+from typing import Dict, List, Optional, Set, Tuple
+
+WHITESPACE = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+DIGITS = re.compile(r"\d+")
+ALPHANUMERIC = re.compile(r"[^\W_]")
+
+
+class TextNormalizer:
+    """Removes running headers, footers, page numbers and repeated disclaimers from extracted page text"""
+
+    def __init__(self):
+        self.enabled = os.getenv("TEXT_NORMALIZATION", "true").lower() in ("1", "true", "yes")
+        # Lines at most this far from the top or bottom of a page are compared by position
+        self.EDGE_LINES = 3
+        # A line is boilerplate when it repeats on at least this share of the pages, and on at least MIN_PAGES
+        self.MIN_SHARE = float(os.getenv("TEXT_BOILERPLATE_MIN_SHARE", "0.5"))
+        self.MIN_PAGES = 3
+        # Lines this long are boilerplate wherever they repeat on the page, such as multi-line disclaimers
+        self.MIN_BODY_LINE_CHARS = 40
+        # Pages with fewer letters and digits than this are left out after stripping
+        self.MIN_PAGE_CHARS = int(os.getenv("TEXT_MIN_PAGE_CHARS", "20"))
+
+    def normalize(self, texts: List[str]) -> Tuple[List[str], Dict[str, int]]:
+        """Return the cleaned text of every page, empty for dropped pages, and the size before and after"""
+        if not self.enabled:
+            tokens = self.estimate_tokens(texts)
+            stats = {"lines_removed": 0, "pages_dropped": 0, "tokens_before": tokens, "tokens_after": tokens}
+            return list(texts), stats
+
+        pages = [self._split_lines(text) for text in texts]
+        boilerplate = self._find_boilerplate(pages)
+
+        cleaned = []
+        stats = {"lines_removed": 0, "pages_dropped": 0}
+        seen = set()
+        for lines in pages:
+            kept = []
+            for index, line in enumerate(lines):
+                # The first copy of a repeated line stays, so the document title or disclaimer is still sent once
+                key = self._boilerplate_key(lines, index, boilerplate)
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                kept.append(line)
+            stats["lines_removed"] += len(lines) - len(kept)
+            cleaned.append("\n".join(kept))
+
+        # Near-empty pages are left out, unless every page is that short
+        if not all(self._is_near_empty(text) for text in cleaned):
+            for index, text in enumerate(cleaned):
+                if pages[index] and self._is_near_empty(text):
+                    stats["pages_dropped"] += 1
+                    cleaned[index] = ""
+
+        stats["tokens_before"] = self.estimate_tokens(texts)
+        stats["tokens_after"] = self.estimate_tokens(cleaned)
+        return cleaned, stats
+
+    @staticmethod
+    def estimate_tokens(texts: List[str]) -> int:
+        # Same rough 4 characters per token as OpenAIService.estimate_tokens
+        return sum(len(text) for text in texts) // 4
+
+    def _is_near_empty(self, text: str) -> bool:
+        # Stops counting letters and digits once there are enough
+        return sum(1 for _ in islice(ALPHANUMERIC.finditer(text), self.MIN_PAGE_CHARS)) < self.MIN_PAGE_CHARS
+
+    @staticmethod
+    def _split_lines(text: str) -> List[str]:
+        """Collapse runs of spaces and drop blank lines"""
+        lines = (WHITESPACE.sub(" ", line).strip() for line in text.splitlines())
+        return [line for line in lines if line]
+
+    def _line_key(self, line: str) -> str:
+        # Page numbers and dates change from page to page, so "Page 3 of 10" and "Page 4 of 10" are the same
+        # line. Long lines only match verbatim, sentences that differ in their numbers are content.
+        if len(line) >= self.MIN_BODY_LINE_CHARS:
+            return line.lower()
+        return DIGITS.sub("#", line.lower())
+
+    def _find_boilerplate(self, pages: List[List[str]]) -> Tuple[Set[Tuple[int, str]], Set[str]]:
+        """Lines repeated at the same distance from the page edge, and long lines repeated anywhere"""
+        text_pages = sum(1 for lines in pages if lines)
+        min_pages = max(self.MIN_PAGES, self.MIN_SHARE * text_pages)
+        if text_pages < min_pages:
+            return set(), set()
+
+        edge_counts = Counter()
+        body_counts = Counter()
+        for lines in pages:
+            edge_counts.update({(position, self._line_key(lines[position])) for position in self._edge_positions(lines)})
+            body_counts.update({self._line_key(line) for line in lines if len(line) >= self.MIN_BODY_LINE_CHARS})
+
+        return (
+            {key for key, count in edge_counts.items() if count >= min_pages},
+            {key for key, count in body_counts.items() if count >= min_pages},
+        )
+
+    def _edge_positions(self, lines: List[str]) -> Set[int]:
+        """Indexes from the top (0, 1, ...) and from the bottom (-1, -2, ...) of the lines near the edges"""
+        count = min(self.EDGE_LINES, len(lines))
+        return {*range(count), *range(-count, 0)}
+
+    def _boilerplate_key(self, lines: List[str], index: int, boilerplate: Tuple[set, set]) -> Optional[tuple]:
+        """The key under which the line repeats across pages, None when it is not boilerplate"""
+        edge_keys, body_keys = boilerplate
+        if not edge_keys and not body_keys:
+            return None
+
+        key = self._line_key(lines[index])
+        if key in body_keys:
+            return ("body", key)
+        from_bottom = index - len(lines)
+        for position in (index, from_bottom):
+            if -self.EDGE_LINES <= position < self.EDGE_LINES and (position, key) in edge_keys:
+                return (position, key)
+        return None
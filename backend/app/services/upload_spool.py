@@ -0,0 +1,240 @@
+import hashlib
+import io
+import logging
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+PDF_SIGNATURE = b"%PDF-"
+# Room for the multipart boundaries and part headers around the file in the request body
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """Upload refused while it was received, with a message that is safe to show to the client"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class MappedFile(io.RawIOBase):
+    """Read-only binary stream over a memory map, for parsers that expect a seekable file"""
+
+    def __init__(self, mapping: mmap.mmap):
+        super().__init__()
+        self._map = mapping
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        return self._map.read(-1 if size is None else size)
+
+    def readinto(self, buffer) -> int:
+        # Copy straight from the mapped pages into the caller's buffer
+        position = self._map.tell()
+        with memoryview(buffer) as target, memoryview(self._map) as source:
+            target = target.cast("B")
+            count = min(len(target), len(source) - position)
+            target[:count] = source[position : position + count]
+        self._map.seek(position + count)
+        return count
+
+
+class SpooledUpload:
+    """An uploaded file written to a temporary file as it arrived and hashed on the way
+
+    Only the path travels to the extraction workers, which read the file through a memory map.
+    """
+
+    def __init__(self, path: str, filename: str, size: int, content_hash: str, header: bytes):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.content_hash = content_hash
+        self.header = header  # first bytes of the file
+
+    @classmethod
+    def from_path(cls, path: str, filename: str, content_hash: str) -> "SpooledUpload":
+        """An upload spooled earlier and kept in the given file"""
+        with open(path, "rb") as file:
+            header = file.read(len(PDF_SIGNATURE))
+        return cls(path, filename, os.path.getsize(path), content_hash, header)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @contextmanager
+    def open_buffer(self) -> Iterator[MappedFile]:
+        """Map the file into memory, pages are read from the page cache instead of being copied into the heap"""
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            yield MappedFile(mapping)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def close(self):
+        """Delete the temporary file"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _UploadParser:
+    """Multipart callbacks that keep the data of the first PDF file field and check it as it arrives"""
+
+    def __init__(self, field: str, max_size: int):
+        self.field = field
+        self.max_size = max_size
+        self.filename: Optional[str] = None
+        self.size = 0
+        self.header = b""
+        self.complete = False
+        self.pending: List[bytes] = []  # received file data waiting to be written
+        self._sha256 = hashlib.sha256()
+        self._receiving = False
+        self._disposition = b""
+        self._header_field = b""
+        self._header_value = b""
+
+    @property
+    def content_hash(self) -> str:
+        return self._sha256.hexdigest()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        # Other form fields and any further files are ignored
+        self._receiving = name == self.field and b"filename" in options and self.filename is None
+        if not self._receiving:
+            return
+
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        if not self.filename.lower().endswith(".pdf"):
+            raise UploadRejected(400, "Only PDF files are supported")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._receiving:
+            return
+
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadRejected(400, f"The file is too large. Maximum size: {self.max_size // (1024*1024)}MB")
+
+        if len(self.header) < len(PDF_SIGNATURE):
+            self.header += chunk[: len(PDF_SIGNATURE) - len(self.header)]
+            if len(self.header) == len(PDF_SIGNATURE) and self.header != PDF_SIGNATURE:
+                raise UploadRejected(400, "Invalid PDF file format")
+
+        self._sha256.update(chunk)
+        self.pending.append(chunk)
+
+    def on_part_end(self):
+        if self._receiving:
+            self._receiving = False
+            self.complete = True
+
+
+class UploadSpooler:
+    """Streams a multipart upload to a temporary file, rejecting oversized and non-PDF files as they arrive"""
+
+    def __init__(self, max_size: int):
+        self.MAX_FILE_SIZE = max_size
+        # Directory of the temporary files, defaults to the system temporary directory
+        self.SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+    async def receive(self, request: Request, field: str = "file") -> SpooledUpload:
+        """Read the PDF file field of a multipart/form-data request into a temporary file"""
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadRejected(400, "Expected a multipart/form-data upload")
+
+        # Bodies that announce a size over the limit are refused before reading anything
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+            raise UploadRejected(400, f"The file is too large. Maximum size: {self.MAX_FILE_SIZE // (1024*1024)}MB")
+
+        upload = _UploadParser(field, self.MAX_FILE_SIZE)
+        parser = MultipartParser(options[b"boundary"], upload.callbacks())
+        fd, path = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=self.SPOOL_DIR)
+        try:
+            with os.fdopen(fd, "wb") as spool:
+                async for chunk in request.stream():
+                    parser.write(chunk)
+                    if upload.pending:
+                        await run_in_threadpool(spool.writelines, upload.pending)
+                        upload.pending.clear()
+                parser.finalize()
+        except MultipartParseError as e:
+            os.remove(path)
+            logger.warning(f"Invalid multipart upload: {str(e)}")
+            raise UploadRejected(400, "Invalid multipart upload")
+        except BaseException:
+            os.remove(path)
+            raise
+
+        if not upload.complete:
+            os.remove(path)
+            raise UploadRejected(400, f"No file in the '{field}' field")
+        if upload.header != PDF_SIGNATURE:
+            os.remove(path)
+            raise UploadRejected(400, "Invalid PDF file format")
+
+        return SpooledUpload(path, upload.filename, upload.size, upload.content_hash, upload.header)
@@ -0,0 +1,84 @@
+"""Compare per-call sqlite3.connect with the thread-local WAL connections of DatabaseService
+
+Each thread saves documents and reads history, ids and hashes in a loop, as concurrent uploads do.
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_database.py
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+THREAD_COUNTS = (1, 4, 8)
+ROUNDS_PER_THREAD = 200
+
+
+class PerCallConnections:
+    """The previous behaviour: a new connection with the default rollback journal for every call"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+    def close(self):
+        pass
+
+
+def make_service(directory: str, name: str, per_call: bool):
+    os.environ["DATABASE_PATH"] = os.path.join(directory, name)
+    from app.services.database_service import DatabaseService
+
+    service = DatabaseService()
+    if per_call:
+        service.close()
+        with sqlite3.connect(service.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        service.connections = PerCallConnections(service.db_path)
+    return service
+
+
+def run_workload(service, thread_count: int) -> float:
+    from app.models import DocumentSummary
+
+    def worker(worker_num: int):
+        for round_num in range(ROUNDS_PER_THREAD):
+            document = DocumentSummary(
+                filename=f"doc-{worker_num}-{round_num}.pdf",
+                summary="Summary text " * 50,
+                file_size=1024,
+                page_count=5,
+                content_hash=f"{worker_num}-{round_num}",
+            )
+            service.save_document_summary(document)
+            service.get_history(5)
+            service.get_document_by_id(document.id)
+            service.get_document_by_hash(document.content_hash)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        list(executor.map(worker, range(thread_count)))
+    elapsed = time.perf_counter() - started
+    return thread_count * ROUNDS_PER_THREAD * 4 / elapsed
+
+
+def main():
+    print(f"{'threads':>7}  {'per-call (ops/s)':>16}  {'pooled WAL (ops/s)':>18}  {'speedup':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for thread_count in THREAD_COUNTS:
+            per_call = make_service(directory, f"per-call-{thread_count}.db", per_call=True)
+            pooled = make_service(directory, f"pooled-{thread_count}.db", per_call=False)
+            per_call_rate = run_workload(per_call, thread_count)
+            pooled_rate = run_workload(pooled, thread_count)
+            pooled.close()
+            print(
+                f"{thread_count:>7}  {per_call_rate:>16.0f}  {pooled_rate:>18.0f}  {pooled_rate / per_call_rate:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the previous unindexed history query with keyset pages served from the upload date index
+
+Run from the repository root (pass a row count to change the table size):
+    PYTHONPATH=backend python benchmarks/bench_history.py [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROWS = 1_000_000
+PAGE_SIZE = 5
+PAGES = 200  # pages read one after another from the newest document
+SUMMARY = "Summary sentence of a processed document. " * 40
+REPEAT = 5
+
+
+def fill(service, rows: int):
+    started = datetime(2020, 1, 1)
+    preview = service.make_preview(SUMMARY)
+    with service.connections.connect() as conn:
+        conn.executemany(
+            """
+            INSERT INTO documents (id, filename, summary, upload_date, file_size, page_count, content_hash, preview)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                (
+                    str(uuid.uuid4()),
+                    f"doc-{row}.pdf",
+                    SUMMARY,
+                    (started + timedelta(seconds=row)).isoformat(),
+                    1024,
+                    5,
+                    None,
+                    preview,
+                )
+                for row in range(rows)
+            ),
+        )
+
+
+def best_of(func) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_PATH"] = os.path.join(directory, "history.db")
+        from app.services.database_service import DatabaseService
+
+        service = DatabaseService()
+        fill(service, rows)
+        conn = service.connections.connect()
+
+        def previous_query():
+            # Sorted the whole table and loaded full summaries to cut them to 200 characters in Python
+            rows = conn.execute(
+                """
+                SELECT id, filename, summary, upload_date, file_size, page_count
+                FROM documents NOT INDEXED
+                ORDER BY upload_date DESC
+                LIMIT 5
+            """
+            ).fetchall()
+            return [row[2][:200] + "..." if len(row[2]) > 200 else row[2] for row in rows]
+
+        def first_page():
+            service.get_history(PAGE_SIZE)
+
+        def deep_pages():
+            cursor = None
+            for _ in range(PAGES):
+                _, cursor = service.get_history(PAGE_SIZE, cursor)
+
+        print(f"{rows} documents")
+        print(f"previous first page:          {best_of(previous_query) * 1000:8.2f} ms")
+        print(f"keyset first page:            {best_of(first_page) * 1000:8.2f} ms")
+        print(f"keyset page {PAGES} (per page):    {best_of(deep_pages) / PAGES * 1000:8.2f} ms")
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare rendering every image region separately with cropping from one bitmap per page
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_page_render.py
+"""
+
+import time
+from io import BytesIO
+
+import pdfplumber
+
+from app.services.pdf_service import PDFParseSession, PDFService
+from pdf_factory import image_pdf
+
+PAGE_COUNT = 5
+IMAGES_PER_PAGE = (1, 4, 8, 16)
+REPEAT = 3
+
+
+def best_of(func, repeat: int = REPEAT) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def render_per_image(pdf_bytes: bytes, resolution: int = 300):
+    """Previous approach: crop the page and render the crop for every image"""
+    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+        for page in pdf.pages:
+            for img in page.images:
+                cropped = page.crop((img["x0"], img["top"], img["x1"], img["bottom"]))
+                cropped.to_image(resolution=resolution).original.close()
+
+
+def render_per_page(pdf_bytes: bytes, service: PDFService):
+    with PDFParseSession(pdf_bytes) as session:
+        service._extract_pages(session, range(1, session.page_count + 1))
+
+
+def main():
+    service = PDFService()
+    service.MAX_IMAGES = max(IMAGES_PER_PAGE) * PAGE_COUNT
+    print(f"{'images/page':>11}  {'per image (s)':>13}  {'per page (s)':>12}  {'speedup':>7}")
+    for images_per_page in IMAGES_PER_PAGE:
+        pdf_bytes = image_pdf(PAGE_COUNT, images_per_page=images_per_page, lines_per_page=0)
+
+        # The per-page number includes PNG encoding, the per-image number only rendering
+        per_image = best_of(lambda: render_per_image(pdf_bytes))
+        per_page = best_of(lambda: render_per_page(pdf_bytes, service))
+        print(f"{images_per_page:>11}  {per_image:>13.3f}  {per_page:>12.3f}  {per_image / per_page:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Latency and peak memory of validation, extraction and the whole upload for synthetic documents
+
+Every combination of document kind (text, tables, images) and page count is measured for three stages:
+validate_pdf, extract_pdf_content and POST /api/documents/upload. The upload runs against a local fake
+OpenAI server, so the numbers cover everything except the model itself. Timings are the minimum and
+median of --repeat runs. Memory is measured in one more run: the traced Python heap peak and the peak
+resident set size above the level before the stage.
+
+Extraction runs in threads by default, so the memory of every stage is measured in this process. Pass
+--workers to use the extraction process pool like production.
+
+Run from the repository root and write machine-readable results to diff between commits:
+    PYTHONPATH=backend python benchmarks/bench_pipeline.py --output before.json
+    PYTHONPATH=backend python benchmarks/bench_pipeline.py --output after.json
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from fake_llm import FakeLLMServer
+from pdf_factory import image_pdf, table_pdf, text_pdf
+
+DOCUMENT_KINDS = {"text": text_pdf, "tables": table_pdf, "images": image_pdf}
+PAGE_COUNTS = (10, 50, 100)
+REPEAT = 3
+
+
+class PeakMemory:
+    """Peak traced Python heap and peak resident set size above the starting level while the block runs"""
+
+    SAMPLE_INTERVAL = 0.002
+
+    def __enter__(self):
+        gc.collect()
+        self.baseline_rss = current_rss()
+        self.peak_rss = self.baseline_rss
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        tracemalloc.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _, self.peak_heap = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while self.baseline_rss is not None and not self._stop.wait(self.SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def results(self) -> dict:
+        rss = None if self.baseline_rss is None else round((self.peak_rss - self.baseline_rss) / 1048576, 2)
+        return {"peak_heap_mb": round(self.peak_heap / 1048576, 2), "peak_rss_mb": rss}
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def measure(func: Callable[[], None], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    with PeakMemory() as memory:
+        func()
+    return {
+        "min_s": round(min(timings), 4),
+        "median_s": round(statistics.median(timings), 4),
+        **memory.results(),
+    }
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout
+        status = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout
+        return {"commit": commit.strip(), "dirty": bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--kinds", default=",".join(DOCUMENT_KINDS), help="document kinds to measure")
+    parser.add_argument("--pages", default=",".join(map(str, PAGE_COUNTS)), help="page counts to measure")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per stage")
+    parser.add_argument("--workers", type=int, default=0, help="extraction worker processes, 0 runs in threads")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake model takes per request")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    kinds = args.kinds.split(",")
+    page_counts = [int(pages) for pages in args.pages.split(",")]
+
+    with FakeLLMServer(latency=args.llm_latency) as llm, tempfile.TemporaryDirectory() as directory:
+        # The services read their configuration when the app is imported
+        os.environ.update(
+            DATABASE_PATH=os.path.join(directory, "bench.db"),
+            OPENAI_API_KEY="bench-key",
+            OPENAI_BASE_URL=llm.base_url,
+            LLM_CACHE_ENABLED="false",
+            PDF_WORKERS=str(args.workers),
+        )
+        from fastapi.testclient import TestClient
+
+        from app.main import app
+        from app.routes.documents import pdf_service
+
+        # Per-request log lines would bury the results table
+        logging.disable(logging.INFO)
+
+        results = {}
+        print(
+            f"{'document':<12}  {'size (KB)':>9}  {'validate (s)':>12}  {'extract (s)':>11}  {'upload (s)':>10}  "
+            f"{'extract heap (MB)':>17}  {'upload heap (MB)':>16}  {'LLM calls':>9}"
+        )
+        with TestClient(app) as client:
+            for kind in kinds:
+                for page_count in page_counts:
+                    name = f"{kind}-{page_count}"
+                    pdf_bytes = DOCUMENT_KINDS[kind](page_count)
+                    filename = f"{name}.pdf"
+
+                    def upload():
+                        response = client.post(
+                            "/api/documents/upload?force_refresh=true",
+                            files={"file": (filename, pdf_bytes, "application/pdf")},
+                        )
+                        response.raise_for_status()
+
+                    validate = measure(lambda: pdf_service.validate_pdf(pdf_bytes, filename), args.repeat)
+                    extract = measure(lambda: pdf_service.extract_pdf_content(pdf_bytes), args.repeat)
+                    requests_before = llm.requests
+                    end_to_end = measure(upload, args.repeat)
+                    end_to_end["llm_requests"] = (llm.requests - requests_before) // (args.repeat + 1)
+
+                    results[name] = {
+                        "kind": kind,
+                        "pages": page_count,
+                        "bytes": len(pdf_bytes),
+                        "validate": validate,
+                        "extract": extract,
+                        "upload": end_to_end,
+                    }
+                    print(
+                        f"{name:<12}  {len(pdf_bytes) / 1024:>9.0f}  {validate['median_s']:>12.4f}  "
+                        f"{extract['median_s']:>11.3f}  {end_to_end['median_s']:>10.3f}  "
+                        f"{extract['peak_heap_mb']:>17.1f}  {end_to_end['peak_heap_mb']:>16.1f}  "
+                        f"{end_to_end['llm_requests']:>9}"
+                    )
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "llm_latency": args.llm_latency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write("\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
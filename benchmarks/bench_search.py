@@ -0,0 +1,97 @@
+"""Measure full-text search latency over stored summaries
+
+Builds a database of synthetic summaries, backfills the search index in one pass like an upgraded
+installation, then times common, rare, multi-word and prefix queries.
+
+Run from the repository root (pass a document count to change the table size):
+    PYTHONPATH=backend python benchmarks/bench_search.py [documents]
+"""
+
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+DOCUMENTS = 100_000
+WORDS_PER_SUMMARY = 120
+VOCABULARY_SIZE = 20_000
+RUNS = 50
+QUERIES = {
+    "common word": "w1",
+    "rare word": "w19990",
+    "two words": "w3 w40",
+    "prefix": "w12*",
+    "deep page": "w1",
+}
+
+
+def vocabulary_word(rng: random.Random) -> str:
+    # Zipf-like word frequencies, so low numbers are common and high numbers rare
+    return f"w{int(VOCABULARY_SIZE ** rng.random()) - 1}"
+
+
+def build_database(db_path: str, documents: int):
+    rng = random.Random(0)
+    started = datetime(2020, 1, 1)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            """
+            CREATE TABLE documents (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                upload_date TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                page_count INTEGER NOT NULL
+            )
+        """
+        )
+        conn.executemany(
+            "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    str(uuid.uuid4()),
+                    f"report-{row}.pdf",
+                    " ".join(vocabulary_word(rng) for _ in range(WORDS_PER_SUMMARY)),
+                    (started + timedelta(seconds=row)).isoformat(),
+                    1024,
+                    5,
+                )
+                for row in range(documents)
+            ),
+        )
+
+
+def main():
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else DOCUMENTS
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "search.db")
+        build_database(db_path, documents)
+
+        os.environ["DATABASE_PATH"] = db_path
+        from app.services.database_service import DatabaseService
+
+        started = time.perf_counter()
+        service = DatabaseService()
+        print(f"{documents} documents, index backfill took {time.perf_counter() - started:.1f} s")
+
+        print(f"{'query':<12}  {'results':>7}  {'p50 (ms)':>8}  {'p95 (ms)':>8}")
+        for name, query in QUERIES.items():
+            offset = 1000 if name == "deep page" else 0
+            timings = []
+            for _ in range(RUNS):
+                started = time.perf_counter()
+                results, _ = service.search_documents(query, limit=10, offset=offset)
+                timings.append((time.perf_counter() - started) * 1000)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f"{name:<12}  {len(results):>7}  {statistics.median(timings):>8.2f}  {p95:>8.2f}")
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compare separate validate_pdf + extract_pdf_content parses with the single-parse process_pdf
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_single_parse.py
+"""
+
+import time
+
+from app.services.pdf_service import PDFService
+from pdf_factory import text_pdf
+
+PAGE_COUNTS = (10, 50, 100)
+LINES_PER_PAGE = 10
+REPEAT = 3
+
+
+def best_of(func, repeat: int = REPEAT) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    service = PDFService()
+    print(f"{'pages':>5}  {'parse (s)':>9}  {'separate (s)':>12}  {'single (s)':>10}  {'saved (s)':>9}")
+    for page_count in PAGE_COUNTS:
+        pdf_bytes = text_pdf(page_count, lines_per_page=LINES_PER_PAGE)
+
+        def separate():
+            service.validate_pdf(pdf_bytes, "bench.pdf")
+            service.extract_pdf_content(pdf_bytes)
+
+        def single():
+            service.process_pdf(pdf_bytes, "bench.pdf")
+
+        # A standalone validation is the cost of the redundant parse
+        parse_time = best_of(lambda: service.validate_pdf(pdf_bytes, "bench.pdf"), repeat=10)
+        separate_time = best_of(separate)
+        single_time = best_of(single)
+        print(
+            f"{page_count:>5}  {parse_time:>9.4f}  {separate_time:>12.3f}  {single_time:>10.3f}  "
+            f"{separate_time - single_time:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Table detection time and recall with and without the pre-check that skips pages unlikely to hold a table
+
+For every document and strategy, runs pdfplumber's find_tables on every page and PDFService._find_tables,
+which only runs it on pages with ruling lines ("lines") or aligned columns ("text"). Page objects are parsed
+before timing, as text extraction needs them anyway. Recall is the share of the tables found on every page
+that are still found with the pre-check, on documents that have tables. On prose the "text" strategy takes
+paragraphs for tables, the pre-check leaving those out is intended.
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_table_detection.py
+"""
+
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pdfplumber
+
+from app.services.pdf_service import PDFService
+from pdf_factory import image_pdf, report_pdf, table_pdf, text_pdf
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+STRATEGIES = {"lines": None, "text": {"vertical_strategy": "text", "horizontal_strategy": "text"}}
+PAGE_COUNT = 20
+
+
+def documents() -> dict:
+    """Document name to its content and whether it has tables"""
+    docs = {path.name: (path.read_bytes(), path.name == "sample.pdf") for path in sorted(FIXTURES.glob("*.pdf"))}
+    docs.update(
+        {
+            "text": (text_pdf(PAGE_COUNT), False),
+            "report": (report_pdf(PAGE_COUNT), False),
+            "images": (image_pdf(PAGE_COUNT // 4), False),
+            "ruled tables": (table_pdf(PAGE_COUNT), True),
+            "unruled tables": (table_pdf(PAGE_COUNT, ruled=False), True),
+        }
+    )
+    return docs
+
+
+def timed(find_tables, pages) -> tuple:
+    started = time.perf_counter()
+    found = [{table.bbox for table in find_tables(page)} for page in pages]
+    return time.perf_counter() - started, found
+
+
+def main():
+    service = PDFService()
+    print(f"{'document':<16}  {'strategy':<8}  {'every page (ms)':>15}  {'pre-check (ms)':>14}  {'tables':>7}  {'recall':>6}")
+    for name, (data, has_tables) in documents().items():
+        with pdfplumber.open(BytesIO(data)) as pdf:
+            for page in pdf.pages:
+                page.objects
+
+            for strategy, settings in STRATEGIES.items():
+                service.TABLE_STRATEGY = strategy
+                every_seconds, every = timed(lambda page: page.find_tables(settings), pdf.pages)
+                checked_seconds, checked = timed(lambda page: service._find_tables(page, page.chars), pdf.pages)
+
+                total = sum(len(tables) for tables in every)
+                kept = sum(len(tables & found) for tables, found in zip(every, checked))
+                recall = f"{kept / total:.0%}" if has_tables and total else "-"
+                print(
+                    f"{name:<16}  {strategy:<8}  {every_seconds * 1000:>15.1f}  {checked_seconds * 1000:>14.1f}  "
+                    f"{kept:>3}/{total:<3}  {recall:>6}"
+                )
+
+
+if __name__ == "__main__":
+    main()
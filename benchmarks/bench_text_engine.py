@@ -0,0 +1,69 @@
+"""Extraction time of the pdfplumber, auto and pdfium text engines, and whether they read the same text
+
+Extracts every document with each PDF_TEXT_ENGINE. The text of "auto" is compared with pdfplumber's
+including tables, the text-only "pdfium" engine with pdfplumber's page text with table extraction off,
+as table cells stay in its page text. Text is compared apart from whitespace.
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_text_engine.py
+"""
+
+import os
+import time
+from pathlib import Path
+
+from app.services.pdf_service import PDFService
+from pdf_factory import image_pdf, report_pdf, table_pdf, text_pdf
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+ENGINES = ("pdfplumber", "auto", "pdfium")
+PAGE_COUNT = 50
+REPEAT = 3
+
+
+def documents() -> dict:
+    docs = {path.name: path.read_bytes() for path in sorted(FIXTURES.glob("*.pdf"))}
+    docs.update(
+        {
+            "text": text_pdf(PAGE_COUNT),
+            "report": report_pdf(PAGE_COUNT),
+            "tables": table_pdf(PAGE_COUNT),
+            "images": image_pdf(PAGE_COUNT // 5),
+        }
+    )
+    return docs
+
+
+def service(engine: str, table_strategy: str = "lines") -> PDFService:
+    os.environ["PDF_TEXT_ENGINE"] = engine
+    os.environ["PDF_TABLE_STRATEGY"] = table_strategy
+    return PDFService()
+
+
+def extract(pdf_service: PDFService, pdf_bytes: bytes) -> tuple:
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = pdf_service.extract_pdf_content(pdf_bytes)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result["text"].split()
+
+
+def main():
+    print(f"{'document':<12}  {'pdfplumber (s)':>14}  {'auto (s)':>8}  {'pdfium (s)':>10}  {'speedup':>7}  {'same text':>9}")
+    for name, pdf_bytes in documents().items():
+        timings = {}
+        texts = {}
+        for engine in ENGINES:
+            timings[engine], texts[engine] = extract(service(engine), pdf_bytes)
+        _, plain_text = extract(service("pdfplumber", table_strategy="off"), pdf_bytes)
+
+        same = texts["auto"] == texts["pdfplumber"] and texts["pdfium"] == plain_text
+        print(
+            f"{name:<12}  {timings['pdfplumber']:>14.3f}  {timings['auto']:>8.3f}  {timings['pdfium']:>10.3f}  "
+            f"{timings['pdfplumber'] / timings['auto']:>6.1f}x  {'yes' if same else 'no':>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
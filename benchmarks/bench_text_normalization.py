@@ -0,0 +1,39 @@
+"""Prompt tokens saved by removing running headers, footers and disclaimers, and what it costs
+
+Extracts report documents with a header, a two-line disclaimer and a page number on every page, and
+compares the estimated prompt tokens of the raw and the normalized text.
+
+Run from the repository root:
+    PYTHONPATH=backend python benchmarks/bench_text_normalization.py
+"""
+
+import time
+
+from app.services.pdf_service import PDFService
+from pdf_factory import report_pdf
+
+PAGE_COUNTS = (10, 50, 100)
+REPEAT = 5
+
+
+def main():
+    service = PDFService()
+    print(f"{'pages':>5}  {'raw tokens':>10}  {'normalized':>10}  {'saved':>6}  {'lines removed':>13}  {'merge (ms)':>10}")
+    for page_count in PAGE_COUNTS:
+        pages = service.extract_page_range(report_pdf(page_count), 1, page_count)
+
+        timings = []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            stats = service.merge_pages(page_count, {}, pages)["text_stats"]
+            timings.append(time.perf_counter() - started)
+
+        saved = 1 - stats["tokens_after"] / stats["tokens_before"]
+        print(
+            f"{page_count:>5}  {stats['tokens_before']:>10}  {stats['tokens_after']:>10}  {saved:>6.1%}  "
+            f"{stats['lines_removed']:>13}  {min(timings) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
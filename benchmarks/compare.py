@@ -0,0 +1,65 @@
+"""Compare two bench_pipeline.py result files and flag regressions
+
+Run from the repository root:
+    python benchmarks/compare.py before.json after.json [--threshold 0.10]
+
+A stage regressed when its median time or peak memory grew by more than the threshold, and by more than
+a small absolute amount so that noise on tiny numbers is ignored. Exits with status 1 on any regression.
+"""
+
+import argparse
+import json
+import sys
+
+STAGES = ("validate", "extract", "upload")
+# Metric, unit and the absolute change below which differences are treated as noise
+METRICS = (("median_s", "s", 0.005), ("peak_heap_mb", "MB", 1.0), ("peak_rss_mb", "MB", 2.0))
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+    print(f"{'document':<12}  {'stage':<8}  {'metric':<12}  {'before':>10}  {'after':>10}  {'change':>8}")
+
+    regressions = 0
+    for name in sorted(set(before["results"]) & set(after["results"])):
+        for stage in STAGES:
+            for metric, unit, noise in METRICS:
+                old = before["results"][name][stage].get(metric)
+                new = after["results"][name][stage].get(metric)
+                if old is None or new is None:
+                    continue
+
+                change = (new - old) / old if old else 0.0
+                flag = ""
+                if abs(new - old) > noise and abs(change) > args.threshold:
+                    if unit == "s":
+                        flag = "slower" if change > 0 else "faster"
+                    else:
+                        flag = "more memory" if change > 0 else "less memory"
+                    regressions += change > 0
+                print(
+                    f"{name:<12}  {stage:<8}  {metric:<12}  {old:>8.3f}{unit:<2}  {new:>8.3f}{unit:<2}  "
+                    f"{change:>+7.1%}  {flag}"
+                )
+
+    skipped = set(before["results"]) ^ set(after["results"])
+    if skipped:
+        print(f"Not in both files: {', '.join(sorted(skipped))}")
+    print(f"{regressions} regressions above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Local OpenAI-compatible chat completions server for benchmarks that must not call the real API"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY = "Fake summary of the benchmark document. " * 20
+
+
+class FakeLLMServer:
+    """Answer every chat completion with a fixed summary after an optional latency
+
+    Use as a context manager, base_url points the OpenAI client at the server.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.request_bytes = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                request = json.loads(body)
+                with server._lock:
+                    server.requests += 1
+                    server.request_bytes += len(body)
+                time.sleep(server.latency)
+
+                usage = {"prompt_tokens": len(body) // 4, "completion_tokens": len(SUMMARY) // 4}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if request.get("stream"):
+                    self._send_stream(usage)
+                    return
+
+                payload = json.dumps(
+                    {
+                        "id": "chatcmpl-bench",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": request["model"],
+                        "choices": [
+                            {"index": 0, "message": {"role": "assistant", "content": SUMMARY}, "finish_reason": "stop"}
+                        ],
+                        "usage": usage,
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_stream(self, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "fake"}
+                for word in SUMMARY.split(" "):
+                    choice = {"index": 0, "delta": {"content": word + " "}, "finish_reason": None}
+                    self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [choice]})}\n\n".encode())
+                self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
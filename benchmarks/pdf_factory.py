@@ -0,0 +1,203 @@
+"""Synthetic PDF documents for the benchmarks"""
+
+import random
+import zlib
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+WORDS = (
+    "revenue growth quarter market customer product analysis report strategy operating margin "
+    "segment forecast capital investment risk performance annual board results income expense "
+    "regional sales team pipeline budget target review summary outlook demand supply cost"
+).split()
+
+
+class PDFBuilder:
+    """Minimal PDF writer producing pages with Helvetica text and RGB images"""
+
+    def __init__(self):
+        self._objects = []
+        self._page_ids = []
+        self._images = {}
+        self._pages_id = self._reserve()
+        self._font_id = self._add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    def _reserve(self) -> int:
+        self._objects.append(b"")
+        return len(self._objects)
+
+    def _add(self, body: bytes) -> int:
+        self._objects.append(body)
+        return len(self._objects)
+
+    def _add_stream(self, data: bytes, extra: str = "") -> int:
+        return self._add(f"<< /Length {len(data)} {extra}>>\nstream\n".encode() + data + b"\nendstream")
+
+    def add_image(self, width: int, height: int, rgb: bytes) -> str:
+        """Register an RGB image XObject and return its resource name"""
+        name = f"Im{len(self._images) + 1}"
+        self._images[name] = self._add_stream(
+            zlib.compress(rgb),
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode ",
+        )
+        return name
+
+    def add_page(self, operations: list):
+        """Add a page drawn with the given content stream operations"""
+        content_id = self._add_stream("\n".join(operations).encode("latin-1"))
+        xobjects = " ".join(f"/{name} {object_id} 0 R" for name, object_id in self._images.items())
+        page_id = self._add(
+            (
+                f"<< /Type /Page /Parent {self._pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 {self._font_id} 0 R >> /XObject << {xobjects} >> >> "
+                f"/Contents {content_id} 0 R >>"
+            ).encode()
+        )
+        self._page_ids.append(page_id)
+
+    def build(self) -> bytes:
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._objects[self._pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode()
+        catalog_id = self._add(f"<< /Type /Catalog /Pages {self._pages_id} 0 R >>".encode())
+
+        output = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(self._objects, 1):
+            offsets.append(len(output))
+            output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+        xref_offset = len(output)
+        output += f"xref\n0 {len(self._objects) + 1}\n0000000000 65535 f \n".encode()
+        for offset in offsets:
+            output += f"{offset:010d} 00000 n \n".encode()
+        output += (
+            f"trailer\n<< /Size {len(self._objects) + 1} /Root {catalog_id} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF"
+        ).encode()
+        return bytes(output)
+
+
+def text_operations(lines: list, x: float = 72, top: float = 720, leading: float = 14) -> list:
+    """Content stream operations drawing lines of text"""
+    operations = ["BT", "/F1 11 Tf", f"{leading} TL", f"{x} {top} Td"]
+    for line in lines:
+        escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        operations.append(f"({escaped}) Tj T*")
+    operations.append("ET")
+    return operations
+
+
+def random_lines(rng: random.Random, count: int, words_per_line: int = 12) -> list:
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(count)]
+
+
+def text_pdf(page_count: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """Text-only document"""
+    rng = random.Random(seed)
+    builder = PDFBuilder()
+    for _ in range(page_count):
+        builder.add_page(text_operations(random_lines(rng, lines_per_page)))
+    return builder.build()
+
+
+def report_pdf(page_count: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """Text document with a running header, a disclaimer and a page number footer on every page"""
+    rng = random.Random(seed)
+    builder = PDFBuilder()
+    header = ["ACME Corporation - Annual Report 2025", "Internal use only"]
+    disclaimer = [
+        "This document contains confidential information and may not be distributed without written permission.",
+        "Figures are unaudited and subject to change before the final filing with the regulator.",
+    ]
+    for page in range(1, page_count + 1):
+        lines = header + [""] + random_lines(rng, lines_per_page) + [""] + disclaimer + [f"Page {page} of {page_count}"]
+        builder.add_page(text_operations(lines, top=750, leading=13))
+    return builder.build()
+
+
+def gradient_rgb(width: int, height: int, seed: int = 0) -> bytes:
+    """Photo-like RGB pixels that don't compress to nothing"""
+    rng = random.Random(seed)
+    pixels = bytearray()
+    for y in range(height):
+        for x in range(width):
+            pixels += bytes(((x * 255 // width + rng.randint(0, 20)) % 256, (y * 255 // height) % 256, seed * 40 % 256))
+    return bytes(pixels)
+
+
+def image_operations(name: str, count: int, size: float = 80, margin: float = 36) -> list:
+    """Content stream operations placing an image count times on a grid"""
+    per_row = int((PAGE_WIDTH - margin) // (size + margin))
+    operations = []
+    for index in range(count):
+        x = margin + (index % per_row) * (size + margin)
+        y = PAGE_HEIGHT - (index // per_row + 1) * (size + margin)
+        operations.append(f"q {size} 0 0 {size} {x} {y} cm /{name} Do Q")
+    return operations
+
+
+def image_pdf(page_count: int, images_per_page: int = 8, lines_per_page: int = 5, seed: int = 0) -> bytes:
+    """Image-heavy document with a short caption on every page"""
+    rng = random.Random(seed)
+    builder = PDFBuilder()
+    name = builder.add_image(96, 96, gradient_rgb(96, 96, seed))
+    for _ in range(page_count):
+        operations = image_operations(name, images_per_page)
+        operations += text_operations(random_lines(rng, lines_per_page), top=100)
+        builder.add_page(operations)
+    return builder.build()
+
+
+def table_operations(
+    rng: random.Random, top: float, rows: int, columns: int, row_height: float = 18, ruled: bool = True
+) -> list:
+    """Content stream operations drawing a table with a header row and numeric cells, ruled or only aligned"""
+    left, width = 54, PAGE_WIDTH - 108
+    column_width = width / columns
+    bottom = top - rows * row_height
+    operations = ["0.5 w"]
+    for row in range(rows + 1 if ruled else 0):
+        y = top - row * row_height
+        operations.append(f"{left} {y} m {left + width} {y} l S")
+    for column in range(columns + 1 if ruled else 0):
+        x = left + column * column_width
+        operations.append(f"{x:.2f} {top} m {x:.2f} {bottom} l S")
+
+    operations += ["BT", "/F1 9 Tf"]
+    for row in range(rows):
+        y = top - (row + 1) * row_height + 5
+        for column in range(columns):
+            if row == 0:
+                cell = rng.choice(WORDS).title()
+            elif column == 0:
+                cell = f"{rng.choice(WORDS)} {row}"
+            else:
+                cell = f"{rng.uniform(0, 100000):,.2f}"
+            operations.append(f"1 0 0 1 {left + column * column_width + 4:.2f} {y} Tm ({cell}) Tj")
+    operations.append("ET")
+    return operations
+
+
+def table_pdf(
+    page_count: int,
+    tables_per_page: int = 2,
+    rows: int = 12,
+    columns: int = 5,
+    lines_per_page: int = 5,
+    seed: int = 0,
+    ruled: bool = True,
+) -> bytes:
+    """Table-heavy document with ruled or unruled tables below a short paragraph on every page"""
+    rng = random.Random(seed)
+    builder = PDFBuilder()
+    table_height = rows * 18 + 36
+    for _ in range(page_count):
+        operations = text_operations(random_lines(rng, lines_per_page))
+        top = 720 - lines_per_page * 14 - 24
+        for _ in range(tables_per_page):
+            operations += table_operations(rng, top, rows, columns, ruled=ruled)
+            top -= table_height
+        builder.add_page(operations)
+    return builder.build()
@@ -35,6 +35,7 @@ export interface UploadResponse {
 
 export interface HistoryResponse {
   documents: DocumentHistory[];
+  next_cursor?: string | null;
 }
 
 export interface UploadState {
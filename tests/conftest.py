@@ -1,8 +1,10 @@
 import os
 import tempfile
+from io import BytesIO
 from pathlib import Path
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 
+import pypdfium2 as pdfium
 import pytest
 from fastapi.testclient import TestClient
 
@@ -10,6 +12,10 @@ from fastapi.testclient import TestClient
 os.environ["DATABASE_PATH"] = tempfile.mktemp(suffix=".db")
 os.environ["OPENAI_API_KEY"] = "test-key"
 os.environ["CORS_ORIGINS"] = "http://localhost:3000"
+# Run extraction in threads so patched service methods apply to API tests
+os.environ["PDF_WORKERS"] = "0"
+# Tests that cover the model response cache enable it on their own database
+os.environ["LLM_CACHE_ENABLED"] = "false"
 
 
 @pytest.fixture
@@ -25,6 +31,22 @@ def load_pdf_bytes():
     return _load_pdf
 
 
+@pytest.fixture
+def multi_page_pdf_bytes(load_pdf_bytes):
+    """Fixture to build a PDF by repeating the pages of a fixture file"""
+
+    def _build(filename: str, copies: int) -> bytes:
+        source = pdfium.PdfDocument(load_pdf_bytes(filename))
+        document = pdfium.PdfDocument.new()
+        for _ in range(copies):
+            document.import_pages(source)
+        buffer = BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
+
+    return _build
+
+
 @pytest.fixture
 def sample_pdf_bytes():
     """Fixture that provides sample PDF bytes"""
@@ -52,7 +74,8 @@ def mock_openai_client():
     mock_response = Mock()
     mock_response.choices = [Mock()]
     mock_response.choices[0].message.content = "Test summary"
-    mock_client.chat.completions.create.return_value = mock_response
+    mock_response.usage = Mock(prompt_tokens=100, completion_tokens=20)
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
     return mock_client
 
 
@@ -1,5 +1,10 @@
+import io
+import json
+import zipfile
 from unittest.mock import patch, Mock
 
+import pytest
+
 
 class TestDocumentEndpoints:
     def test_health_endpoint(self, test_client):
@@ -37,6 +42,236 @@ class TestDocumentEndpoints:
             assert "id" in data["data"]
             assert data["data"]["summary"] == "Test summary"
 
+    def test_upload_pdf_stream(self, test_client, sample_pdf_bytes):
+        """Test that the streaming upload sends stage, summary and done events"""
+
+        async def stream_summary(self, text, images, force_refresh=False):
+            for delta in ("Test", " summary"):
+                yield delta
+
+        with patch("app.services.pdf_service.PDFService.validate_pdf") as mock_validate, patch(
+            "app.services.pdf_service.PDFService.extract_pdf_content"
+        ) as mock_extract, patch("app.services.openai_service.OpenAIService.stream_summary", stream_summary), patch(
+            "app.services.database_service.DatabaseService.save_document_summary"
+        ) as mock_save:
+            mock_validate.return_value = (True, "OK")
+            mock_extract.return_value = {"text": "Sample text", "images": [], "page_count": 1}
+            mock_save.return_value = True
+
+            files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+            response = test_client.post("/api/documents/upload/stream?force_refresh=true", files=files)
+
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [
+                (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+                for block in response.text.strip().split("\n\n")
+            ]
+            assert [event for event, _ in events] == ["stage", "stage", "summary", "summary", "stage", "done"]
+            assert events[-1][1]["summary"] == "Test summary"
+            mock_save.assert_called_once()
+
+    def test_upload_pdf_rejected_while_receiving(self, test_client, invalid_pdf_bytes):
+        """Test that a file that is not a PDF is refused without being processed"""
+        with patch("app.services.document_processor.DocumentProcessor.process") as mock_process:
+            files = {"file": ("test.pdf", invalid_pdf_bytes, "application/pdf")}
+            response = test_client.post("/api/documents/upload", files=files)
+
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Invalid PDF file format"
+            mock_process.assert_not_called()
+
+    def test_upload_pdf_stream_invalid_file(self, test_client, invalid_pdf_bytes):
+        """Test that pipeline errors are sent as an error event"""
+        files = {"file": ("test.pdf", invalid_pdf_bytes, "application/pdf")}
+        response = test_client.post("/api/documents/upload/stream?force_refresh=true", files=files)
+
+        assert response.status_code == 200
+        assert "event: error" in response.text
+        assert '"status_code": 400' in response.text
+
+    def test_upload_pdf_cache_hit(self, test_client, sample_pdf_bytes):
+        """Test that a re-uploaded file returns the stored summary without processing"""
+        with patch("app.services.database_service.DatabaseService.get_document_by_hash") as mock_get_by_hash, patch(
+            "app.services.pdf_service.PDFService.extract_pdf_content"
+        ) as mock_extract, patch("app.services.openai_service.OpenAIService.generate_summary") as mock_summary:
+            mock_doc = Mock()
+            mock_doc.id = "cached-id"
+            mock_doc.filename = "test.pdf"
+            mock_doc.summary = "Cached summary"
+            mock_doc.upload_date.isoformat.return_value = "2023-01-01T00:00:00"
+            mock_doc.file_size = len(sample_pdf_bytes)
+            mock_doc.page_count = 1
+            mock_get_by_hash.return_value = mock_doc
+
+            files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+            response = test_client.post("/api/documents/upload", files=files)
+
+            assert response.status_code == 200
+            data = response.json()["data"]
+            assert data["id"] == "cached-id"
+            assert data["summary"] == "Cached summary"
+            assert data["cached"] is True
+            mock_extract.assert_not_called()
+            mock_summary.assert_not_called()
+
+    def test_upload_pdf_force_refresh_bypasses_cache(self, test_client, sample_pdf_bytes):
+        """Test that force_refresh skips the summary cache"""
+        with patch("app.services.database_service.DatabaseService.get_document_by_hash") as mock_get_by_hash, patch(
+            "app.services.pdf_service.PDFService.validate_pdf"
+        ) as mock_validate, patch("app.services.pdf_service.PDFService.extract_pdf_content") as mock_extract, patch(
+            "app.services.openai_service.OpenAIService.generate_summary"
+        ) as mock_summary, patch(
+            "app.services.database_service.DatabaseService.save_document_summary"
+        ) as mock_save:
+            mock_validate.return_value = (True, "OK")
+            mock_extract.return_value = {"text": "Sample text", "images": [], "page_count": 1}
+            mock_summary.return_value = "Fresh summary"
+            mock_save.return_value = True
+
+            files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+            response = test_client.post("/api/documents/upload?force_refresh=true", files=files)
+
+            assert response.status_code == 200
+            assert response.json()["data"]["summary"] == "Fresh summary"
+            assert response.json()["data"]["cached"] is False
+            mock_get_by_hash.assert_not_called()
+            saved_document = mock_save.call_args[0][0]
+            assert len(saved_document.content_hash) == 64
+
+    def test_upload_batch(self, test_client, load_pdf_bytes, invalid_pdf_bytes):
+        """Test that a batch expands ZIP archives and returns a result per PDF"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("reports/report.pdf", load_pdf_bytes("sample.pdf"))
+            zip_file.writestr("reports/broken.pdf", invalid_pdf_bytes)
+            zip_file.writestr("reports/notes.txt", "skipped")
+
+        with patch("app.services.openai_service.OpenAIService.generate_summary") as mock_summary, patch(
+            "app.services.database_service.DatabaseService.save_documents"
+        ) as mock_save:
+            mock_summary.return_value = "Test summary"
+            mock_save.return_value = True
+
+            files = [
+                ("files", ("reports.zip", archive.getvalue(), "application/zip")),
+                ("files", ("single.pdf", load_pdf_bytes("sample.pdf"), "application/pdf")),
+                ("files", ("corrupt.zip", b"not a zip", "application/zip")),
+            ]
+            response = test_client.post("/api/documents/upload/batch?force_refresh=true", files=files)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is False
+        results = {item["filename"]: item for item in data["data"]["results"]}
+        assert list(results) == ["reports/report.pdf", "reports/broken.pdf", "single.pdf", "corrupt.zip"]
+        assert results["reports/report.pdf"]["data"]["summary"] == "Test summary"
+        assert results["reports/broken.pdf"]["message"] == "Invalid PDF file format"
+        assert results["single.pdf"]["data"]["cached"] is True
+        assert results["corrupt.zip"]["message"] == "Invalid ZIP archive"
+        assert data["data"]["stats"]["failed"] == 2
+        mock_summary.assert_called_once()
+        assert len(mock_save.call_args[0][0]) == 1
+
+    def test_batch_rejects_oversized_pdf_before_reading(self):
+        """Test that a PDF part larger than the limit is rejected from its size without being read"""
+        from app.routes.documents import _batch_sources, pdf_service
+        from app.services.document_processor import DocumentProcessingError
+
+        upload = Mock(filename="large.pdf", size=pdf_service.MAX_FILE_SIZE + 1)
+
+        [(filename, load)] = list(_batch_sources([upload]))
+
+        assert filename == "large.pdf"
+        with pytest.raises(DocumentProcessingError, match="The file is too large"):
+            load()
+        upload.file.read.assert_not_called()
+
+    def test_metrics_endpoint(self, test_client, sample_pdf_bytes):
+        """Test that /metrics exposes the pipeline metrics after an upload"""
+        with patch("app.services.pdf_service.PDFService.validate_pdf") as mock_validate, patch(
+            "app.services.pdf_service.PDFService.extract_pdf_content"
+        ) as mock_extract, patch("app.services.openai_service.OpenAIService.generate_summary") as mock_summary, patch(
+            "app.services.database_service.DatabaseService.save_document_summary"
+        ) as mock_save:
+            mock_validate.return_value = (True, "OK")
+            mock_extract.return_value = {"text": "Sample text", "images": [], "page_count": 1}
+            mock_summary.return_value = "Test summary"
+            mock_save.return_value = True
+
+            files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+            test_client.post("/api/documents/upload?force_refresh=true", files=files)
+
+        response = test_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'pdf_summary_stage_duration_seconds_count{stage="extract"}' in response.text
+        assert 'pdf_summary_upload_duration_seconds_count{result="processed"}' in response.text
+        assert "pdf_summary_pages_total" in response.text
+
+    def test_upload_pdf_profiled(self, test_client, sample_pdf_bytes, tmp_path):
+        """Test that an upload with the X-Profile header saves a profile that can be listed and downloaded"""
+        with patch("app.routes.documents.profiler_service.enabled", True), patch(
+            "app.routes.documents.profiler_service.PROFILE_DIR", str(tmp_path)
+        ), patch("app.services.pdf_service.PDFService.validate_pdf") as mock_validate, patch(
+            "app.services.pdf_service.PDFService.extract_pdf_content"
+        ) as mock_extract, patch("app.services.openai_service.OpenAIService.generate_summary") as mock_summary, patch(
+            "app.services.database_service.DatabaseService.save_document_summary"
+        ) as mock_save:
+            mock_validate.return_value = (True, "OK")
+            mock_extract.return_value = {"text": "Sample text", "images": [], "page_count": 1}
+            mock_summary.return_value = "Test summary"
+            mock_save.return_value = True
+
+            files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+            response = test_client.post(
+                "/api/documents/upload?force_refresh=true", files=files, headers={"X-Profile": "true"}
+            )
+
+            assert response.status_code == 200
+            name = response.headers["X-Profile-Id"]
+            assert name.endswith(f"_{response.json()['data']['id']}.prof")
+
+            listing = test_client.get("/api/admin/profiles").json()["data"]["profiles"]
+            assert [profile["name"] for profile in listing] == [name]
+
+            download = test_client.get(f"/api/admin/profiles/{name}")
+            assert download.status_code == 200
+            assert download.content == (tmp_path / name).read_bytes()
+
+            assert test_client.get("/api/admin/profiles/unknown.prof").status_code == 404
+
+    def test_profiles_disabled(self, test_client):
+        """Test that the profile endpoints are unavailable unless profiling is enabled"""
+        response = test_client.get("/api/admin/profiles")
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Profiling is disabled"
+
+    def test_get_cache_stats(self, test_client):
+        """Test cache statistics endpoint"""
+        response = test_client.get("/api/documents/cache/stats")
+
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert {"hits", "misses", "bypassed", "hit_rate"} <= set(data)
+
+    def test_upload_pdf_invalid_detail(self, test_client, sample_pdf_bytes):
+        """Test that unknown image detail levels are rejected"""
+        files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+        response = test_client.post("/api/documents/upload?detail=ultra", files=files)
+
+        assert response.status_code == 422
+
+    def test_get_llm_stats(self, test_client):
+        """Test LLM request statistics endpoint"""
+        response = test_client.get("/api/documents/llm/stats")
+
+        assert response.status_code == 200
+        assert "payload_bytes" in response.json()["data"]
+        assert "hit_rate" in response.json()["data"]["response_cache"]
+
     def test_upload_pdf_validation_error(self, test_client, sample_pdf_bytes):
         """Test upload with PDF validation error"""
         with patch("app.services.pdf_service.PDFService.validate_pdf") as mock_validate:
@@ -77,27 +312,64 @@ class TestDocumentEndpoints:
 
     def test_get_history_success(self, test_client):
         """Test successful history retrieval"""
-        with patch("app.services.database_service.DatabaseService.get_last_5_documents") as mock_get:
+        with patch("app.services.database_service.DatabaseService.get_history") as mock_get:
             mock_doc = Mock()
             mock_doc.id = "test-id"
             mock_doc.filename = "test.pdf"
-            mock_doc.summary = "Short summary"
+            mock_doc.preview = "Short summary"
             mock_doc.upload_date.isoformat.return_value = "2023-01-01T00:00:00"
             mock_doc.file_size = 1024
             mock_doc.page_count = 1
 
-            mock_get.return_value = [mock_doc]
+            mock_get.return_value = ([mock_doc], "next-page")
 
-            response = test_client.get("/api/documents/history")
+            response = test_client.get("/api/documents/history?limit=1")
 
             assert response.status_code == 200
             data = response.json()
             assert data["success"] is True
             assert len(data["data"]["documents"]) == 1
+            assert data["data"]["documents"][0]["summary"] == "Short summary"
+            assert data["data"]["next_cursor"] == "next-page"
+            mock_get.assert_called_once_with(1, None)
+
+    def test_get_history_invalid_cursor(self, test_client):
+        """Test that a malformed cursor is a client error"""
+        response = test_client.get("/api/documents/history?cursor=not-a-cursor")
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+    def test_search_documents(self, test_client):
+        """Test search results and the next page offset"""
+        with patch("app.services.database_service.DatabaseService.search_documents") as mock_search:
+            mock_result = Mock()
+            mock_result.id = "test-id"
+            mock_result.filename = "test.pdf"
+            mock_result.snippet = "The <mark>budget</mark> report"
+            mock_result.upload_date.isoformat.return_value = "2023-01-01T00:00:00"
+            mock_result.file_size = 1024
+            mock_result.page_count = 1
+            mock_result.score = -1.5
+            mock_search.return_value = ([mock_result], True)
+
+            response = test_client.get("/api/documents/search?q=budget&limit=1&offset=2")
+
+            assert response.status_code == 200
+            data = response.json()["data"]
+            assert data["results"][0]["snippet"] == "The <mark>budget</mark> report"
+            assert data["next_offset"] == 3
+            mock_search.assert_called_once_with("budget", 1, 2)
+
+    def test_search_documents_requires_query(self, test_client):
+        """Test that an empty search query is rejected"""
+        response = test_client.get("/api/documents/search?q=")
+
+        assert response.status_code == 422
 
     def test_get_history_error(self, test_client):
         """Test history retrieval error returns generic message"""
-        with patch("app.services.database_service.DatabaseService.get_last_5_documents") as mock_get:
+        with patch("app.services.database_service.DatabaseService.get_history") as mock_get:
             mock_get.side_effect = Exception("Database connection failed")
 
             response = test_client.get("/api/documents/history")
@@ -135,3 +407,57 @@ class TestDocumentEndpoints:
 
             assert response.status_code == 404
             assert response.json()["detail"] == "Document not found"
+
+    def test_resummarize_document(self, test_client):
+        """Test summarizing a stored document again and the errors of a batch"""
+        with patch("app.routes.documents.document_processor.resummarize") as mock_resummarize:
+            mock_resummarize.return_value = {"id": "test-id", "summary": "Revised summary"}
+
+            response = test_client.post("/api/documents/test-id/resummarize")
+
+            assert response.status_code == 200
+            assert response.json()["data"]["summary"] == "Revised summary"
+
+        response = test_client.post("/api/documents/non-existing-id/resummarize")
+        assert response.status_code == 404
+
+        response = test_client.post("/api/documents/resummarize", json={"document_ids": ["non-existing-id"]})
+        assert response.status_code == 200
+        assert response.json()["success"] is False
+        assert response.json()["data"]["errors"][0]["status_code"] == 404
+
+        response = test_client.post("/api/documents/resummarize", json={"document_ids": []})
+        assert response.status_code == 422
+
+
+class TestJobEndpoints:
+    def test_submit_job(self, test_client, sample_pdf_bytes):
+        """Test that submitting a file returns a queued job immediately"""
+        files = {"file": ("test.pdf", sample_pdf_bytes, "application/pdf")}
+        response = test_client.post("/api/jobs", files=files)
+
+        assert response.status_code == 202
+        data = response.json()["data"]
+        assert data["status"] == "queued"
+
+        job_response = test_client.get(f"/api/jobs/{data['job_id']}")
+        assert job_response.status_code == 200
+        assert job_response.json()["data"]["status"] == "queued"
+        assert job_response.json()["data"]["filename"] == "test.pdf"
+
+    def test_submit_job_rejects_invalid_files(self, test_client, sample_pdf_bytes, invalid_pdf_bytes):
+        """Test that jobs are checked like synchronous uploads before they are queued"""
+        response = test_client.post("/api/jobs", files={"file": ("notes.txt", sample_pdf_bytes, "text/plain")})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Only PDF files are supported"
+
+        response = test_client.post("/api/jobs", files={"file": ("test.pdf", invalid_pdf_bytes, "application/pdf")})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid PDF file format"
+
+    def test_get_job_not_found(self, test_client):
+        """Test job not found"""
+        response = test_client.get("/api/jobs/non-existing-id")
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Job not found"
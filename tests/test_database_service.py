@@ -1,8 +1,10 @@
 import os
+import sqlite3
+from datetime import datetime, timedelta
 
 import pytest
 
-from app.models import DocumentSummary, DocumentHistory
+from app.models import DocumentSummary, DocumentPreview
 from app.services.database_service import DatabaseService
 
 
@@ -32,21 +34,79 @@ class TestDatabaseService:
         result = db_service.save_document_summary(document)
         assert result is True
 
-    def test_get_last_5_documents(self, temp_db_path, monkeypatch):
-        """Test retrieving last 5 documents"""
+    def test_get_history(self, temp_db_path, monkeypatch):
+        """Test retrieving the newest documents with their previews"""
         monkeypatch.setenv("DATABASE_PATH", temp_db_path)
         db_service = DatabaseService()
 
         # Save test documents
         for i in range(3):
             document = DocumentSummary(
-                filename=f"test{i}.pdf", summary=f"Test summary {i}", file_size=1024 + i, page_count=5 + i
+                filename=f"test{i}.pdf", summary=f"Test summary {i}" * (i * 10 + 1), file_size=1024 + i, page_count=5 + i
             )
             db_service.save_document_summary(document)
 
-        documents = db_service.get_last_5_documents()
+        documents, next_cursor = db_service.get_history(5)
         assert len(documents) == 3
-        assert all(isinstance(doc, DocumentHistory) for doc in documents)
+        assert next_cursor is None
+        assert all(isinstance(doc, DocumentPreview) for doc in documents)
+        assert [doc.filename for doc in documents] == ["test2.pdf", "test1.pdf", "test0.pdf"]
+        assert documents[0].preview == ("Test summary 2" * 21)[:200] + "..."
+        assert documents[2].preview == "Test summary 0"
+
+    def test_get_history_pages(self, temp_db_path, monkeypatch):
+        """Test that keyset pages cover every document once, including equal upload dates"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+        upload_date = datetime(2024, 1, 1)
+        saved = []
+        for i in range(7):
+            document = DocumentSummary(
+                filename=f"test{i}.pdf",
+                summary="Test summary",
+                file_size=1024,
+                page_count=1,
+                upload_date=upload_date if i < 4 else upload_date + timedelta(days=i),
+            )
+            db_service.save_document_summary(document)
+            saved.append(document.id)
+
+        pages = []
+        cursor = None
+        while True:
+            documents, cursor = db_service.get_history(3, cursor)
+            pages.append([doc.id for doc in documents])
+            if not cursor:
+                break
+
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert sorted(doc_id for page in pages for doc_id in page) == sorted(saved)
+
+        with pytest.raises(ValueError):
+            db_service.get_history(3, "not-a-cursor")
+
+    def test_history_query_uses_index(self, temp_db_path, monkeypatch):
+        """Test that history pages are read from the upload date index without sorting"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+
+        with sqlite3.connect(temp_db_path) as conn:
+            plan = conn.execute(
+                """
+                EXPLAIN QUERY PLAN
+                SELECT id, filename, preview, upload_date, file_size, page_count
+                FROM documents
+                WHERE (upload_date, id) < (?, ?)
+                ORDER BY upload_date DESC, id DESC
+                LIMIT 6
+            """,
+                ("2024-01-01T00:00:00", "id"),
+            ).fetchall()
+
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_documents_upload_date" in details
+        assert "TEMP B-TREE" not in details
+        db_service.close()
 
     def test_get_document_by_id_exists(self, temp_db_path, monkeypatch):
         """Test retrieving existing document by ID"""
@@ -69,6 +129,156 @@ class TestDatabaseService:
         retrieved = db_service.get_document_by_id("non-existing-id")
         assert retrieved is None
 
+    def test_get_document_by_hash(self, temp_db_path, monkeypatch):
+        """Test retrieving a document by its content hash"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+
+        document = DocumentSummary(
+            filename="test.pdf", summary="Test summary", file_size=1024, page_count=5, content_hash="abc123"
+        )
+        db_service.save_document_summary(document)
+
+        retrieved = db_service.get_document_by_hash("abc123")
+        assert retrieved is not None
+        assert retrieved.id == document.id
+        assert retrieved.content_hash == "abc123"
+        assert db_service.get_document_by_hash("unknown") is None
+
+    def test_init_migrates_table_without_content_hash(self, temp_db_path, monkeypatch):
+        """Test that an existing database gets the content_hash and preview columns and indexes"""
+        with sqlite3.connect(temp_db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    upload_date TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    page_count INTEGER NOT NULL
+                )
+            """
+            )
+            conn.execute(
+                "INSERT INTO documents VALUES ('old-id', 'old.pdf', ?, '2024-01-01T00:00:00', 1024, 1)", ("x" * 300,)
+            )
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+
+        db_service = DatabaseService()
+
+        with sqlite3.connect(temp_db_path) as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(documents)")]
+            indexes = [row[1] for row in conn.execute("PRAGMA index_list(documents)")]
+        assert "content_hash" in columns
+        assert "preview" in columns
+        assert "idx_documents_content_hash" in indexes
+        assert "idx_documents_upload_date" in indexes
+        documents, _ = db_service.get_history(5)
+        assert documents[0].preview == "x" * 200 + "..."
+
+    def test_document_pages_round_trip(self, temp_db_path, monkeypatch):
+        """Test that extracted pages are stored compressed and read back in page order"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+        pages = [
+            {"page": 2, "text": "Second page " * 100, "tables": [[["a", None]]], "images": []},
+            {"page": 1, "text": "First page", "tables": [], "images": [{"page": 1, "hash": "abc", "base64": "AAAA"}]},
+        ]
+        document = DocumentSummary(filename="test.pdf", summary="Old summary", file_size=1024, page_count=2)
+
+        assert db_service.save_document_summary(document, pages) is True
+
+        assert db_service.get_document_pages(document.id) == sorted(pages, key=lambda page: page["page"])
+        assert db_service.get_document_pages("non-existing-id") == []
+        with sqlite3.connect(temp_db_path) as conn:
+            stored_bytes = conn.execute("SELECT sum(length(data)) FROM document_pages").fetchone()[0]
+        assert stored_bytes < len("Second page " * 100)
+
+    def test_update_document_summary(self, temp_db_path, monkeypatch):
+        """Test that a replaced summary updates the preview and the search index"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+        document = DocumentSummary(filename="test.pdf", summary="Old summary", file_size=1024, page_count=1)
+        db_service.save_document_summary(document)
+
+        assert db_service.update_document_summary(document.id, "Revised summary") is True
+        assert db_service.update_document_summary("non-existing-id", "Revised summary") is False
+
+        assert db_service.get_document_by_id(document.id).summary == "Revised summary"
+        assert db_service.get_history(5)[0][0].preview == "Revised summary"
+        assert [result.id for result in db_service.search_documents("revised", 10)[0]] == [document.id]
+        assert db_service.search_documents("old", 10) == ([], False)
+
+    def test_search_documents(self, temp_db_path, monkeypatch):
+        """Test ranked full-text search with highlighted snippets and pagination"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+        summaries = {
+            "budget.pdf": "The annual budget report covers revenue and expenses.",
+            "revenue.pdf": "Quarterly revenue grew while the budget stayed flat.",
+            "travel.pdf": "Travel policy for employees.",
+        }
+        for filename, summary in summaries.items():
+            db_service.save_document_summary(
+                DocumentSummary(filename=filename, summary=summary, file_size=1024, page_count=1)
+            )
+
+        results, has_more = db_service.search_documents("budget", limit=1)
+        assert has_more is True
+        assert results[0].filename == "budget.pdf"  # filename matches rank first
+        assert "<mark>budget</mark>" in results[0].snippet
+
+        results, has_more = db_service.search_documents("budget", limit=1, offset=1)
+        assert [result.filename for result in results] == ["revenue.pdf"]
+        assert has_more is False
+
+        assert [result.filename for result in db_service.search_documents("revenues flat", 10)[0]] == ["revenue.pdf"]
+        assert [result.filename for result in db_service.search_documents("trav*", 10)[0]] == ["travel.pdf"]
+        assert db_service.search_documents('"budget', 10)[0][0].filename == "budget.pdf"  # FTS5 syntax is escaped
+        assert db_service.search_documents('budget ( -', 10)[0][0].filename == "budget.pdf"
+        assert db_service.search_documents("missing", 10) == ([], False)
+
+    def test_search_snippets_are_escaped(self, temp_db_path, monkeypatch):
+        """Test that HTML in a summary is escaped in the snippet and only the highlights are markup"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        db_service = DatabaseService()
+        summary = 'The budget <script>alert("x")</script> & <b>notes</b>.'
+        db_service.save_document_summary(DocumentSummary(filename="a.pdf", summary=summary, file_size=1, page_count=1))
+
+        results, _ = db_service.search_documents("budget", 10)
+
+        assert results[0].snippet == (
+            "The <mark>budget</mark> &lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; &amp; &lt;b&gt;notes&lt;/b&gt;."
+        )
+
+    def test_search_index_backfills_existing_documents(self, temp_db_path, monkeypatch):
+        """Test that documents saved before the search index existed are searchable"""
+        with sqlite3.connect(temp_db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    upload_date TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    page_count INTEGER NOT NULL
+                )
+            """
+            )
+            conn.execute(
+                "INSERT INTO documents VALUES ('old-id', 'old.pdf', 'Legacy invoice summary', '2024-01-01', 1024, 1)"
+            )
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+
+        db_service = DatabaseService()
+
+        results, _ = db_service.search_documents("invoice", 10)
+        assert [result.id for result in results] == ["old-id"]
+        assert db_service.rebuild_search_index() is True
+        assert len(db_service.search_documents("invoice", 10)[0]) == 1
+
     def test_database_error_handling(self, monkeypatch):
         """Test database error handling returns appropriate values"""
         monkeypatch.setenv("DATABASE_PATH", "/invalid/path/test.db")
@@ -0,0 +1,176 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.services.database_service import DatabaseService
+from app.services.document_processor import DocumentProcessor, DocumentProcessingError
+from app.services.extraction_pool import ExtractionPool
+from app.services.pdf_service import PDFService
+
+
+@pytest.fixture
+def mock_services():
+    openai_service = Mock()
+    openai_service.generate_summary = AsyncMock(return_value="Test summary")
+    db_service = Mock()
+    db_service.get_document_by_hash.return_value = None
+    db_service.save_document_summary.return_value = True
+    return openai_service, db_service
+
+
+class TestDocumentProcessor:
+    def test_process_reports_stages(self, load_pdf_bytes, mock_services):
+        """Test the pipeline on a real file with mocked summary and database"""
+        openai_service, db_service = mock_services
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+        stages = []
+
+        result = asyncio.run(processor.process(load_pdf_bytes("sample.pdf"), "sample.pdf", on_stage=stages.append))
+
+        assert result["summary"] == "Test summary"
+        assert result["page_count"] == 1
+        assert result["cached"] is False
+        assert stages == ["extracting", "summarizing", "saving"]
+        assert db_service.save_document_summary.call_args[0][0].content_hash is not None
+
+    def test_process_invalid_file(self, invalid_pdf_bytes, mock_services):
+        """Test that validation errors are raised as client errors"""
+        openai_service, db_service = mock_services
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+
+        with pytest.raises(DocumentProcessingError) as exc_info:
+            asyncio.run(processor.process(invalid_pdf_bytes, "test.pdf"))
+
+        assert exc_info.value.status_code == 400
+        assert exc_info.value.message == "Invalid PDF file format"
+        openai_service.generate_summary.assert_not_called()
+
+    def test_process_large_document_in_page_shards(self, multi_page_pdf_bytes, mock_services):
+        """Test that page-parallel extraction sends the same content to the summary"""
+        openai_service, db_service = mock_services
+        pdf_service = PDFService()
+        pdf_service.PARALLEL_MIN_PAGES = 3
+        pdf_bytes = multi_page_pdf_bytes("sample.pdf", 4)
+        pool = ExtractionPool(max_workers=2)
+        processor = DocumentProcessor(pdf_service, openai_service, db_service, pool)
+
+        try:
+            pool.start()
+            result = asyncio.run(processor.process(pdf_bytes, "sample.pdf"))
+        finally:
+            pool.shutdown()
+
+        assert result["page_count"] == 4
+        expected = pdf_service.extract_pdf_content(pdf_bytes)
+        openai_service.generate_summary.assert_called_once_with(expected["text"], expected["images"], force_refresh=False)
+
+    def test_process_stream_events(self, load_pdf_bytes, mock_services):
+        """Test that streaming yields stages, summary text and the saved document"""
+        openai_service, db_service = mock_services
+
+        async def stream_summary(text, images, force_refresh=False):
+            for delta in ("Streamed", " summary"):
+                yield delta
+
+        openai_service.stream_summary = stream_summary
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+
+        async def collect():
+            return [event async for event in processor.process_stream(load_pdf_bytes("sample.pdf"), "sample.pdf")]
+
+        events = asyncio.run(collect())
+
+        assert [event for event, _ in events] == ["stage", "stage", "summary", "summary", "stage", "done"]
+        assert [data["stage"] for event, data in events if event == "stage"] == ["extracting", "summarizing", "saving"]
+        assert events[-1][1]["summary"] == "Streamed summary"
+        assert db_service.save_document_summary.call_args[0][0].summary == "Streamed summary"
+
+    def test_resummarize_from_stored_pages(self, load_pdf_bytes, mock_services, temp_db_path, monkeypatch):
+        """Test that a stored document is summarized again with the same content and without parsing the PDF"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        openai_service, _ = mock_services
+        db_service = DatabaseService()
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+        document = asyncio.run(processor.process(load_pdf_bytes("sample.pdf"), "sample.pdf"))
+        openai_service.generate_summary.return_value = "Revised summary"
+
+        with patch("app.services.pdf_service.pdfplumber.open", side_effect=AssertionError("PDF parsed")):
+            result = asyncio.run(processor.resummarize(document["id"]))
+
+        first_call, second_call = openai_service.generate_summary.call_args_list
+        assert second_call.args == first_call.args
+        assert second_call.kwargs["force_refresh"] is True
+        assert result["summary"] == "Revised summary"
+        assert db_service.get_document_by_id(document["id"]).summary == "Revised summary"
+
+    def test_cache_hit_under_another_name(self, load_pdf_bytes, mock_services, temp_db_path, monkeypatch):
+        """Test that the same file under a new name gets the stored summary and its own history entry"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        openai_service, _ = mock_services
+        db_service = DatabaseService()
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+        pdf_bytes = load_pdf_bytes("sample.pdf")
+        first = asyncio.run(processor.process(pdf_bytes, "sample.pdf"))
+
+        copy = asyncio.run(processor.process(pdf_bytes, "copy.pdf"))
+        again = asyncio.run(processor.process(pdf_bytes, "copy.pdf"))
+
+        assert copy["filename"] == "copy.pdf"
+        assert copy["id"] != first["id"]
+        assert copy["summary"] == first["summary"]
+        assert copy["cached"] is True
+        assert again["id"] == copy["id"]
+        assert db_service.get_document_pages(copy["id"]) == db_service.get_document_pages(first["id"])
+        openai_service.generate_summary.assert_called_once()
+
+    def test_resummarize_many_collects_errors(self, mock_services):
+        """Test that a batch reports missing documents and documents without stored pages"""
+        openai_service, db_service = mock_services
+        stored = Mock(id="old-id", filename="old.pdf", summary="Old", file_size=1024, page_count=1)
+        db_service.get_document_by_id.side_effect = lambda doc_id: stored if doc_id == "old-id" else None
+        db_service.get_document_pages.return_value = []
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+
+        result = asyncio.run(processor.resummarize_many(["old-id", "missing-id", "old-id"]))
+
+        assert result["documents"] == []
+        assert result["errors"] == [
+            {"id": "old-id", "status_code": 409, "message": "No extracted pages stored for this document, upload it again"},
+            {"id": "missing-id", "status_code": 404, "message": "Document not found"},
+        ]
+        openai_service.generate_summary.assert_not_called()
+
+    def test_process_batch(self, load_pdf_bytes, invalid_pdf_bytes, mock_services, temp_db_path, monkeypatch):
+        """Test that a batch keeps going past failures, processes repeated files once and saves together"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        openai_service, _ = mock_services
+        db_service = DatabaseService()
+        processor = DocumentProcessor(PDFService(), openai_service, db_service, ExtractionPool(max_workers=0))
+        processor.BATCH_MAX_FILES = 3
+        pdf_bytes = load_pdf_bytes("sample.pdf")
+        sources = [
+            ("first.pdf", lambda: pdf_bytes),
+            ("broken.pdf", lambda: invalid_pdf_bytes),
+            ("copy.pdf", lambda: pdf_bytes),
+            ("extra.pdf", lambda: pdf_bytes),
+        ]
+
+        result = asyncio.run(processor.process_batch(sources))
+
+        first, broken, copy, extra = result["results"]
+        assert [item["filename"] for item in result["results"]] == ["first.pdf", "broken.pdf", "copy.pdf", "extra.pdf"]
+        assert first["success"] is True and first["data"]["cached"] is False
+        assert broken == {"filename": "broken.pdf", "success": False, "status_code": 400, "message": "Invalid PDF file format"}
+        assert copy["data"]["id"] == first["data"]["id"] and copy["data"]["cached"] is True
+        assert extra["message"] == "Too many files. Maximum per batch: 3"
+        openai_service.generate_summary.assert_called_once()
+        assert {key: result["stats"][key] for key in ("files", "processed", "cached", "failed", "pages")} == {
+            "files": 4,
+            "processed": 1,
+            "cached": 1,
+            "failed": 2,
+            "pages": 1,
+        }
+        assert [doc.id for doc in db_service.get_history(5)[0]] == [first["data"]["id"]]
+        assert db_service.get_document_pages(first["data"]["id"])
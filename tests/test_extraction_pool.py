@@ -0,0 +1,81 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services.extraction_pool import ExtractionPool
+from app.services.pdf_service import PDFService
+
+
+class TestExtractionPool:
+    def test_init_reads_worker_count_from_env(self, monkeypatch):
+        """Test that the pool size is configured with PDF_WORKERS"""
+        monkeypatch.setenv("PDF_WORKERS", "3")
+        assert ExtractionPool().max_workers == 3
+
+    def test_run_without_workers_uses_threads(self):
+        """Test that a pool with 0 workers runs the function in the current process"""
+        pool = ExtractionPool(max_workers=0)
+
+        result = asyncio.run(pool.run(os.getpid))
+
+        assert result == os.getpid()
+        pool.shutdown()
+
+    def test_run_in_worker_process(self, load_pdf_bytes):
+        """Test that PDF work runs in a separate pre-warmed worker process"""
+        pool = ExtractionPool(max_workers=1)
+        try:
+            pool.start()
+            worker_pid = asyncio.run(pool.run(os.getpid))
+            is_valid, message = asyncio.run(
+                pool.run(PDFService().validate_pdf, load_pdf_bytes("dummy.pdf"), "dummy.pdf")
+            )
+        finally:
+            pool.shutdown()
+
+        assert worker_pid != os.getpid()
+        assert is_valid is True
+        assert message == "OK"
+
+    def test_pool_recovers_from_dead_worker(self):
+        """Test that a worker exiting abruptly fails only its own request"""
+        pool = ExtractionPool(max_workers=1)
+        try:
+            pool.start()
+            with pytest.raises(BrokenProcessPool):
+                asyncio.run(pool.run(os._exit, 1))
+            worker_pid = asyncio.run(pool.run(os.getpid))
+        finally:
+            pool.shutdown()
+
+        assert worker_pid != os.getpid()
+
+    def test_event_loop_stays_responsive(self, load_pdf_bytes):
+        """Test that other coroutines keep running while extraction is in progress"""
+        pool = ExtractionPool(max_workers=1)
+        pdf_bytes = load_pdf_bytes("sample.pdf")
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.001)
+
+            ticker_task = asyncio.create_task(ticker())
+            result = await pool.run(PDFService().extract_pdf_content, pdf_bytes)
+            ticker_task.cancel()
+            return result, ticks
+
+        try:
+            pool.start()
+            result, ticks = asyncio.run(scenario())
+        finally:
+            pool.shutdown()
+
+        assert result["page_count"] == 1
+        assert ticks > 1
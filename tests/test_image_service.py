@@ -0,0 +1,89 @@
+import base64
+import random
+from io import BytesIO
+
+from PIL import Image
+
+from app.services.image_service import ImageService
+
+
+def noisy_image(width: int, height: int) -> Image.Image:
+    rng = random.Random(0)
+    return Image.frombytes("RGB", (width, height), bytes(rng.randrange(256) for _ in range(width * height * 3)))
+
+
+class TestImageService:
+    def test_prepare_high_detail_fits_tiling_limits(self):
+        """Test that high detail images fit into 2048px with the short side at most 768px"""
+        service = ImageService()
+
+        wide = service.prepare(Image.new("RGB", (3000, 1000), "white"), "high")
+        square = service.prepare(Image.new("RGB", (1600, 1600), "white"), "high")
+
+        assert (wide["width"], wide["height"]) == (2048, 683)
+        assert (square["width"], square["height"]) == (768, 768)
+
+    def test_prepare_low_detail(self):
+        """Test that low detail images are downsized to a single tile"""
+        service = ImageService()
+
+        result = service.prepare(Image.new("RGB", (1200, 600), "white"), "low")
+
+        assert (result["width"], result["height"]) == (512, 256)
+        assert result["detail"] == "low"
+        assert result["tokens"] == 85
+
+    def test_prepare_keeps_small_images(self):
+        """Test that images within the limits are not resized"""
+        result = ImageService().prepare(Image.new("RGB", (300, 200), "white"))
+
+        assert (result["width"], result["height"]) == (300, 200)
+        assert result["tokens"] == 85 + 170
+
+    def test_prepare_chooses_format(self):
+        """Test PNG for flat graphics and JPEG for photo-like content"""
+        service = ImageService()
+
+        chart = service.prepare(Image.new("RGB", (200, 200), "blue"))
+        photo = service.prepare(noisy_image(200, 200))
+
+        assert chart["mime_type"] == "image/png"
+        assert photo["mime_type"] == "image/jpeg"
+        decoded = Image.open(BytesIO(base64.b64decode(photo["base64"])))
+        assert decoded.format == "JPEG"
+        assert photo["bytes"] == len(base64.b64decode(photo["base64"]))
+
+    def test_prepare_webp_photos(self, monkeypatch):
+        """Test that WebP can be configured for photos"""
+        monkeypatch.setenv("IMAGE_PHOTO_FORMAT", "webp")
+
+        result = ImageService().prepare(noisy_image(100, 100))
+
+        assert result["mime_type"] == "image/webp"
+
+    def test_apply_budget(self):
+        """Test that images are kept in order while they fit the byte and token budget"""
+        images = [
+            {"base64": "a", "bytes": 600, "tokens": 255},
+            {"base64": "b", "bytes": 600, "tokens": 255},
+            {"base64": "c", "bytes": 300, "tokens": 85},
+        ]
+
+        assert ImageService.apply_budget(images, max_bytes=1000, max_tokens=10000) == [images[0], images[2]]
+        assert ImageService.apply_budget(images, max_bytes=10000, max_tokens=300) == [images[0]]
+
+    def test_perceptual_hash_matches_resampled_copy(self):
+        """A resized copy of an image is the same image, a different image is not"""
+        service = ImageService()
+        original = Image.linear_gradient("L").rotate(90).convert("RGB")
+        resized = original.resize((128, 128))
+        flipped = original.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+        first = {"hash": service.pixel_hash(original), "phash": service.perceptual_hash(original)}
+        second = {"hash": service.pixel_hash(resized), "phash": service.perceptual_hash(resized)}
+        third = {"hash": service.pixel_hash(flipped), "phash": service.perceptual_hash(flipped)}
+
+        assert first["hash"] != second["hash"]
+        assert service.is_same_image(first, second)
+        assert not service.is_same_image(first, third)
+        assert not service.is_same_image({"hash": "a"}, {"hash": "b", "phash": first["phash"]})
@@ -0,0 +1,217 @@
+import asyncio
+import os
+from unittest.mock import AsyncMock, Mock
+
+from app.services.document_processor import DocumentProcessingError
+from app.services.job_runner import JobRunner
+from app.services.job_service import JobService
+from app.services.upload_spool import SpooledUpload
+
+
+def spooled_upload(tmp_path, content: bytes = b"%PDF-1.4 content") -> SpooledUpload:
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(content)
+    return SpooledUpload(str(path), "test.pdf", len(content), "hash", content[:5])
+
+
+class TestJobService:
+    def test_create_and_get_job(self, temp_db_path, monkeypatch):
+        """Test that a submitted job is stored as queued"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+
+        job = job_service.create_job("test.pdf", b"%PDF-1.4")
+
+        retrieved = job_service.get_job(job.id)
+        assert retrieved is not None
+        assert retrieved.status == "queued"
+        assert retrieved.filename == "test.pdf"
+        assert job_service.get_job("non-existing-id") is None
+
+    def test_claim_next_job_in_order(self, temp_db_path, monkeypatch):
+        """Test that jobs are claimed oldest first with their file content"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+
+        first = job_service.create_job("first.pdf", b"first")
+        job_service.create_job("second.pdf", b"second")
+
+        job, file_content = job_service.claim_next_job()
+        assert job.id == first.id
+        assert file_content == b"first"
+        assert job_service.get_job(first.id).status == "running"
+
+        job_service.claim_next_job()
+        assert job_service.claim_next_job() is None
+
+    def test_spooled_upload_is_kept_as_file(self, temp_db_path, monkeypatch, tmp_path):
+        """Test that a spooled upload is moved next to the queue instead of stored in the database"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        monkeypatch.setenv("JOB_FILE_DIR", str(tmp_path / "jobs"))
+        job_service = JobService()
+        upload = spooled_upload(tmp_path)
+
+        job = job_service.create_job("test.pdf", upload)
+
+        assert not os.path.exists(upload.path)
+        claimed_job, file_content = job_service.claim_next_job()
+        assert claimed_job.id == job.id
+        assert isinstance(file_content, SpooledUpload)
+        assert os.path.dirname(file_content.path) == str(tmp_path / "jobs")
+        assert file_content.read() == b"%PDF-1.4 content"
+        assert file_content.content_hash == "hash"
+        assert file_content.header == b"%PDF-"
+
+    def test_job_with_missing_file_fails(self, temp_db_path, monkeypatch, tmp_path):
+        """Test that a job whose file is gone is marked failed and the next job is claimed"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        monkeypatch.setenv("JOB_FILE_DIR", str(tmp_path / "jobs"))
+        job_service = JobService()
+        missing = job_service.create_job("missing.pdf", spooled_upload(tmp_path))
+        next_job = job_service.create_job("next.pdf", b"%PDF-1.4 content")
+        os.remove(tmp_path / "jobs" / f"{missing.id}.pdf")
+
+        claimed_job, file_content = job_service.claim_next_job()
+
+        assert claimed_job.id == next_job.id
+        assert file_content == b"%PDF-1.4 content"
+        failed = job_service.get_job(missing.id)
+        assert failed.status == "failed"
+        assert failed.error == "The uploaded file is missing or unreadable"
+        assert job_service.claim_next_job() is None
+
+    def test_running_jobs_are_leased(self, temp_db_path, monkeypatch):
+        """Test that another process only claims a running job once its lease has expired"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job = JobService().create_job("test.pdf", b"content")
+        first = JobService()
+        first.claim_next_job()
+
+        # Another service instance stands in for a second process sharing the queue
+        other = JobService()
+        other.OWNER = "other-host:1"
+        assert other.claim_next_job() is None
+        assert first.renew_lease(job.id) is True
+
+        first.LEASE_SECONDS = 0
+        first.renew_lease(job.id)
+        claimed_job, file_content = other.claim_next_job()
+        assert claimed_job.id == job.id
+        assert file_content == b"content"
+        assert first.renew_lease(job.id) is False
+
+    def test_release_jobs(self, temp_db_path, monkeypatch):
+        """Test that a stopping process puts only its own running jobs back in the queue"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+        job = job_service.create_job("test.pdf", b"content")
+        job_service.create_job("other.pdf", b"content")
+        job_service.claim_next_job()
+        other = JobService()
+        other.OWNER = "other-host:1"
+        other_job, _ = other.claim_next_job()
+
+        assert job_service.release_jobs() == 1
+
+        assert job_service.get_job(job.id).status == "queued"
+        assert job_service.get_job(other_job.id).status == "running"
+
+    def test_complete_job_stores_result(self, temp_db_path, monkeypatch):
+        """Test that a completed job keeps its result"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+        job = job_service.create_job("test.pdf", b"content")
+
+        job_service.update_stage(job.id, "summarizing")
+        assert job_service.get_job(job.id).stage == "summarizing"
+
+        job_service.complete_job(job.id, {"summary": "Test summary"})
+
+        retrieved = job_service.get_job(job.id)
+        assert retrieved.status == "completed"
+        assert retrieved.stage is None
+        assert retrieved.result == {"summary": "Test summary"}
+
+
+class TestJobRunner:
+    def test_run_next_job_success(self, temp_db_path, monkeypatch):
+        """Test that the runner processes a job and reports its stages"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+        job = job_service.create_job("test.pdf", b"content", force_refresh=True, image_detail="low")
+        stages = []
+
+        async def fake_process(file_content, filename, force_refresh=False, on_stage=None, image_detail="auto"):
+            await on_stage("extracting")
+            stages.append(job_service.get_job(job.id).stage)
+            return {"id": "doc-id", "summary": "Test summary"}
+
+        processor = Mock()
+        processor.process = AsyncMock(side_effect=fake_process)
+        runner = JobRunner(job_service, processor, max_workers=1)
+
+        assert asyncio.run(runner.run_next_job()) is True
+        assert asyncio.run(runner.run_next_job()) is False
+
+        assert stages == ["extracting"]
+        assert processor.process.call_args.kwargs["force_refresh"] is True
+        assert processor.process.call_args.kwargs["image_detail"] == "low"
+        retrieved = job_service.get_job(job.id)
+        assert retrieved.status == "completed"
+        assert retrieved.result["summary"] == "Test summary"
+
+    def test_run_next_job_deletes_file(self, temp_db_path, monkeypatch, tmp_path):
+        """Test that the file of a finished job is deleted"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        monkeypatch.setenv("JOB_FILE_DIR", str(tmp_path / "jobs"))
+        job_service = JobService()
+        job_service.create_job("test.pdf", spooled_upload(tmp_path))
+
+        processor = Mock()
+        processor.process = AsyncMock(return_value={"summary": "Test summary"})
+        runner = JobRunner(job_service, processor, max_workers=1)
+
+        assert asyncio.run(runner.run_next_job()) is True
+        assert os.listdir(tmp_path / "jobs") == []
+
+    def test_run_next_job_failures(self, temp_db_path, monkeypatch):
+        """Test that client errors are kept and unexpected errors are sanitized"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+        invalid_job = job_service.create_job("invalid.pdf", b"content")
+        broken_job = job_service.create_job("broken.pdf", b"content")
+
+        processor = Mock()
+        processor.process = AsyncMock(
+            side_effect=[DocumentProcessingError(400, "Invalid PDF file format"), Exception("Detailed error")]
+        )
+        runner = JobRunner(job_service, processor, max_workers=1)
+
+        asyncio.run(runner.run_next_job())
+        asyncio.run(runner.run_next_job())
+
+        assert job_service.get_job(invalid_job.id).status == "failed"
+        assert job_service.get_job(invalid_job.id).error == "Invalid PDF file format"
+        assert job_service.get_job(broken_job.id).error == "Error processing file"
+
+    def test_workers_drain_queue(self, temp_db_path, monkeypatch):
+        """Test that started workers pick up submitted jobs"""
+        monkeypatch.setenv("DATABASE_PATH", temp_db_path)
+        job_service = JobService()
+        jobs = [job_service.create_job(f"test{i}.pdf", b"content") for i in range(3)]
+
+        processor = Mock()
+        processor.process = AsyncMock(return_value={"summary": "Test summary"})
+        runner = JobRunner(job_service, processor, max_workers=2)
+
+        async def scenario():
+            runner.start()
+            for _ in range(100):
+                if all(job_service.get_job(job.id).status == "completed" for job in jobs):
+                    break
+                await asyncio.sleep(0.01)
+            await runner.stop()
+
+        asyncio.run(scenario())
+
+        assert all(job_service.get_job(job.id).status == "completed" for job in jobs)
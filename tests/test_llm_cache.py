@@ -0,0 +1,90 @@
+import pytest
+
+from app.services.llm_cache import LLMResponseCache
+
+
+@pytest.fixture
+def cache(temp_db_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    return LLMResponseCache(db_path=temp_db_path)
+
+
+USAGE = {"prompt_tokens": 100, "completion_tokens": 20}
+
+
+class TestLLMResponseCache:
+    def test_key_ignores_whitespace_and_uses_image_hashes(self):
+        """Test that the key normalizes text and identifies images by content hash"""
+        params = {"max_tokens": 1000, "temperature": 0.1}
+        key = LLMResponseCache.make_key("model", params, "Prompt", "Some  text\n", [{"hash": "a", "base64": "x"}])
+
+        assert key == LLMResponseCache.make_key("model", params, " Prompt", "Some text", [{"hash": "a", "base64": "y"}])
+        assert key != LLMResponseCache.make_key("model", params, "Prompt", "Other text", [{"hash": "a"}])
+        assert key != LLMResponseCache.make_key("other", params, "Prompt", "Some text", [{"hash": "a"}])
+        assert key != LLMResponseCache.make_key("model", {"max_tokens": 500}, "Prompt", "Some text", [{"hash": "a"}])
+        assert key != LLMResponseCache.make_key("model", params, "Prompt", "Some text", [{"hash": "b"}])
+
+    def test_memory_and_disk_tiers(self, cache, temp_db_path):
+        """Test that a response is served from memory, and from disk after a restart"""
+        cache.set("key", "Cached summary", USAGE)
+
+        assert cache.get("key", request_bytes=500)["text"] == "Cached summary"
+        assert cache.stats["memory_hits"] == 1
+
+        restarted = LLMResponseCache(db_path=temp_db_path)
+        assert restarted.get("key", request_bytes=500)["text"] == "Cached summary"
+        assert restarted.get("key")["text"] == "Cached summary"
+        assert restarted.stats["disk_hits"] == 1
+        assert restarted.stats["memory_hits"] == 1
+        assert restarted.stats["bytes_saved"] == 500
+        assert restarted.stats["tokens_saved"] == 240
+
+    def test_miss_and_hit_rate(self, cache):
+        """Test that misses are counted in the hit rate"""
+        assert cache.get("missing") is None
+        cache.set("key", "Cached summary", USAGE)
+        cache.get("key")
+
+        stats = cache.get_stats()
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_memory_tier_evicts_least_recently_used(self, cache):
+        """Test that the memory tier stays within its byte limit"""
+        cache.MAX_MEMORY_BYTES = 3 * (len("key0") + 100)
+        for key_num in range(4):
+            cache.set(f"key{key_num}", "x" * 100, USAGE)
+
+        stats = cache.get_stats()
+        assert stats["memory_entries"] == 3
+        assert stats["memory_bytes"] <= cache.MAX_MEMORY_BYTES
+        assert stats["evictions"] == 1
+        # The evicted entry is still on disk
+        assert cache.get("key0")["text"] == "x" * 100
+        assert cache.stats["disk_hits"] == 1
+
+    def test_expired_entries_are_not_returned(self, cache, temp_db_path):
+        """Test that the disk tier honors the TTL"""
+        cache.TTL_SECONDS = -1
+        cache.set("key", "Old summary", USAGE)
+
+        restarted = LLMResponseCache(db_path=temp_db_path)
+        assert restarted.get("key") is None
+
+    def test_memory_tier_honors_ttl(self, cache):
+        """Test that an expired entry is not served from memory"""
+        cache.TTL_SECONDS = -1
+        cache.set("key", "Old summary", USAGE)
+
+        assert cache.get("key") is None
+        assert cache.stats["memory_hits"] == 0
+        assert cache.get_stats()["memory_entries"] == 0
+
+    def test_disabled_cache(self, temp_db_path, monkeypatch):
+        """Test that a disabled cache stores and returns nothing"""
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        cache = LLMResponseCache(db_path=temp_db_path)
+        cache.set("key", "Summary", USAGE)
+
+        assert cache.get("key") is None
+        assert cache.get_stats()["stores"] == 0
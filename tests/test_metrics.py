@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.metrics import add_stage_time, collect_stage_timings, record_stage_timings, stage_timer, track_upload
+from app.services.extraction_pool import ExtractionPool
+from app.services.pdf_service import PDFService
+
+
+def stage_count(stage: str) -> float:
+    return REGISTRY.get_sample_value("pdf_summary_stage_duration_seconds_count", {"stage": stage}) or 0.0
+
+
+def upload_count(result: str) -> float:
+    return REGISTRY.get_sample_value("pdf_summary_upload_duration_seconds_count", {"result": result}) or 0.0
+
+
+class TestMetrics:
+    def test_stage_timer_observes_stage(self):
+        """Test that a timed block is recorded as one occurrence of the stage"""
+        before = stage_count("test_stage")
+
+        with stage_timer("test_stage"):
+            pass
+
+        assert stage_count("test_stage") == before + 1
+
+    def test_collect_stage_timings_returns_instead_of_recording(self):
+        """Test that stage times taken while collecting are summed and returned to the caller"""
+
+        def work():
+            add_stage_time("test_collected", 0.25)
+            add_stage_time("test_collected", 0.5)
+            return "result"
+
+        before = stage_count("test_collected")
+
+        result, timings = collect_stage_timings(work)
+
+        assert result == "result"
+        assert timings == {"test_collected": 0.75}
+        assert stage_count("test_collected") == before
+
+        record_stage_timings(timings)
+        assert stage_count("test_collected") == before + 1
+
+    def test_track_upload_counts_failures(self):
+        """Test that an upload which raises is recorded as failed"""
+        before = upload_count("failed")
+
+        with pytest.raises(ValueError):
+            with track_upload():
+                raise ValueError("boom")
+
+        assert upload_count("failed") == before + 1
+        assert REGISTRY.get_sample_value("pdf_summary_uploads_in_flight") == 0
+
+    def test_worker_stage_timings_are_recorded(self, load_pdf_bytes):
+        """Test that stage times taken in an extraction worker process are recorded in this process"""
+        before = stage_count("validate")
+        pool = ExtractionPool(max_workers=1)
+        try:
+            pool.start()
+            is_valid, _ = asyncio.run(pool.run(PDFService().validate_pdf, load_pdf_bytes("dummy.pdf"), "dummy.pdf"))
+        finally:
+            pool.shutdown()
+
+        assert is_valid is True
+        assert stage_count("validate") == before + 1
@@ -1,10 +1,88 @@
-from unittest.mock import patch
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
 
 import pytest
 
 from app.services.openai_service import OpenAIService
 
 
+@pytest.fixture
+def fake_openai_server():
+    """Local OpenAI-compatible chat completions server that can fail the first requests"""
+    state = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "fail_first": 0, "delay": 0.0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                state["requests"] += 1
+                request_num = state["requests"]
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            time.sleep(state["delay"])
+            with lock:
+                state["in_flight"] -= 1
+
+            if request_num <= state["fail_first"]:
+                body = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                self._send(429, body, {"Retry-After": "0"})
+                return
+
+            if request.get("stream"):
+                self._send_stream(request_num)
+                return
+
+            body = {
+                "id": f"chatcmpl-{request_num}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o-2024-11-20",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "Fake summary"}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60},
+            }
+            self._send(200, body)
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_stream(self, request_num):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            chunk = {"id": f"chatcmpl-{request_num}", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o"}
+            for text in ("Fake", " streamed", " summary"):
+                choice = {"index": 0, "delta": {"content": text}, "finish_reason": None}
+                self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [choice]})}\n\n".encode())
+                self.wfile.flush()
+            usage = {"prompt_tokens": 50, "completion_tokens": 3, "total_tokens": 53}
+            self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1", state
+    server.shutdown()
+    server.server_close()
+
+
 class TestOpenAIService:
     def test_init_with_api_key(self):
         """Test OpenAIService initialization with API key"""
@@ -29,7 +107,7 @@ class TestOpenAIService:
         service = OpenAIService(api_key="test-key")
         service.client = mock_openai_client
 
-        result = service.generate_summary("Test document text", [])
+        result = asyncio.run(service.generate_summary("Test document text", []))
 
         assert result == "Test summary"
         mock_openai_client.chat.completions.create.assert_called_once()
@@ -40,7 +118,7 @@ class TestOpenAIService:
         service.client = mock_openai_client
 
         images = [{"image_num": 1, "page": 1, "base64": "test_base64_data"}]
-        result = service.generate_summary("Test document text", images)
+        result = asyncio.run(service.generate_summary("Test document text", images))
 
         assert result == "Test summary"
 
@@ -63,16 +141,228 @@ class TestOpenAIService:
             mock_create.side_effect = Exception("Unexpected error")
 
             with pytest.raises(Exception, match="Summary generation error"):
-                service.generate_summary("Test text", [])
+                asyncio.run(service.generate_summary("Test text", []))
 
     def test_generate_summary_parameters(self, mock_openai_client):
         """Test that generate_summary uses correct parameters"""
         service = OpenAIService(api_key="test-key")
         service.client = mock_openai_client
 
-        service.generate_summary("Test text", [])
+        asyncio.run(service.generate_summary("Test text", []))
 
         call_args = mock_openai_client.chat.completions.create.call_args
         assert call_args[1]["model"] == "gpt-4o"
         assert call_args[1]["max_tokens"] == 500
         assert call_args[1]["temperature"] == 0.3
+
+    def test_generate_summary_image_format_and_budget(self, mock_openai_client):
+        """Test that images carry their MIME type and detail and respect the total budget"""
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+        service.MAX_IMAGE_BYTES = 1000
+
+        images = [
+            {"page": 1, "base64": "jpeg_data", "mime_type": "image/jpeg", "detail": "low", "bytes": 800},
+            {"page": 2, "base64": "png_data", "mime_type": "image/png", "detail": "low", "bytes": 800},
+        ]
+        asyncio.run(service.generate_summary("Test document text", images))
+
+        content = mock_openai_client.chat.completions.create.call_args[1]["messages"][1]["content"]
+        image_parts = [part for part in content if part["type"] == "image_url"]
+        assert len(image_parts) == 1
+        assert image_parts[0]["image_url"]["url"] == "data:image/jpeg;base64,jpeg_data"
+        assert image_parts[0]["image_url"]["detail"] == "low"
+        assert service.stats["images_sent"] == 1
+        assert service.stats["images_dropped"] == 1
+        assert service.stats["last_payload_bytes"] > 0
+
+    def test_split_into_chunks_keeps_page_sections_together(self):
+        """Test that chunks are built from whole page sections and oversized pages are cut"""
+        service = OpenAIService(api_key="test-key")
+        text = "\n".join(f"=== Page {page_num} ===\n{'word ' * 150}\n" for page_num in range(1, 7))
+        text += "=== Page 7 ===\n" + "line of text\n" * 200
+
+        chunks = service.split_into_chunks(text, max_tokens=500)
+
+        assert "".join(chunks) == text
+        assert all(len(chunk) <= 2000 for chunk in chunks)
+        assert chunks[0].startswith("=== Page 1 ===") and "=== Page 2 ===" in chunks[0]
+        assert sum(chunk.count("=== Page 3 ===") for chunk in chunks) == 1
+
+    def test_generate_summary_map_reduce(self, mock_openai_client):
+        """Test that long documents are summarized per chunk and then combined"""
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+        service.MAX_INPUT_TOKENS = 1000
+        service.CHUNK_TOKENS = 400
+
+        text = "\n".join(f"=== Page {page_num} ===\n{'word ' * 250}\n" for page_num in range(1, 9))
+        images = [{"page": 5, "pages": [5, 6], "base64": "img", "bytes": 3, "tokens": 85}]
+        result = asyncio.run(service.generate_summary(text, images))
+
+        assert result == "Test summary"
+        calls = mock_openai_client.chat.completions.create.call_args_list
+        assert len(calls) == 9  # 8 chunk summaries and the reduce call
+        reduce_text = calls[-1][1]["messages"][1]["content"][0]["text"]
+        assert "=== Part 8 of 8 ===" in reduce_text
+        image_chunks = [
+            call for call in calls[:-1] if any(part["type"] == "image_url" for part in call[1]["messages"][1]["content"])
+        ]
+        assert len(image_chunks) == 1
+        assert "=== Page 5 ===" in image_chunks[0][1]["messages"][1]["content"][0]["text"]
+        assert service.stats["last_run_tokens"] == 9 * 120
+
+    def test_resummarizing_stops_without_progress(self, mock_openai_client):
+        """Test that partial summaries are combined as they are once summarizing them again doesn't shrink them"""
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+        service.MAX_INPUT_TOKENS = 1000
+        service.CHUNK_TOKENS = 400
+        mock_openai_client.chat.completions.create.return_value.choices[0].message.content = "word " * 1000
+
+        text = "\n".join(f"=== Page {page_num} ===\n{'word ' * 250}\n" for page_num in range(1, 9))
+        asyncio.run(service.generate_summary(text, []))
+
+        # 8 partial summaries, each longer than a chunk, and the final combine
+        assert mock_openai_client.chat.completions.create.call_count == 9
+
+    def test_resummarizing_rounds_are_capped(self, mock_openai_client):
+        """Test that partial summaries are summarized again at most MAX_SUMMARY_ROUNDS times"""
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+        service.MAX_INPUT_TOKENS = 10
+        service.CHUNK_TOKENS = 400
+        service.MAX_SUMMARY_ROUNDS = 2
+
+        text = "\n".join(f"=== Page {page_num} ===\n{'word ' * 250}\n" for page_num in range(1, 9))
+        asyncio.run(service.generate_summary(text, []))
+
+        # 8 chunk summaries, one more round over the combined parts and the final combine
+        assert mock_openai_client.chat.completions.create.call_count == 10
+
+    def test_rejects_small_chunk_size(self, monkeypatch):
+        """Test that chunks too small to hold two partial summaries are refused at startup"""
+        monkeypatch.setenv("OPENAI_CHUNK_TOKENS", "1500")
+
+        with pytest.raises(ValueError, match="OPENAI_CHUNK_TOKENS"):
+            OpenAIService(api_key="test-key")
+
+    def test_retries_rate_limit_against_fake_server(self, fake_openai_server, monkeypatch):
+        """Test that a 429 with Retry-After is retried and the request then succeeds"""
+        base_url, state = fake_openai_server
+        state["fail_first"] = 2
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        service = OpenAIService(api_key="test-key")
+
+        async def summarize():
+            try:
+                return await service.generate_summary("Test document text", [])
+            finally:
+                await service.close()
+
+        assert asyncio.run(summarize()) == "Fake summary"
+        assert state["requests"] == 3
+        assert service.stats["retries"] == 2
+        assert service.stats["last_run_tokens"] == 60
+
+    def test_gives_up_after_max_retries(self, fake_openai_server, monkeypatch):
+        """Test that rate limits are surfaced once the retries are used up"""
+        base_url, state = fake_openai_server
+        state["fail_first"] = 10
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        monkeypatch.setenv("OPENAI_MAX_RETRIES", "1")
+        service = OpenAIService(api_key="test-key")
+
+        async def summarize():
+            try:
+                return await service.generate_summary("Test document text", [])
+            finally:
+                await service.close()
+
+        with pytest.raises(Exception, match="Rate limit exceeded"):
+            asyncio.run(summarize())
+        assert state["requests"] == 2
+
+    def test_in_flight_requests_are_limited(self, fake_openai_server, monkeypatch):
+        """Test that concurrent chunk requests never exceed the in-flight limit"""
+        base_url, state = fake_openai_server
+        state["delay"] = 0.05
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        monkeypatch.setenv("OPENAI_MAX_CONCURRENT_REQUESTS", "2")
+        service = OpenAIService(api_key="test-key")
+        service.MAX_INPUT_TOKENS = 1000
+        service.CHUNK_TOKENS = 400
+
+        text = "\n".join(f"=== Page {page_num} ===\n{'word ' * 250}\n" for page_num in range(1, 7))
+
+        async def summarize():
+            try:
+                return await service.generate_summary(text, [])
+            finally:
+                await service.close()
+
+        assert asyncio.run(summarize()) == "Fake summary"
+        assert state["requests"] == 7
+        assert state["max_in_flight"] == 2
+
+    def test_retry_delay_honors_retry_after(self):
+        """Test Retry-After parsing and the jittered backoff bounds"""
+        service = OpenAIService(api_key="test-key")
+        error = Mock(response=Mock(headers={"retry-after": "2"}))
+
+        assert service._retry_delay(error, attempt=0) == 2.0
+        error.response.headers = {"retry-after-ms": "250"}
+        assert service._retry_delay(error, attempt=0) == 0.25
+        error.response.headers = {"retry-after": "3600"}
+        assert service._retry_delay(error, attempt=0) == service.RETRY_MAX_DELAY
+        assert 0 <= service._retry_delay(Exception(), attempt=3) <= service.RETRY_BASE_DELAY * 8
+
+    def test_stream_summary_against_fake_server(self, fake_openai_server, monkeypatch):
+        """Test that summary text is yielded chunk by chunk and token usage is recorded"""
+        base_url, state = fake_openai_server
+        state["fail_first"] = 1
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        service = OpenAIService(api_key="test-key")
+
+        async def collect():
+            try:
+                return [delta async for delta in service.stream_summary("Test document text", [])]
+            finally:
+                await service.close()
+
+        assert asyncio.run(collect()) == ["Fake", " streamed", " summary"]
+        assert service.stats["retries"] == 1
+        assert service.stats["last_run_tokens"] == 53
+
+    def test_identical_requests_use_response_cache(self, mock_openai_client, temp_db_path, monkeypatch):
+        """Test that the same normalized text and images are answered from the response cache"""
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+        monkeypatch.setenv("LLM_CACHE_PATH", temp_db_path)
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+
+        first = asyncio.run(service.generate_summary("Test document\ntext", []))
+        second = asyncio.run(service.generate_summary("Test   document text ", []))
+
+        assert first == second == "Test summary"
+        mock_openai_client.chat.completions.create.assert_called_once()
+        assert service.stats["requests"] == 1
+        cache_stats = service.response_cache.get_stats()
+        assert cache_stats["memory_hits"] == 1
+        assert cache_stats["bytes_saved"] > 0
+        assert cache_stats["tokens_saved"] == 120
+
+    def test_force_refresh_bypasses_response_cache(self, mock_openai_client, temp_db_path, monkeypatch):
+        """Test that force_refresh asks the model again and replaces the cached response"""
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+        monkeypatch.setenv("LLM_CACHE_PATH", temp_db_path)
+        service = OpenAIService(api_key="test-key")
+        service.client = mock_openai_client
+
+        assert asyncio.run(service.generate_summary("Test document text", [])) == "Test summary"
+        mock_openai_client.chat.completions.create.return_value.choices[0].message.content = "Revised summary"
+
+        assert asyncio.run(service.generate_summary("Test document text", [])) == "Test summary"
+        assert asyncio.run(service.generate_summary("Test document text", [], force_refresh=True)) == "Revised summary"
+        assert asyncio.run(service.generate_summary("Test document text", [])) == "Revised summary"
+        assert mock_openai_client.chat.completions.create.call_count == 2
@@ -0,0 +1,51 @@
+from unittest.mock import Mock
+
+from PIL import Image
+
+from app.services.page_renderer import PageRenderer
+from app.services.pdf_service import PDFService
+
+
+def make_page(bbox=(0, 0, 100, 200)):
+    page = Mock()
+    page.bbox = bbox
+    page.to_image.return_value.original = Image.new("RGB", (300, 600), "white")
+    return page
+
+
+class TestPageRenderer:
+    def test_render_once_per_resolution(self):
+        """Test that repeated crops reuse the page bitmap"""
+        page = make_page()
+        renderer = PageRenderer(page)
+
+        for bbox in ((0, 0, 10, 10), (20, 20, 50, 60), (0, 100, 100, 200)):
+            renderer.crop(renderer.pixel_box(bbox, 216), 216)
+        renderer.render(72)
+
+        assert page.to_image.call_count == 2
+        renderer.close()
+
+    def test_pixel_box_scales_to_resolution(self):
+        """Test conversion from PDF points to bitmap pixels"""
+        renderer = PageRenderer(make_page())
+
+        assert renderer.pixel_box((10, 20, 30, 40), 216) == (30, 60, 90, 120)
+
+    def test_pixel_box_clips_to_page(self):
+        """Test that regions are clipped to the page and outside regions are dropped"""
+        renderer = PageRenderer(make_page(bbox=(10, 10, 110, 210)))
+
+        assert renderer.pixel_box((0, 0, 20, 20), 72) == (0, 0, 10, 10)
+        assert renderer.pixel_box((200, 300, 250, 350), 72) is None
+
+
+def test_extract_images_skips_small_images(load_pdf_bytes):
+    """Integration test that images below the pixel threshold are skipped"""
+    pdf_bytes = load_pdf_bytes("sample.pdf")
+    service = PDFService()
+
+    assert len(service.extract_pdf_content(pdf_bytes)["images"]) == 1
+
+    service.MIN_IMAGE_PIXELS = 10**9
+    assert service.extract_pdf_content(pdf_bytes)["images"] == []
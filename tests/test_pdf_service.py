@@ -1,9 +1,15 @@
+import pytest
 from unittest.mock import patch, Mock
 
 from app.services.pdf_service import PDFService
 
 
 class TestPDFService:
+    @pytest.fixture(autouse=True)
+    def pdfplumber_engine(self, monkeypatch):
+        """The mocked documents below stand in for pdfplumber"""
+        monkeypatch.setenv("PDF_TEXT_ENGINE", "pdfplumber")
+
     def test_init_with_hardcoded_limits(self):
         """Test PDFService initialization with hardcoded limits"""
         service = PDFService()
@@ -93,7 +99,8 @@ class TestPDFService:
         with patch("pdfplumber.open") as mock_open:
             mock_page = Mock()
             mock_page.extract_text.return_value = "Sample text"
-            mock_page.extract_tables.return_value = []
+            mock_page.chars = []
+            mock_page.edges = []
             mock_page.images = []
 
             mock_pdf = Mock()
@@ -108,24 +115,132 @@ class TestPDFService:
             assert result["page_count"] == 1
             assert result["metadata"]["title"] == "Test PDF"
 
+    def test_process_pdf_opens_document_once(self, sample_pdf_bytes):
+        """Test that validation and extraction share a single parse"""
+        service = PDFService()
+
+        with patch("pdfplumber.open") as mock_open:
+            mock_page = Mock()
+            mock_page.extract_text.return_value = "Sample text"
+            mock_page.chars = []
+            mock_page.edges = []
+            mock_page.images = []
+
+            mock_pdf = Mock()
+            mock_pdf.pages = [mock_page]
+            mock_pdf.metadata = {}
+            mock_open.return_value.__enter__.return_value = mock_pdf
+
+            is_valid, message, result = service.process_pdf(sample_pdf_bytes, "test.pdf")
+
+            assert is_valid is True
+            assert message == "OK"
+            assert "Sample text" in result["text"]
+            mock_open.assert_called_once()
+            mock_open.return_value.__exit__.assert_called_once()
+
+    def test_process_pdf_invalid_file(self, invalid_pdf_bytes):
+        """Test that an invalid file is rejected without extraction"""
+        service = PDFService()
+
+        with patch("pdfplumber.open") as mock_open:
+            is_valid, message, result = service.process_pdf(invalid_pdf_bytes, "test.pdf")
+
+            assert is_valid is False
+            assert "Invalid PDF file format" in message
+            assert result is None
+            mock_open.assert_not_called()
+
+    def test_process_pdf_too_many_pages(self, sample_pdf_bytes):
+        """Test that validation errors are unchanged in the single-parse path"""
+        service = PDFService()
+        service.MAX_PAGES = 1
+
+        with patch("pdfplumber.open") as mock_open:
+            mock_pdf = Mock()
+            mock_pdf.pages = [Mock(), Mock()]
+            mock_open.return_value.__enter__.return_value = mock_pdf
+
+            is_valid, message, result = service.process_pdf(sample_pdf_bytes, "test.pdf")
+
+            assert is_valid is False
+            assert "Too many pages" in message
+            assert result is None
+
     def test_table_to_text_empty(self):
         """Test table to text conversion with empty table"""
-        result = PDFService._table_to_text(None)
-        assert result == ""
-
-        result = PDFService._table_to_text([])
-        assert result == ""
+        assert PDFService._clean_table(None) == []
+        assert PDFService._clean_table([[None, ""], []]) == []
+        assert PDFService()._table_to_text([]) == ""
 
     def test_table_to_text_with_data(self):
-        """Test table to text conversion with data"""
-        table = [["Header1", "Header2"], ["Value1", "Value2"], [None, "Value3"]]
+        """Test that tables are sent as CSV without empty rows and columns"""
+        table = [["Header1", None, "Header 2"], [None, None, None], ["Value1", "", "Value\n2"], [None, None, "Value3"]]
 
-        result = PDFService._table_to_text(table)
-        lines = result.split("\n")
+        result = PDFService()._table_to_text(PDFService._clean_table(table))
+
+        assert result.split("\n") == ["Header1,Header 2", "Value1,Value 2", ",Value3"]
+
+    def test_table_to_text_limits(self):
+        """Test that long tables are cut at the row and character limits"""
+        service = PDFService()
+        rows = [[f"row {n}", "x" * 20] for n in range(100)]
+
+        service.TABLE_MAX_ROWS = 10
+        lines = service._table_to_text(rows).split("\n")
+        assert lines[:10] == [f"row {n},{'x' * 20}" for n in range(10)]
+        assert lines[10:] == ["... 90 more rows"]
+
+        service.TABLE_MAX_CHARS = 100
+        assert service._table_to_text(rows).endswith("\n... 96 more rows")
+
+    def test_merge_pages_dedups_table_headers(self):
+        """Test that a header repeated by a table continuing on the next page is sent once"""
+        service = PDFService()
+        header = ["Account", "2024", "2025"]
+        pages = [
+            {"page": 1, "text": "Balance sheet", "tables": [[header, ["Cash", "10", "12"]]], "images": []},
+            {"page": 2, "text": "", "tables": [[header, ["Debt", "5", "4"], header, ["Equity", "7", "9"]]], "images": []},
+        ]
+
+        result = service.merge_pages(2, {}, pages)
+
+        assert result["text"].count("Account,2024,2025") == 1
+        assert "=== Table 1 on page 2 (continued) ===\nDebt,5,4\nEquity,7,9" in result["text"]
+        assert result["tables"][1]["data"] == pages[1]["tables"][0]
+
+    def test_merge_pages_keeps_headers_of_separate_tables(self):
+        """Test that tables sharing a header are not continued unless one opens the page after the other"""
+        service = PDFService()
+        header = ["Account", "2024", "2025"]
+        pages = [
+            {"page": 1, "text": "Q1", "tables": [[header, ["Cash", "10", "12"]]], "images": []},
+            {"page": 2, "text": "Notes", "tables": [], "images": []},
+            {"page": 3, "text": "Q2", "tables": [[header, ["Debt", "5", "4"]], [header, ["Equity", "7", "9"]]], "images": []},
+        ]
+
+        result = service.merge_pages(3, {}, pages)
+
+        assert result["text"].count("Account,2024,2025") == 3
+        assert "(continued)" not in result["text"]
+
+    def test_has_aligned_columns(self):
+        """Test that rows whose cells line up pass the unruled table pre-check and prose does not"""
+        service = PDFService()
 
-        assert "Header1 | Header2" in lines[0]
-        assert "Value1 | Value2" in lines[1]
-        assert " | Value3" in lines[2]
+        def chars(rows):
+            return [
+                {"top": top, "x0": x, "x1": x + 5, "size": 10}
+                for top, starts in rows
+                for x in starts
+            ]
+
+        table = [(top, [50, 55, 60, 150, 155, 250, 255]) for top in (100, 115, 130)]
+        prose = [(top, range(50, 400, 6)) for top in (100, 115, 130)]
+
+        assert service._has_aligned_columns(chars(table)) is True
+        assert service._has_aligned_columns(chars(table[:2])) is False
+        assert service._has_aligned_columns(chars(prose)) is False
 
 
 # Integration tests with real PDF files
@@ -170,6 +285,64 @@ def test_extract_content_real_file(load_pdf_bytes):
     assert "base64" in result["images"][0]
 
 
+def test_process_pdf_matches_separate_calls(load_pdf_bytes):
+    """Integration test that the single-parse path returns the same content"""
+    filename = "sample.pdf"
+    pdf_bytes = load_pdf_bytes(filename)
+    service = PDFService()
+
+    is_valid, message, result = service.process_pdf(pdf_bytes, filename)
+
+    assert (is_valid, message) == service.validate_pdf(pdf_bytes, filename)
+    assert result == service.extract_pdf_content(pdf_bytes)
+
+
+def test_process_pdf_defers_large_documents(multi_page_pdf_bytes):
+    """Integration test that large documents are validated without extracting pages"""
+    pdf_bytes = multi_page_pdf_bytes("sample.pdf", 4)
+    service = PDFService()
+
+    is_valid, message, result = service.process_pdf(pdf_bytes, "sample.pdf", defer_min_pages=4)
+
+    assert is_valid is True
+    assert result["page_count"] == 4
+    assert "text" not in result
+
+
+def test_page_shards_match_sequential_extraction(multi_page_pdf_bytes):
+    """Integration test that merged page shards equal the sequential extraction"""
+    pdf_bytes = multi_page_pdf_bytes("sample.pdf", 5)
+    service = PDFService()
+    service.MAX_IMAGES = 3
+    # The copied pages would otherwise be stripped as repeated boilerplate
+    service.text_normalizer.enabled = False
+
+    sequential = service.extract_pdf_content(pdf_bytes)
+    shards = [service.extract_page_range(pdf_bytes, first, last) for first, last in ((4, 5), (1, 3))]
+    merged = service.merge_pages(5, sequential["metadata"], [page for shard in shards for page in shard])
+
+    # Each shard encodes its own first copy of a repeated image, so only the page data differs
+    assert {**merged, "pages": None} == {**sequential, "pages": None}
+    assert service.merge_pages(5, sequential["metadata"], merged["pages"]) == merged
+    assert [image["pages"] for image in merged["images"]] == [[1, 2, 3, 4, 5]]
+    assert merged["text"].index("=== Page 1 ===") < merged["text"].index("=== Page 5 ===")
+
+
+def test_repeated_images_are_sent_once(multi_page_pdf_bytes):
+    """Integration test that an image repeated on every page is encoded once and references its pages"""
+    pdf_bytes = multi_page_pdf_bytes("sample.pdf", 3)
+    service = PDFService()
+
+    pages = service.extract_page_range(pdf_bytes, 1, 3)
+    result = service.merge_pages(3, {}, pages)
+
+    assert [len(page["images"]) for page in pages] == [1, 1, 1]
+    assert "base64" in pages[0]["images"][0]
+    assert all("base64" not in page["images"][0] for page in pages[1:])
+    assert len(result["images"]) == 1
+    assert result["images"][0]["pages"] == [1, 2, 3]
+
+
 def test_extract_content_large_file(load_pdf_bytes):
     """Integration test with real large PDF"""
     filename = "large_sample.pdf"
@@ -185,3 +358,80 @@ def test_extract_content_large_file(load_pdf_bytes):
     assert len(result["text"]) > 0
     assert len(result["tables"]) > 0
     assert len(result["images"]) > 0
+
+
+@pytest.mark.parametrize("strategy, expected", [("lines", 1), ("text", 1), ("off", 0)])
+def test_table_strategy(load_pdf_bytes, monkeypatch, strategy, expected):
+    """Test that PDF_TABLE_STRATEGY selects how tables are found, or turns table extraction off"""
+    monkeypatch.setenv("PDF_TABLE_STRATEGY", strategy)
+
+    result = PDFService().extract_pdf_content(load_pdf_bytes("sample.pdf"))
+
+    assert len(result["tables"]) == expected
+    assert len(result["text"]) > 0
+
+
+@pytest.mark.parametrize("variable", ["PDF_TABLE_STRATEGY", "PDF_TEXT_ENGINE"])
+def test_unknown_setting_is_rejected(monkeypatch, variable):
+    """Test that an unknown table strategy or text engine fails at startup instead of being ignored"""
+    monkeypatch.setenv(variable, "fastest")
+
+    with pytest.raises(ValueError, match=variable):
+        PDFService()
+
+
+def test_table_precheck_skips_pages_without_tables(load_pdf_bytes):
+    """Test that find_tables is not run on a page without ruling lines"""
+    service = PDFService()
+
+    with patch("pdfplumber.page.Page.find_tables") as find_tables:
+        result = service.extract_pdf_content(load_pdf_bytes("dummy.pdf"))
+
+    find_tables.assert_not_called()
+    assert result["tables"] == []
+
+
+@pytest.mark.parametrize("engine", ["auto", "pdfium"])
+@pytest.mark.parametrize("filename", ["sample.pdf", "dummy.pdf"])
+def test_text_engine_parity(load_pdf_bytes, monkeypatch, engine, filename):
+    """Test that pdfium reads the same text as pdfplumber, apart from whitespace"""
+    pdf_bytes = load_pdf_bytes(filename)
+    if engine == "pdfium":
+        # The text-only engine leaves table cells in the page text
+        monkeypatch.setenv("PDF_TABLE_STRATEGY", "off")
+    monkeypatch.setenv("PDF_TEXT_ENGINE", "pdfplumber")
+    expected = PDFService().extract_pdf_content(pdf_bytes)
+    monkeypatch.setenv("PDF_TEXT_ENGINE", engine)
+
+    result = PDFService().extract_pdf_content(pdf_bytes)
+
+    assert result["text"].split() == expected["text"].split()
+    assert result["page_count"] == expected["page_count"]
+    assert result["metadata"] == expected["metadata"]
+    if engine == "auto":
+        assert result["tables"] == expected["tables"]
+        assert len(result["images"]) == len(expected["images"])
+
+
+def test_auto_engine_reads_text_pages_with_pdfium(load_pdf_bytes, monkeypatch):
+    """Test that pdfplumber is not opened for a page with only text"""
+    monkeypatch.setenv("PDF_TEXT_ENGINE", "auto")
+    service = PDFService()
+
+    with patch("app.services.pdf_service.pdfplumber.open", side_effect=AssertionError("pdfplumber opened")):
+        is_valid, message, result = service.process_pdf(load_pdf_bytes("dummy.pdf"), "dummy.pdf")
+
+    assert is_valid is True
+    assert "Dummy PDF file" in result["text"]
+    assert result["metadata"]["creator"] == "Writer"
+
+
+def test_pdfium_engine_skips_tables_and_images(load_pdf_bytes, monkeypatch):
+    """Test that the text-only engine returns the text of pages with tables and images"""
+    monkeypatch.setenv("PDF_TEXT_ENGINE", "pdfium")
+
+    result = PDFService().extract_pdf_content(load_pdf_bytes("sample.pdf"))
+
+    assert "Alice 30 Engineer" in result["text"]
+    assert result["tables"] == []
+    assert result["images"] == []
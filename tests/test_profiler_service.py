@@ -0,0 +1,104 @@
+import asyncio
+import os
+import pstats
+
+from app.services.extraction_pool import ExtractionPool
+from app.services.pdf_service import PDFService
+from app.services.profiler_service import ProfilerService, current_session
+
+
+def profiler(tmp_path) -> ProfilerService:
+    service = ProfilerService()
+    service.enabled = True
+    service.PROFILE_DIR = str(tmp_path)
+    return service
+
+
+class TestProfilerService:
+    def test_disabled_by_default(self):
+        """Test that profiling has to be enabled explicitly"""
+        assert ProfilerService().enabled is False
+
+    def test_profile_and_save(self, tmp_path):
+        """Test that a profiled block is saved as a pstats file tagged with the document id"""
+        service = profiler(tmp_path)
+
+        def busy():
+            return sum(range(1000))
+
+        async def run():
+            async with service.profile() as session:
+                assert current_session() is session
+                busy()
+            assert current_session() is None
+            return await service.save(session, "doc-1")
+
+        name = asyncio.run(run())
+
+        assert name.endswith("_doc-1.prof")
+        profiles = service.list_profiles()
+        assert [profile["name"] for profile in profiles] == [name]
+        assert profiles[0]["document_id"] == "doc-1"
+        stats = pstats.Stats(service.get_profile_path(name))
+        assert any(function == "busy" for _, _, function in stats.stats)
+
+    def test_one_request_profiled_at_a_time(self, tmp_path):
+        """Test that a second request runs without the profiler while another one is profiled"""
+        service = profiler(tmp_path)
+
+        async def run():
+            async with service.profile() as first:
+                async with service.profile() as second:
+                    return first, second
+
+        first, second = asyncio.run(run())
+
+        assert first is not None
+        assert second is None
+
+    def test_worker_profiles_are_merged(self, tmp_path, load_pdf_bytes):
+        """Test that extraction in worker processes appears in the saved profile"""
+        service = profiler(tmp_path)
+        pool = ExtractionPool(max_workers=1)
+
+        async def run():
+            async with service.profile() as session:
+                is_valid, _ = await pool.run(PDFService().validate_pdf, load_pdf_bytes("dummy.pdf"), "dummy.pdf")
+            assert is_valid is True
+            return await service.save(session, None)
+
+        try:
+            pool.start()
+            name = asyncio.run(run())
+        finally:
+            pool.shutdown()
+
+        assert name.endswith("_failed.prof")
+        stats = pstats.Stats(service.get_profile_path(name))
+        assert any(function == "_validate_pdf" for _, _, function in stats.stats)
+
+    def test_old_profiles_are_deleted(self, tmp_path):
+        """Test that only the newest PROFILE_MAX_FILES profiles are kept"""
+        service = profiler(tmp_path)
+        service.MAX_PROFILES = 2
+
+        async def run():
+            names = []
+            for index in range(3):
+                async with service.profile() as session:
+                    pass
+                names.append(await service.save(session, f"doc-{index}"))
+            return names
+
+        names = asyncio.run(run())
+
+        assert [profile["name"] for profile in service.list_profiles()] == names[:0:-1]
+
+    def test_get_profile_path_rejects_other_files(self, tmp_path):
+        """Test that only saved profiles can be read"""
+        service = profiler(tmp_path)
+        (tmp_path / "notes.txt").write_text("secret")
+
+        assert service.get_profile_path("notes.txt") is None
+        assert service.get_profile_path("../" + os.path.basename(tmp_path) + "/notes.txt") is None
+        assert service.get_profile_path("20260101T000000000000Z_missing.prof") is None
@@ -0,0 +1,63 @@
+import gc
+import sqlite3
+import threading
+
+import pytest
+
+from app.services.sqlite_connections import SQLiteConnections
+
+
+class TestSQLiteConnections:
+    def test_connection_is_reused_per_thread(self, temp_db_path):
+        """Test that each thread keeps its own connection"""
+        connections = SQLiteConnections(temp_db_path)
+        other_thread = []
+
+        thread = threading.Thread(target=lambda: other_thread.append(connections.connect()))
+        thread.start()
+        thread.join()
+
+        assert connections.connect() is connections.connect()
+        assert other_thread[0] is not connections.connect()
+        connections.close()
+
+    def test_pragmas(self, temp_db_path):
+        """Test that connections use WAL with relaxed syncing and a busy timeout"""
+        connections = SQLiteConnections(temp_db_path)
+        conn = connections.connect()
+
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == connections.BUSY_TIMEOUT_MS
+        connections.close()
+
+    def test_close_opens_new_connection(self, temp_db_path):
+        """Test that closed connections are replaced on the next call"""
+        connections = SQLiteConnections(temp_db_path)
+        with connections.connect() as conn:
+            conn.execute("CREATE TABLE items (name TEXT)")
+            conn.execute("INSERT INTO items VALUES ('first')")
+
+        connections.close()
+
+        assert connections.connect() is not conn
+        assert connections.connect().execute("SELECT name FROM items").fetchall() == [("first",)]
+        connections.close()
+
+    def test_connection_is_closed_when_thread_exits(self, temp_db_path):
+        """Test that the connections of finished threads are not kept open"""
+        connections = SQLiteConnections(temp_db_path)
+        opened = []
+
+        for _ in range(3):
+            thread = threading.Thread(target=lambda: opened.append(connections.connect()))
+            thread.start()
+            thread.join()
+        gc.collect()
+
+        for conn in opened:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+        connections.connect()
+        assert len(connections._finalizers) == 1
+        connections.close()
@@ -0,0 +1,66 @@
+from app.services.text_normalizer import TextNormalizer
+
+
+def report_pages(count: int) -> list:
+    """Pages with a running header, a page number footer and a repeated disclaimer around distinct body text"""
+    disclaimer = "Confidential. This report may not be distributed without written permission."
+    return [
+        f"ACME Corp   Annual Report 2025\n"
+        f"Section {page} covers   revenue in region {page * 7} and costs of project number {page * 13}.\n"
+        f"{disclaimer}\n"
+        f"Page {page} of {count}"
+        for page in range(1, count + 1)
+    ]
+
+
+class TestTextNormalizer:
+    def test_removes_repeated_lines_after_first_page(self):
+        """Test that headers, footers and disclaimers are kept on the first page only"""
+        normalizer = TextNormalizer()
+
+        texts, stats = normalizer.normalize(report_pages(10))
+
+        assert texts[0].startswith("ACME Corp Annual Report 2025\n")
+        assert "Confidential" in texts[0]
+        for page, text in enumerate(texts[1:], 2):
+            assert text == f"Section {page} covers revenue in region {page * 7} and costs of project number {page * 13}."
+        assert stats["lines_removed"] == 27
+        assert stats["tokens_after"] < stats["tokens_before"]
+
+    def test_short_documents_are_unchanged(self):
+        """Test that lines repeated on fewer than three pages are not treated as boilerplate"""
+        normalizer = TextNormalizer()
+
+        texts, stats = normalizer.normalize(["Title\nShort text", "Title\nMore text"])
+
+        assert texts == ["Title\nShort text", "Title\nMore text"]
+        assert stats["lines_removed"] == 0
+        assert stats["pages_dropped"] == 0
+
+    def test_drops_near_empty_pages(self):
+        """Test that blank separator pages are left out"""
+        normalizer = TextNormalizer()
+        body = "This page has enough words in it to be kept in the prompt."
+
+        texts, stats = normalizer.normalize([body, "   \n 2 ", body + " Again."])
+
+        assert texts == [body, "", body + " Again."]
+        assert stats["pages_dropped"] == 1
+
+    def test_collapses_whitespace(self):
+        """Test that runs of spaces and blank lines are collapsed"""
+        normalizer = TextNormalizer()
+
+        texts, _ = normalizer.normalize(["Quarterly   results\t\tare\n\n\n  up this year, by a lot  "])
+
+        assert texts == ["Quarterly results are\nup this year, by a lot"]
+
+    def test_disabled(self, monkeypatch):
+        """Test that TEXT_NORMALIZATION=false passes the text through"""
+        monkeypatch.setenv("TEXT_NORMALIZATION", "false")
+        pages = report_pages(5)
+
+        texts, stats = TextNormalizer().normalize(pages)
+
+        assert texts == pages
+        assert stats["tokens_after"] == stats["tokens_before"]
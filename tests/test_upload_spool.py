@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from starlette.requests import Request
+
+from app.services.pdf_service import PDFService
+from app.services.upload_spool import UploadRejected, UploadSpooler
+
+BOUNDARY = "test-boundary"
+
+
+def multipart_chunks(filename: str, content: bytes, chunk_size: int = 1024) -> list:
+    body = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return [body[start : start + chunk_size] for start in range(0, len(body), chunk_size)]
+
+
+def make_request(chunks: list, received: list, content_length: int = None) -> Request:
+    """Request whose body arrives in the given chunks, recording how many were read"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+
+    async def receive():
+        index = len(received)
+        received.append(index)
+        return {"type": "http.request", "body": chunks[index], "more_body": index < len(chunks) - 1}
+
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+def spooler(tmp_path, max_size: int = 1024 * 1024) -> UploadSpooler:
+    service = UploadSpooler(max_size)
+    service.SPOOL_DIR = str(tmp_path)
+    return service
+
+
+class TestUploadSpooler:
+    def test_receive_spools_and_hashes(self, tmp_path, load_pdf_bytes):
+        """Test that the file is written to a temporary file and hashed while it is received"""
+        content = load_pdf_bytes("sample.pdf")
+        received = []
+
+        upload = asyncio.run(spooler(tmp_path).receive(make_request(multipart_chunks("sample.pdf", content), received)))
+
+        with upload:
+            assert upload.filename == "sample.pdf"
+            assert len(upload) == len(content)
+            assert upload.content_hash == hashlib.sha256(content).hexdigest()
+            assert upload.read() == content
+        assert os.listdir(tmp_path) == []
+
+    def test_rejects_invalid_signature_early(self, tmp_path):
+        """Test that a body that doesn't start like a PDF is refused after the first chunk"""
+        chunks = multipart_chunks("fake.pdf", b"This is not a PDF file" * 1000)
+        received = []
+
+        with pytest.raises(UploadRejected) as error:
+            asyncio.run(spooler(tmp_path).receive(make_request(chunks, received)))
+
+        assert error.value.message == "Invalid PDF file format"
+        assert len(received) == 1 < len(chunks)
+        assert os.listdir(tmp_path) == []
+
+    def test_rejects_oversized_file_while_receiving(self, tmp_path):
+        """Test that the size limit is enforced before the whole body has arrived"""
+        chunks = multipart_chunks("large.pdf", b"%PDF-" + b"0" * 10000)
+        received = []
+
+        with pytest.raises(UploadRejected) as error:
+            asyncio.run(spooler(tmp_path, max_size=4096).receive(make_request(chunks, received)))
+
+        assert "too large" in error.value.message
+        assert len(received) < len(chunks)
+        assert os.listdir(tmp_path) == []
+
+    def test_rejects_announced_oversized_body(self, tmp_path):
+        """Test that a Content-Length over the limit is refused without reading the body"""
+        received = []
+
+        with pytest.raises(UploadRejected):
+            asyncio.run(
+                spooler(tmp_path).receive(make_request([b""], received, content_length=100 * 1024 * 1024))
+            )
+
+        assert received == []
+
+    def test_rejects_other_file_types(self, tmp_path):
+        """Test that the filename is checked from the part headers"""
+        with pytest.raises(UploadRejected) as error:
+            asyncio.run(spooler(tmp_path).receive(make_request(multipart_chunks("notes.txt", b"%PDF-1.4"), [])))
+
+        assert error.value.message == "Only PDF files are supported"
+
+    def test_spooled_extraction_matches_bytes(self, tmp_path, load_pdf_bytes):
+        """Test that extraction through the memory map gives the same result as from bytes"""
+        content = load_pdf_bytes("sample.pdf")
+        pdf_service = PDFService()
+
+        upload = asyncio.run(spooler(tmp_path).receive(make_request(multipart_chunks("sample.pdf", content), [])))
+        with upload:
+            spooled = pdf_service.process_pdf(upload, upload.filename)
+
+        assert spooled == pdf_service.process_pdf(content, "sample.pdf")
+        assert spooled[0] is True